@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.framer.socket import FramerSocket
+from pymodbus.pdu import DecodePDU
+from pymodbus.pdu.bit_read_message import ReadCoilsRequest
+from pymodbus.pdu.register_read_message import ReadHoldingRegistersRequest
+from pymodbus.pdu.bit_write_message import WriteMultipleCoilsRequest
+from pymodbus.pdu.register_write_message import WriteMultipleRegistersRequest
+
+import proto_codec
+from proto_transport import ModbusPipelineClient
+
+
+import argparse
+import logging
+import asyncio
+import random
+import time
+
+
+# declare contants
+
+NUM_FRAMES = 20000 # number of request frames built and response frames parsed by each codec
+DURATION = 5 # seconds to run each client against a live server
+PIPELINE_WINDOW = 8 # requests in-flight per connection against a live server
+IP_ADDR = None # live server to measure against, None to only measure the codecs
+TCP_PORT = 502
+SLAVE_ID = 0x01
+
+
+LOGGER = logging.getLogger(__name__)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logging.basicConfig(filename='bench_codec.log', level=logging.INFO, format=LOG_FORMAT)
+
+
+def get_frames() -> list:
+    LOGGER.debug('get_frames')
+
+    # the request mix of a poll, as (function code, address, count or values) with a matching response pdu for each
+    registers = [random.randint(0, 0xFFFF) for _ in range(60)]
+    coils = [bool(random.getrandbits(1)) for _ in range(64)]
+    return [
+        (0x01, 1, 64, bytes([0x01, 8]) + bytes(8)),
+        (0x03, 1, 60, bytes([0x03, 120]) + bytes(120)),
+        (0x0F, 1, coils, bytes([0x0F, 0, 1, 0, 64])),
+        (0x10, 1, registers, bytes([0x10, 0, 1, 0, 60])),
+    ]
+
+
+def measure_pymodbus_codec(frames:list, num_frames:int = NUM_FRAMES) -> float:
+    LOGGER.debug('measure_pymodbus_codec')
+
+    # declare local variables
+    framer = FramerSocket(DecodePDU(False))
+    request_classes = {0x01: ReadCoilsRequest, 0x03: ReadHoldingRegistersRequest, 0x0F: WriteMultipleCoilsRequest, 0x10: WriteMultipleRegistersRequest}
+    responses = [b'\x00\x01\x00\x00' + (len(pdu) + 1).to_bytes(2, 'big') + bytes([SLAVE_ID]) + pdu for function_code, address, values, pdu in frames]
+
+    # build a request with a request object and the framer, then decode a response with the framer and pdu decoder
+    start = time.perf_counter()
+    for i in range(num_frames):
+        function_code, address, values, pdu = frames[i % len(frames)]
+        request = request_classes[function_code](address, values, slave=SLAVE_ID)
+        request.transaction_id = i % 0xFFFF + 1
+        framer.buildFrame(request)
+        used_len, slave_id, transaction_id, pdu_data = framer.decode(responses[i % len(frames)])
+        framer.decoder.decode(pdu_data)
+    return num_frames / (time.perf_counter() - start)
+
+
+def measure_raw_codec(frames:list, num_frames:int = NUM_FRAMES) -> float:
+    LOGGER.debug('measure_raw_codec')
+
+    # declare local variables
+    responses = [memoryview(pdu) for function_code, address, values, pdu in frames]
+
+    # pack a request with a precompiled struct, then decode a response from a memoryview
+    start = time.perf_counter()
+    for i in range(num_frames):
+        function_code, address, values, pdu = frames[i % len(frames)]
+        if function_code == 0x0F:
+            proto_codec.encode_write_coils(i % 0xFFFF + 1, SLAVE_ID, address, values)
+        elif function_code == 0x10:
+            proto_codec.encode_write_registers(i % 0xFFFF + 1, SLAVE_ID, address, values)
+        else:
+            proto_codec.encode_request(i % 0xFFFF + 1, SLAVE_ID, function_code, address, values)
+        proto_codec.decode_response(responses[i % len(frames)], SLAVE_ID, i % 0xFFFF + 1)
+    return num_frames / (time.perf_counter() - start)
+
+
+async def measure_live(modbus_client, frames:list, duration:float = DURATION, window:int = PIPELINE_WINDOW) -> float:
+    LOGGER.debug(f'measure_live: {type(modbus_client).__name__}')
+
+    # declare local variables
+    num_frames = 0
+    deadline = time.perf_counter() + duration
+
+    async def run_requests(offset:int):
+        nonlocal num_frames
+        i = offset
+        while time.perf_counter() < deadline:
+            function_code, address, values, pdu = frames[i % len(frames)]
+            if function_code == 0x01:
+                await modbus_client.read_coils(address, count=values, slave=SLAVE_ID)
+            elif function_code == 0x03:
+                await modbus_client.read_holding_registers(address, count=values, slave=SLAVE_ID)
+            elif function_code == 0x0F:
+                await modbus_client.write_coils(address, values, slave=SLAVE_ID)
+            else:
+                await modbus_client.write_registers(address, values, slave=SLAVE_ID)
+            num_frames += 1
+            i += 1
+
+    # keep the window full of requests for the duration
+    await modbus_client.connect()
+    if not modbus_client.connected:
+        msg = f'measure_live: unable to connect to {modbus_client.host}:{modbus_client.port}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return 0
+    start = time.perf_counter()
+    await asyncio.gather(*(run_requests(offset) for offset in range(window)))
+    elapsed = time.perf_counter() - start
+    modbus_client.close()
+    return num_frames / elapsed
+
+
+async def run_main():
+    LOGGER.debug('run_main')
+
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Compare frames per second of the pymodbus and raw codec client paths')
+    parser.add_argument('-n', '--frames', type=int, default=NUM_FRAMES, help=f'number of frames built and parsed by each codec, default = {NUM_FRAMES}')
+    parser.add_argument('-i', '--ipaddr', default=IP_ADDR, help='also measure each client against a live server e.g., one started with proto_server.py, default = codecs only')
+    parser.add_argument('-p', '--port', type=int, default=TCP_PORT, help=f'port of the live server, default = {TCP_PORT}')
+    parser.add_argument('-t', '--duration', type=float, default=DURATION, help=f'seconds to run each client against the live server, default = {DURATION}')
+    parser.add_argument('-P', '--pipeline', type=int, default=PIPELINE_WINDOW, help=f'requests in-flight per connection against the live server, default = {PIPELINE_WINDOW}')
+    args = parser.parse_args()
+
+    # declare local variables
+    frames = get_frames()
+
+    pymodbus_rate = measure_pymodbus_codec(frames, args.frames)
+    raw_rate = measure_raw_codec(frames, args.frames)
+    print(f'{"path":<28} {"frames/s":>12}')
+    print(f'{"pymodbus codec":<28} {pymodbus_rate:>12.0f}')
+    print(f'{"raw codec":<28} {raw_rate:>12.0f} ({raw_rate / pymodbus_rate:.1f}x)')
+
+    if args.ipaddr:
+        pymodbus_rate = await measure_live(AsyncModbusTcpClient(args.ipaddr, port=args.port), frames, args.duration, 1)
+        print(f'{"pymodbus client":<28} {pymodbus_rate:>12.0f}')
+        pipelined_rate = await measure_live(ModbusPipelineClient(args.ipaddr, args.port, args.pipeline), frames, args.duration, args.pipeline)
+        print(f'{"pymodbus pipelined client":<28} {pipelined_rate:>12.0f}')
+        raw_rate = await measure_live(proto_codec.ModbusRawClient(args.ipaddr, args.port, args.pipeline), frames, args.duration, args.pipeline)
+        print(f'{"raw pipelined client":<28} {raw_rate:>12.0f} ({raw_rate / pipelined_rate:.1f}x)')
+
+
+if __name__ == '__main__':
+    asyncio.run(run_main())
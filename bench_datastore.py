@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import proto_server
+
+
+import argparse
+import logging
+import random
+import time
+import tracemalloc
+
+
+# declare contants
+
+NUM_SLAVES = 100 # number of slave contexts to build for each measurement
+REGISTER_SIZES = '123,10000' # block sizes to measure, 123 is the largest modbus read, 10K is the theoretical per block size
+NUM_OPS = 10000 # number of getValues/setValues calls timed per datastore
+
+
+LOGGER = logging.getLogger(__name__)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+logging.basicConfig(filename='bench_datastore.log', level=logging.INFO, format=LOG_FORMAT)
+
+
+def fill_holding_registers(slave_context, num_registers:int):
+    LOGGER.debug('fill_holding_registers')
+
+    # write every holding register with values above the small int cache, as the clients do when writing floats
+    values = [random.randint(257, 0xFFFF) for _ in range(num_registers)]
+    slave_context.setValues(3, 0, values)
+
+
+def measure_memory(datastore:str, num_registers:int, num_slaves:int = NUM_SLAVES) -> tuple:
+    LOGGER.debug(f'measure_memory: datastore={datastore} registers={num_registers}')
+
+    # declare local variables
+    slave_contexts = []
+
+    # measure the memory held by num_slaves contexts, before and after the holding registers are written
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(num_slaves):
+        slave_contexts.append(proto_server.get_modbus_data_model(datastore, num_registers))
+    created, _ = tracemalloc.get_traced_memory()
+    for slave_context in slave_contexts:
+        fill_holding_registers(slave_context, num_registers)
+    filled, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return ((created - baseline) // num_slaves, (filled - baseline) // num_slaves)
+
+
+def measure_access(datastore:str, num_registers:int, num_ops:int = NUM_OPS) -> tuple:
+    LOGGER.debug(f'measure_access: datastore={datastore} registers={num_registers}')
+
+    # declare local variables
+    slave_context = proto_server.get_modbus_data_model(datastore, num_registers)
+    count = min(proto_server.MAX_HOLD_REG_SIZE, num_registers)
+    values = [random.randint(0, 0xFFFF) for _ in range(count)]
+    bits = [bool(random.getrandbits(1)) for _ in range(count)]
+
+    # time full size reads and writes of the holding registers and coils, as served for a client request
+    start = time.perf_counter()
+    for _ in range(num_ops):
+        slave_context.getValues(3, 1, count)
+        slave_context.setValues(16, 1, values)
+    registers_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_ops):
+        slave_context.getValues(1, 1, count)
+        slave_context.setValues(15, 1, bits)
+    coils_time = time.perf_counter() - start
+
+    return (registers_time / num_ops * 1e6, coils_time / num_ops * 1e6)
+
+
+def run_main():
+    LOGGER.debug('run_main')
+
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Measure memory per slave context and access time for each register datastore')
+    parser.add_argument(
+        '-n', '--slaves',
+        type=int,
+        default=NUM_SLAVES,
+        help=f'number of slave contexts to build for each measurement, default = {NUM_SLAVES}')
+    parser.add_argument(
+        '-r', '--registers',
+        default=REGISTER_SIZES,
+        help=f'comma separated list of block sizes to measure, default = {REGISTER_SIZES}')
+    parser.add_argument(
+        '-o', '--ops',
+        type=int,
+        default=NUM_OPS,
+        help=f'number of read/write calls timed per datastore, default = {NUM_OPS}')
+    args = parser.parse_args()
+
+    print(f'{"datastore":<12} {"registers":>10} {"bytes/slave":>12} {"filled":>12} {"reg r/w us":>11} {"coil r/w us":>12}')
+    for num_registers in [int(size) for size in args.registers.split(',')]:
+        for datastore in proto_server.DATASTORES:
+            created, filled = measure_memory(datastore, num_registers, args.slaves)
+            registers_us, coils_us = measure_access(datastore, num_registers, args.ops)
+            print(f'{datastore:<12} {num_registers:>10} {created:>12} {filled:>12} {registers_us:>11.2f} {coils_us:>12.2f}')
+
+
+if __name__ == '__main__':
+    run_main()
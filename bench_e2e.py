@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from proto_histogram import LatencyHistogram
+from proto_histogram import LatencyRecorder
+from proto_histogram import FUNCTION_CODE_SUB_BITS
+from proto_histogram import PERCENTILES
+
+
+import argparse
+import logging
+import ipaddress
+import itertools
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# declare contants
+
+SLAVE_COUNTS = '1,10,100' # comma separated numbers of slaves swept
+CONCURRENCY = '16,128' # comma separated client concurrency, max in-flight requests across all slaves, swept
+MIXES = '1:2,2:2,3:2,4:2,15:1,16:1;3:1' # semicolon separated function_code:weight mixes swept, as proto_client -m
+RATES = '2000' # comma separated open-loop target requests per second swept, above the client's capacity to find its ceiling
+ENGINES = 'pymodbus' # comma separated server engines swept
+DURATION = 10 # seconds each client runs for
+PIPELINE = 16 # requests in-flight per connection matched by transaction id, as proto_client -P
+TRANSPORT = 'pymodbus'
+BASE_ADDRESS = '127.0.1.1' # slaves are bound to consecutive loopback addresses from here, all routed to lo on linux
+SERVER_TIMEOUT = 30 # seconds to wait for every slave to accept connections
+RESULTS_FILE = 'bench_e2e.jsonl'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Loopback end-to-end benchmark
+
+Starts a proto_server serving every slave on loopback addresses from BASE_ADDRESS, on a free port, and runs an open-loop
+proto_client against it for each combination of the swept parameters. Each run reports the client's completed requests/s,
+errors and latency percentiles from its exit histograms (proto_client -H), and the CPU time and peak RSS of the server and
+client processes from their resource usage when they exit. Every run is appended to the results file as a JSON line with the
+commit it was run on, and -C compares the runs with the most recent runs of the same parameters in an earlier results file.
+
+| Field        | Description                                                                   |
+| ---          | ---                                                                           |
+| commit       | git commit of the tree, with -dirty if there are uncommitted changes           |
+| params       | slaves, concurrency, mix, rate, engine, duration, pipeline and transport       |
+| requests     | requests completed by the client, including errors                            |
+| errors       | failed requests                                                               |
+| rate         | completed requests/s over the client's polling time                          |
+| latency_ms   | p50, p90, p99 and max round trip of successful requests, overall and per fc   |
+| server       | cpu_seconds, cpu_percent of the server's run time and max_rss_kb              |
+| client       | cpu_seconds, cpu_percent of the client's run time and max_rss_kb              |
+"""
+
+
+def get_list(values:str, cast = int, separator:str = ',') -> list:
+    # swept values from the command line, skipping empty entries
+    return [cast(value.strip()) for value in values.split(separator) if value.strip()]
+
+
+def get_commit() -> str:
+    # git commit of the tree the benchmark was run from, None outside a git checkout
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=SCRIPT_DIR, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+def get_free_port() -> int:
+    # ephemeral port picked by the kernel, released for the server to bind
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def get_slave_addresses(num_slaves:int) -> list:
+    first = ipaddress.ip_address(BASE_ADDRESS)
+    return [str(first + i) for i in range(num_slaves)]
+
+
+def wait_for_slaves(slaves:list, port:int, server, timeout:float = SERVER_TIMEOUT) -> bool:
+    # poll each slave until it accepts a connection, or the server exits
+    deadline = time.monotonic() + timeout
+    for ipaddr in slaves:
+        while True:
+            if server.poll() is not None:
+                return False
+            try:
+                with socket.create_connection((ipaddr, port), timeout=1):
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.1)
+    return True
+
+
+def wait_process(process, started:float) -> dict:
+    # cpu time and peak rss of an exited child from its resource usage
+    pid, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.monotonic() - started
+    cpu_seconds = rusage.ru_utime + rusage.ru_stime
+    return {
+        'cpu_seconds': round(cpu_seconds, 3),
+        'cpu_percent': round(100 * cpu_seconds / elapsed, 1) if elapsed else 0,
+        'max_rss_kb': rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss, # bytes on macOS
+        'exit_code': process.returncode,
+    }
+
+
+def get_latency_results(histogram_file:str) -> dict:
+    # requests, errors, rate and percentiles from the cumulative histograms the client writes at exit
+    final = None
+    try:
+        with open(histogram_file, 'r') as file_handle:
+            for line in file_handle:
+                record = json.loads(line)
+                if record.get('final'):
+                    final = record
+    except (OSError, ValueError) as e:
+        LOGGER.error(f'get_latency_results: unable to read client histograms: {histogram_file}: {e}')
+    if not final:
+        return None
+
+    # declare local variables
+    recorder = LatencyRecorder.from_dict(final)
+    overall = LatencyHistogram(FUNCTION_CODE_SUB_BITS)
+    function_codes = {}
+    elapsed = final.get('interval') or 0
+
+    def get_percentiles(histogram):
+        latencies = {f'p{percent}': round(histogram.percentile(percent) / 1000, 3) for percent in PERCENTILES}
+        latencies['max'] = round(histogram.max / 1000, 3)
+        return latencies
+
+    for function_code, histogram in sorted(recorder.function_codes.items()):
+        overall.merge(histogram)
+        function_codes[str(function_code)] = dict(get_percentiles(histogram), requests=histogram.total + recorder.errors.get(function_code, 0))
+    errors = sum(recorder.errors.values())
+    return {
+        'requests': overall.total + errors,
+        'errors': errors,
+        'elapsed': round(elapsed, 3),
+        'rate': round((overall.total + errors) / elapsed, 1) if elapsed else 0,
+        'latency_ms': get_percentiles(overall),
+        'function_codes': function_codes,
+    }
+
+
+def run_benchmark(params:dict, work_dir:str) -> dict:
+    LOGGER.debug(f'run_benchmark: {params}')
+
+    # declare local variables
+    slaves = get_slave_addresses(params['slaves'])
+    port = get_free_port()
+    run_dir = tempfile.mkdtemp(prefix='run_', dir=work_dir) # the server and client write their logs here
+    slaves_list = os.path.join(run_dir, 'slaves.txt')
+    histogram_file = os.path.join(run_dir, 'histograms.jsonl')
+    result = {'time': time.time(), 'params': params}
+    client = None
+
+    with open(slaves_list, 'w') as file_handle:
+        file_handle.write('\n'.join(slaves) + '\n')
+
+    server_started = time.monotonic()
+    server = subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'proto_server.py'), '-l', slaves_list, '-p', str(port),
+                '-e', params['engine'], '-L', 'WARNING'],
+            cwd=run_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_slaves(slaves, port, server):
+            msg = f'run_benchmark: server did not start listening on {len(slaves)} slaves from {BASE_ADDRESS} port {port}'
+            LOGGER.error(msg)
+            print(f'[!] {msg}')
+            return None
+
+        client_started = time.monotonic()
+        client = subprocess.Popen(
+                [sys.executable, os.path.join(SCRIPT_DIR, 'proto_client.py'), '-l', slaves_list, '-p', str(port),
+                    '-r', str(params['rate']), '-t', str(params['duration']), '-c', str(params['concurrency']),
+                    '-P', str(params['pipeline']), '-m', params['mix'], '-T', params['transport'], '-L', 'WARNING',
+                    '-H', histogram_file],
+                cwd=run_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        result['client'] = wait_process(client, client_started)
+    finally:
+        if client and client.returncode is None:
+            client.kill()
+            client.wait()
+        if server.returncode is None:
+            server.send_signal(signal.SIGTERM)
+            result['server'] = wait_process(server, server_started)
+
+    latency_results = get_latency_results(histogram_file)
+    shutil.rmtree(run_dir, ignore_errors=True)
+    if not latency_results or 'server' not in result:
+        msg = f'run_benchmark: no results, client exit code: {result["client"]["exit_code"]}, server exit code: {server.returncode}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+    result.update(latency_results)
+    return result
+
+
+def get_params_key(params:dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+def read_results(results_file:str) -> dict:
+    # most recent result for each set of parameters in a results file
+    results = {}
+    try:
+        with open(results_file, 'r') as file_handle:
+            for line in file_handle:
+                if line.strip():
+                    result = json.loads(line)
+                    results[get_params_key(result['params'])] = result
+    except (OSError, ValueError) as e:
+        msg = f'read_results: unable to read results: {results_file}: {e}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+    return results
+
+
+def get_result_line(result:dict, baseline:dict = None) -> str:
+    params = result['params']
+    line = (f'{params["slaves"]:>6} {params["concurrency"]:>6} {params["rate"]:>7g} {params["engine"]:>8} {params["mix"]:<24} '
+            f'{result["rate"]:>9.1f} {result["errors"]:>7} {result["latency_ms"]["p50"]:>8.2f} {result["latency_ms"]["p99"]:>8.2f} '
+            f'{result["server"]["cpu_percent"]:>6.1f} {result["server"]["max_rss_kb"] // 1024:>6} '
+            f'{result["client"]["cpu_percent"]:>6.1f} {result["client"]["max_rss_kb"] // 1024:>6}')
+    if baseline:
+        rate_change = (result['rate'] / baseline['rate'] - 1) * 100 if baseline['rate'] else 0
+        p99_change = (result['latency_ms']['p99'] / baseline['latency_ms']['p99'] - 1) * 100 if baseline['latency_ms']['p99'] else 0
+        line += f' {rate_change:>+8.1f}% {p99_change:>+8.1f}% ({baseline.get("commit")})'
+    return line
+
+
+def run_main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Sweep proto_server and proto_client over loopback and record throughput, latency, CPU and RSS of each run')
+    parser.add_argument('-s', '--slaves', default=SLAVE_COUNTS, help=f'comma separated numbers of slaves, default = "{SLAVE_COUNTS}"')
+    parser.add_argument('-c', '--concurrency', default=CONCURRENCY, help=f'comma separated max in-flight requests of the client, default = "{CONCURRENCY}"')
+    parser.add_argument('-m', '--mixes', default=MIXES, help=f'semicolon separated function_code:weight mixes, default = "{MIXES}"')
+    parser.add_argument('-r', '--rates', default=RATES, help=f'comma separated open-loop target requests per second, default = "{RATES}"')
+    parser.add_argument('-e', '--engines', default=ENGINES, help=f'comma separated server engines, pymodbus or fast, default = "{ENGINES}"')
+    parser.add_argument('-t', '--duration', type=float, default=DURATION, help=f'seconds each client runs for, default = {DURATION}')
+    parser.add_argument('-P', '--pipeline', type=int, default=PIPELINE, help=f'requests in-flight per connection, 0 to wait for each response, default = {PIPELINE}')
+    parser.add_argument('-T', '--transport', choices=['pymodbus', 'raw'], default=TRANSPORT, help=f'client transport, default = "{TRANSPORT}"')
+    parser.add_argument('-o', '--output', default=RESULTS_FILE, help=f'append the result of each run to this file as JSON lines, default = "{RESULTS_FILE}"')
+    parser.add_argument('-C', '--compare', help='compare each run with the most recent run of the same parameters in this results file e.g., of an earlier commit')
+    args = parser.parse_args()
+
+    # declare local variables
+    commit = get_commit()
+    baselines = read_results(args.compare) if args.compare else {}
+    sweep = itertools.product(get_list(args.slaves), get_list(args.concurrency), get_list(args.mixes, str, ';'), get_list(args.rates, float), get_list(args.engines, str))
+    work_dir = tempfile.mkdtemp(prefix='bench_e2e_')
+    environment = {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+    header = (f'{"slaves":>6} {"conc":>6} {"rate":>7} {"engine":>8} {"mix":<24} {"req/s":>9} {"errors":>7} {"p50 ms":>8} {"p99 ms":>8} '
+            f'{"srv %":>6} {"srv MB":>6} {"cli %":>6} {"cli MB":>6}')
+    if baselines:
+        header += f' {"req/s chg":>9} {"p99 chg":>9}'
+    print(f'[*] bench_e2e: commit {commit}, {args.duration}s per run, results appended to {args.output}')
+    print(header)
+    try:
+        for num_slaves, concurrency, mix, rate, engine in sweep:
+            params = {
+                    'slaves': num_slaves, 'concurrency': concurrency, 'mix': mix, 'rate': rate, 'engine': engine,
+                    'duration': args.duration, 'pipeline': args.pipeline, 'transport': args.transport,
+                }
+            result = run_benchmark(params, work_dir)
+            if not result:
+                continue
+            result['commit'] = commit
+            result['environment'] = environment
+            with open(args.output, 'a') as file_handle:
+                file_handle.write(json.dumps(result) + '\n')
+            print(get_result_line(result, baselines.get(get_params_key(params))))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run_main()
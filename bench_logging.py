@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import proto_logging
+
+
+import argparse
+import logging
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+import os
+
+
+# declare contants
+
+NUM_REQUESTS = 100000 # number of per request records logged in each mode
+NUM_SLAVES = 100 # number of slaves the records are spread across
+SLAVE_ID = 0x01
+
+
+LOGGER = logging.getLogger('proto_client')
+
+
+"""
+Logging benchmark
+
+Logs the per request records of proto_client from a coroutine on the event loop, as the poll handlers do, and reports the
+request rate the event loop sustains in each mode, and the rate once every record is on disk.
+
+| Mode          | Logging                                                               |
+| ---           | ---                                                                   |
+| basicConfig   | FileHandler written and flushed on the event loop, f-string messages  |
+| queued        | records queued to the writer thread, formatted there                  |
+| per slave     | as queued, with a log file per slave and unit id                      |
+| sampled       | as queued, keeping 1 in 10 records                                    |
+| off           | level WARNING, per request records skipped before building a record   |
+"""
+
+
+async def log_requests(num_requests:int, slaves:list, payload:list, queued:bool):
+    # a write payload record for each request, handing control back to the event loop as each request would
+    for i in range(num_requests):
+        ipaddr = slaves[i % len(slaves)]
+        if queued:
+            proto_logging.log_request(LOGGER, 'modbus_write_holding_registers_handler: wrote: %s at: %s for slave: %s', payload, 1, SLAVE_ID, slave=(ipaddr, SLAVE_ID))
+        else:
+            LOGGER.info(f'modbus_write_holding_registers_handler: wrote: {payload} at: {1} for slave: {SLAVE_ID}')
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+
+
+def measure_mode(mode:str, num_requests:int, slaves:list, payload:list, log_dir:str) -> tuple:
+    LOGGER.debug(f'measure_mode: {mode}')
+
+    # declare local variables
+    log_file = os.path.join(log_dir, f'bench_{mode.replace(" ", "_")}.log')
+    queued = mode != 'basicConfig'
+
+    if queued:
+        proto_logging.setup_logging(
+                log_file,
+                'WARNING' if mode == 'off' else 'INFO',
+                os.path.join(log_dir, 'slaves') if mode == 'per slave' else None,
+                10 if mode == 'sampled' else 1)
+    else:
+        logging.basicConfig(filename=log_file, encoding='utf-8', level=logging.INFO, format=proto_logging.LOG_FORMAT, force=True)
+
+    # rate on the event loop, then the rate once the writer has caught up
+    start = time.perf_counter()
+    asyncio.run(log_requests(num_requests, slaves, payload, queued))
+    loop_time = time.perf_counter() - start
+    proto_logging.stop_logging()
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+    total_time = time.perf_counter() - start
+    return (num_requests / loop_time, num_requests / total_time)
+
+
+def run_main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Compare the event loop request rate of each logging mode')
+    parser.add_argument('-n', '--requests', type=int, default=NUM_REQUESTS, help=f'number of per request records logged in each mode, default = {NUM_REQUESTS}')
+    parser.add_argument('-s', '--slaves', type=int, default=NUM_SLAVES, help=f'number of slaves the records are spread across, default = {NUM_SLAVES}')
+    args = parser.parse_args()
+
+    # declare local variables
+    slaves = [f'10.10.{i // 254}.{i % 254 + 1}' for i in range(max(1, args.slaves))]
+    payload = [random.randint(0, 0xFFFF) for _ in range(60)] # 30 floats, an average holding register write
+    log_dir = tempfile.mkdtemp(prefix='bench_logging_')
+    proto_logging.MAX_QUEUED_REQUESTS = args.requests # every record written, none dropped
+
+    print(f'{"mode":<14} {"loop req/s":>12} {"on disk req/s":>14}')
+    try:
+        for mode in ('basicConfig', 'queued', 'per slave', 'sampled', 'off'):
+            loop_rate, disk_rate = measure_mode(mode, args.requests, slaves, payload, log_dir)
+            print(f'{mode:<14} {loop_rate:>12.0f} {disk_rate:>14.0f}')
+    finally:
+        logging.getLogger().handlers.clear()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run_main()
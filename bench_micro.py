@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from pymodbus.payload import BinaryPayloadBuilder
+from pymodbus.constants import Endian
+
+import proto_server
+from proto_metrics import set_metrics
+from proto_models import ProcessModelBank
+from proto_models import load_model_config
+from proto_payload import ModbusPayloadPool
+from proto_payload import MAX_FLOATS
+from proto_payload import MAX_COILS
+
+
+import argparse
+import logging
+import asyncio
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+
+# declare contants
+
+REGISTER_SIZES = '64,1000,10000' # block sizes of the datastore benchmarks, as proto_server -r
+NUM_OPS = 20000 # calls timed per benchmark
+NUM_TICKS = 50 # register update ticks timed per tick benchmark
+NUM_SLAVES = 100 # slave contexts updated by each register update tick
+REPEAT = 3 # timed runs of each benchmark, the fastest is reported
+PEAK_OPS = 1000 # calls traced for the peak memory of each benchmark
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Micro-benchmarks
+
+Times the functions that dominate the server and client profiles, reporting calls per second, the memory blocks allocated
+per call that are still live when it returns (its result and anything it stores, counted by sys.getallocatedblocks with
+the results kept), and the peak memory traced by tracemalloc while it runs, which includes its temporaries. Alternatives
+are benchmarked next to the current implementation e.g., the BinaryPayloadBuilder payloads the client used to build per
+write next to the payload pool that replaced them.
+
+| Benchmark        | Variants                                                                                  |
+| ---              | ---                                                                                       |
+| datastore        | getValues/setValues of 60 holding registers and 64 coils, per datastore and block size     |
+| register tick    | a full modbus_server_register_updates tick of NUM_SLAVES slaves, toggling or with models   |
+| float payload    | BinaryPayloadBuilder of 1 - 60 random floats, or ModbusPayloadPool.registers               |
+| coil payload     | the original list of one random value, a list of random coils, or ModbusPayloadPool.coil_values |
+
+-k selects the benchmarks whose name contains any of the given words, and -o appends the results as JSON lines.
+"""
+
+
+def measure_op(op, num_ops:int = NUM_OPS, repeat:int = REPEAT) -> dict:
+    LOGGER.debug(f'measure_op: {op}')
+
+    # declare local variables
+    indexes = list(range(num_ops)) # created up front so the loop itself allocates nothing
+    results = [None] * num_ops
+    best = float('inf')
+
+    # fastest of repeat timed runs
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in indexes:
+            op()
+        best = min(best, time.perf_counter() - start)
+
+    # blocks still allocated once every call has returned, keeping the results
+    gc.collect()
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        for index in indexes:
+            results[index] = op()
+        blocks = (sys.getallocatedblocks() - before) / num_ops
+    finally:
+        gc.enable()
+    del results
+
+    # highest memory traced above the baseline while calls run, without keeping the results
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for _ in range(min(num_ops, PEAK_OPS)):
+        op()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'ops': num_ops / best, 'blocks': blocks, 'peak_bytes': peak - baseline}
+
+
+def get_datastore_benchmarks(num_registers:int) -> list:
+    # (name, variant, op) for reads and writes of each datastore, as served for a client request
+    benchmarks = []
+    values = [random.randint(257, 0xFFFF) for _ in range(proto_server.MAX_HOLD_REG_SIZE)] # above the small int cache, as floats are
+    bits = [bool(random.getrandbits(1)) for _ in range(proto_server.MAX_COIL_REG_SIZE)]
+    for datastore in proto_server.DATASTORES:
+        slave_context = proto_server.get_modbus_data_model(datastore, num_registers)
+        variant = f'{datastore} {num_registers}'
+        benchmarks.extend([
+            ('datastore getValues hr', variant, lambda slave_context=slave_context: slave_context.getValues(3, 1, len(values))),
+            ('datastore setValues hr', variant, lambda slave_context=slave_context: slave_context.setValues(16, 1, values)),
+            ('datastore getValues coils', variant, lambda slave_context=slave_context: slave_context.getValues(1, 1, len(bits))),
+            ('datastore setValues coils', variant, lambda slave_context=slave_context: slave_context.setValues(15, 1, bits)),
+        ])
+    return benchmarks
+
+
+def build_float_payload() -> list:
+    # holding register payload as the client built it for every write before the payload pool
+    builder = BinaryPayloadBuilder(byteorder=Endian.LITTLE)
+    for _ in range(random.randint(1, MAX_FLOATS)):
+        builder.add_32bit_float(random.uniform(0.0, 50.0))
+    return builder.to_registers()
+
+
+def get_payload_benchmarks() -> list:
+    # (name, variant, op) for the client's write payloads
+    payload_pool = ModbusPayloadPool(seed=0)
+    bernoulli_pool = ModbusPayloadPool(coils='bernoulli:0.5', seed=0)
+    return [
+        ('float payload', 'BinaryPayloadBuilder', build_float_payload),
+        ('float payload', 'ModbusPayloadPool', payload_pool.registers),
+        ('coil payload', 'random value list', lambda: [random.choice([True, False])] * random.randint(1, MAX_COILS)),
+        ('coil payload', 'random coil list', lambda: [random.random() < 0.5 for _ in range(random.randint(1, MAX_COILS))]),
+        ('coil payload', 'ModbusPayloadPool same', payload_pool.coil_values),
+        ('coil payload', 'ModbusPayloadPool bernoulli', bernoulli_pool.coil_values),
+    ]
+
+
+async def run_register_ticks(server_contexts:dict, num_ticks:int, process_models:ProcessModelBank = None) -> tuple:
+    # tick the register updater back to back, timing each tick with the server metrics
+    metrics = set_metrics()
+    updater_task = asyncio.create_task(proto_server.modbus_server_register_updates(server_contexts, proto_server.SLAVE_ID, 1e-9, process_models))
+    while metrics.update_ticks < 1: # the first tick zeroes the blocks
+        await asyncio.sleep(0)
+    ticks = metrics.update_ticks
+    seconds = metrics.update_seconds
+    before = sys.getallocatedblocks()
+    while metrics.update_ticks < ticks + num_ticks:
+        await asyncio.sleep(0)
+    blocks = sys.getallocatedblocks() - before
+    updater_task.cancel()
+    await asyncio.gather(updater_task, return_exceptions=True)
+    return (metrics.update_ticks - ticks, metrics.update_seconds - seconds, blocks)
+
+
+def measure_register_tick(datastore:str, num_registers:int, num_slaves:int = NUM_SLAVES, num_ticks:int = NUM_TICKS, models:bool = False) -> dict:
+    LOGGER.debug(f'measure_register_tick: datastore={datastore} registers={num_registers} slaves={num_slaves} models={models}')
+
+    # declare local variables
+    server_contexts = {f'10.0.{i // 256}.{i % 256}': proto_server.get_modbus_server_context(1, datastore, num_registers) for i in range(num_slaves)}
+    server_logger = logging.getLogger(proto_server.__name__)
+    level = server_logger.level
+    server_logger.setLevel(logging.ERROR) # every back to back tick overruns the interval
+
+    # timed untraced, then a few ticks traced for the peak memory
+    try:
+        process_models = ProcessModelBank(load_model_config('')) if models else None
+        ticks, seconds, blocks = asyncio.run(run_register_ticks(server_contexts, num_ticks, process_models))
+        process_models = ProcessModelBank(load_model_config('')) if models else None
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        asyncio.run(run_register_ticks(server_contexts, min(num_ticks, 5), process_models))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        server_logger.setLevel(level)
+    return {'ops': ticks / seconds if seconds else 0, 'blocks': blocks / ticks if ticks else 0, 'peak_bytes': peak - baseline}
+
+
+def run_main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(description='Measure calls/s and allocations per call of the datastore, register update and payload hot paths')
+    parser.add_argument('-r', '--registers', default=REGISTER_SIZES, help=f'comma separated block sizes of the datastore and tick benchmarks, default = "{REGISTER_SIZES}"')
+    parser.add_argument('-n', '--ops', type=int, default=NUM_OPS, help=f'calls timed per benchmark, default = {NUM_OPS}')
+    parser.add_argument('-t', '--ticks', type=int, default=NUM_TICKS, help=f'register update ticks timed per tick benchmark, default = {NUM_TICKS}')
+    parser.add_argument('-s', '--slaves', type=int, default=NUM_SLAVES, help=f'slaves updated by each register update tick, default = {NUM_SLAVES}')
+    parser.add_argument('-k', '--keywords', help='comma separated words, only run the benchmarks whose name contains one of them e.g., "datastore,payload", default = every benchmark')
+    parser.add_argument('-o', '--output', help='append the results to this file as JSON lines, default = not written')
+    args = parser.parse_args()
+
+    # declare local variables
+    keywords = [keyword.strip() for keyword in args.keywords.split(',')] if args.keywords else None
+    register_sizes = [int(size) for size in args.registers.split(',')]
+    results = []
+
+    def selected(name:str) -> bool:
+        return not keywords or any(keyword in name for keyword in keywords)
+
+    def report(name:str, variant:str, result:dict):
+        result = dict(result, name=name, variant=variant, time=time.time())
+        results.append(result)
+        print(f'{name:<26} {variant:<28} {result["ops"]:>12.0f} {1e6 / result["ops"] if result["ops"] else 0:>10.2f} {result["blocks"]:>10.1f} {result["peak_bytes"]:>10}')
+
+    print(f'{"benchmark":<26} {"variant":<28} {"ops/s":>12} {"us/op":>10} {"blocks/op":>10} {"peak B":>10}')
+    for num_registers in register_sizes:
+        for name, variant, op in get_datastore_benchmarks(num_registers):
+            if selected(name):
+                report(name, variant, measure_op(op, args.ops))
+    for num_registers in register_sizes:
+        for datastore in proto_server.DATASTORES:
+            for models in (False, True):
+                name = 'register tick models' if models else 'register tick toggle'
+                if selected(name):
+                    report(name, f'{datastore} {num_registers} x{args.slaves}', measure_register_tick(datastore, num_registers, args.slaves, args.ticks, models))
+    for name, variant, op in get_payload_benchmarks():
+        if selected(name):
+            report(name, variant, measure_op(op, args.ops))
+
+    if args.output:
+        with open(args.output, 'a') as file_handle:
+            for result in results:
+                file_handle.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    run_main()
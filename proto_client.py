@@ -5,14 +5,53 @@
 
 from pymodbus.client import AsyncModbusTcpClient
 from pymodbus.exceptions import ModbusException
-from pymodbus.payload import BinaryPayloadBuilder
-from pymodbus.constants import Endian
 
+from proto_transport import ModbusPipelineClient
+from proto_codec import ModbusRawClient
+from proto_payload import get_payload_pool
+from proto_payload import set_payload_pool
+from proto_payload import get_distribution
+from proto_payload import FLOAT_DISTRIBUTION
+from proto_payload import FLOAT_DISTRIBUTIONS
+from proto_payload import COIL_DISTRIBUTION
+from proto_payload import COIL_DISTRIBUTIONS
+from proto_logging import setup_logging
+from proto_logging import stop_logging
+from proto_logging import log_request
+from proto_logging import LOG_LEVEL
+from proto_logging import LOG_LEVELS
+from proto_logging import LOG_SAMPLE
+from proto_journal import set_journal
+from proto_journal import get_journal
+from proto_journal import close_journal
+from proto_journal import STATUS_OK
+from proto_journal import STATUS_ERROR
+from proto_journal import STATUS_NO_RESPONSE
+from proto_histogram import LatencyRecorder
+from proto_histogram import get_interval_summary
+from proto_histogram import get_latency_report
+from proto_histogram import write_histograms
+from proto_profile import TrafficGroup
+from proto_profile import TrafficProfile
+from proto_profile import set_traffic_profile
+from proto_profile import get_traffic_profile
+from proto_profile import load_traffic_profile
+from proto_schedule import RequestSchedule
+from proto_schedule import open_schedule
+from proto_schedule import write_schedule
+from proto_schedule import get_schedule_seed
 
 import argparse
 import logging
 import asyncio
 import random
+import ipaddress
+import resource
+import math
+import multiprocessing
+import queue
+import signal
+import time
 
 
 # declare contants
@@ -22,13 +61,33 @@ NUM_RUNS = 100 # number of times to poll/invoke handlers, tested up to 900000
 IP_ADDR = '127.0.0.1'
 TCP_PORT = 502
 SLAVE_ID = 0x01
+NUM_UNITS = 1 # number of unit ids to spread polls across behind each slave address, starting at the slave id
+MAX_UNITS = 247 # modbus unit ids 1 - 247
+
+MAX_CONCURRENCY = 1000 # max number of in-flight polls across all connections, also bounds concurrent connection attempts
+MAX_PER_CONNECTION = 1 # max number of in-flight polls per connection
+PIPELINE_WINDOW = 0 # max number of in-flight requests per connection, 0 to use the pymodbus client which waits for each response
+TRANSPORT = 'pymodbus' # pymodbus builds and parses frames with pymodbus request and framer objects, raw with precompiled structs
+TRANSPORTS = ['pymodbus', 'raw']
+
+RATE = 0 # target requests per second for the open-loop load generator, 0 to run NUM_RUNS closed-loop polls instead
+ARRIVAL = 'constant' # open-loop request arrival distribution, one of ARRIVAL_DISTRIBUTIONS
+ARRIVAL_DISTRIBUTIONS = ['constant', 'poisson', 'bursty']
+DURATION = 0 # seconds to run the open-loop load generator for, 0 to run forever
+BURST_SIZE = 10 # number of back to back requests in each burst for bursty arrivals
+FUNCTION_CODE_MIX = '1:2,2:2,3:2,4:2,15:1,16:1' # function code weights, default matches a closed-loop poll with 50/50 writes
+REPORT_INTERVAL = 5 # seconds between open-loop and worker progress reports
+MAX_LAG = 0.1 # seconds behind schedule before the open-loop load generator reports it is falling behind
+END_OF_REQUESTS = (math.inf, None, None, None) # offset of the request after the last one of a schedule
+
+WORKERS = 1 # number of worker processes to partition the slaves across, each running its own event loop
+WORKER_POLL_INTERVAL = 1 # seconds between worker counter updates and checks for shutdown
+WORKER_SHUTDOWN_TIMEOUT = 10 # seconds to wait for workers to stop before terminating them
 
 COMMS_NAME='vPLC simulation'
 
 # TODO: set to realistic values similar to actual PLC hardware, theoratical size 10K
 # TODO: move these constants into a shared module, its duplicated on the client and serber and is currently manullay kept in sync - likely to break something in the future
-# TODO: make log level a configurable parameter and accept it as a cli argument
-# TODO: make type of client calls parameterised i.e., all for all, coil for read coils only, etc.
 
 MAX_COIL_REG = 64
 MAX_HOLD_REG = 60
@@ -37,17 +96,74 @@ MAX_INPUT_REG = 123 # max is 125-word i.e. 256-bytes, but for modbus TCP this be
 
 LOG_FILE = 'proto_client.log'
 
+REQUEST_COUNTS = {} # function code -> [number of successful requests, number of failed requests]
+LATENCY_RECORDER = LatencyRecorder() # latency histograms of this process per function code and slave
+
 
 # declare global variables - this is a bad things, but...
 
-# TODO: make logfile specific to slave and slave_id - init in main()
-logging.basicConfig(filename=LOG_FILE, encoding='utf-8', level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 LOGGER = logging.getLogger(__name__)
 
-# TODO: modify handler functions to split read and write
 
+def record_request(function_code:int, ok:bool):
+    # count the outcome of a request against its function code
+    counts = REQUEST_COUNTS.get(function_code)
+    if not counts:
+        counts = REQUEST_COUNTS[function_code] = [0, 0]
+    counts[0 if ok else 1] += 1
+
+
+def get_client_host(modbus_tcp_client) -> str:
+    # address of the slave a client is connected to, the pymodbus client keeps it in its comm params
+    return getattr(modbus_tcp_client, 'host', None) or modbus_tcp_client.comm_params.host
+
+
+def get_client_port(modbus_tcp_client) -> int:
+    return int(getattr(modbus_tcp_client, 'port', None) or modbus_tcp_client.comm_params.port)
+
+
+def record_transaction(modbus_tcp_client, slave_id:int, function_code:int, address:int, count:int, modbus_response, start:int):
+    # record the round trip of a request in the latency histograms, and append it to the transaction journal if there is one
+    latency_us = (time.perf_counter_ns() - start) // 1000
+    ok = modbus_response is not None and not modbus_response.isError()
+    ipaddr = get_client_host(modbus_tcp_client)
+    port = get_client_port(modbus_tcp_client)
+    LATENCY_RECORDER.record(function_code, (ipaddr, port, slave_id), latency_us, ok)
+
+    journal = get_journal()
+    if journal is None:
+        return
+    if modbus_response is None:
+        status = STATUS_NO_RESPONSE
+    elif not ok:
+        status = getattr(modbus_response, 'exception_code', None) or STATUS_ERROR
+    else:
+        status = STATUS_OK
+    journal.record(ipaddr, port, slave_id, function_code, address, count, status, latency_us)
+
+
+async def modbus_latency_reporter(interval:float = REPORT_INTERVAL, histogram_file:str = None):
+    LOGGER.debug(f'modbus_latency_reporter: interval={interval} histogram_file={histogram_file}')
 
-def get_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT):
+    # log the request rate and percentiles of each interval, and append its histograms to the histogram file
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    previous = LATENCY_RECORDER.snapshot()
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            summary = get_interval_summary(LATENCY_RECORDER, previous, interval)
+            if summary:
+                LOGGER.info(f'modbus_latency_reporter: {summary}')
+            if histogram_file:
+                write_histograms(histogram_file, LATENCY_RECORDER, previous, interval)
+            previous = LATENCY_RECORDER.snapshot()
+    finally:
+        if histogram_file:
+            write_histograms(histogram_file, LATENCY_RECORDER, elapsed=loop.time() - start, final=True)
+
+
+def get_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT, pipeline_window:int = PIPELINE_WINDOW, transport:str = TRANSPORT):
     LOGGER.debug('get_modbus_client')
 
     # check parameters
@@ -57,6 +173,14 @@ def get_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT):
         print('[!] {msg}')
         return None
     
+    # raw client packs and parses frames itself, keeping up to the window (at least 1) requests in-flight
+    if transport == 'raw':
+        return ModbusRawClient(ipaddr, port, window=pipeline_window, timeout=30, name=COMMS_NAME)
+
+    # pipelined client keeps several requests in-flight on the connection and matches responses by transaction id
+    if pipeline_window:
+        return ModbusPipelineClient(ipaddr, port, window=pipeline_window, timeout=30, name=COMMS_NAME)
+
     # declare local variables
     modbus_client = AsyncModbusTcpClient(
             host=ipaddr,
@@ -72,19 +196,15 @@ def get_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT):
     return modbus_client
 
 
-async def modbus_poll_holding_register_handler(modbus_tcp_client, slave_id:int = SLAVE_ID):
-    LOGGER.debug(f'modbus_poll_holding_register_handler: slave={slave_id}')
+async def modbus_read_holding_registers_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, start_address:int = 0x01, num_holding_reg:int = 1):
+    LOGGER.debug('modbus_read_holding_registers_handler: slave=%s', slave_id)
 
     # check parameters
     assert modbus_tcp_client
     assert slave_id
 
     # declare local variables
-    start_address = 0x01
-    num_holding_reg = 1
     modbus_response = None
-    value = None
-    fifty_fifty = [True,False]
 
     # read holding registers
     """
@@ -93,67 +213,95 @@ async def modbus_poll_holding_register_handler(modbus_tcp_client, slave_id:int =
     try:
         #print('[*] reading holding registers')
         print('.', end='', flush=True)
+        start = time.perf_counter_ns()
         modbus_response = await modbus_tcp_client.read_holding_registers(
                 address=start_address, 
                 count=num_holding_reg, 
                 slave=slave_id
             )
     except ModbusException as me:
-        msg = f'modbus_poll_holding_register_handler: unable to read holding registers at {start_address} count {num_holding_reg} for {slave_id}'
+        msg = f'modbus_read_holding_registers_handler: unable to read holding registers at {start_address} count {num_holding_reg} for {slave_id}'
         LOGGER.error(msg)
         print(f'[!] {msg}')
 
     if modbus_response and not modbus_response.isError():
-        LOGGER.info(f'modbus_poll_holding_register_handler: read holding register at: {start_address} count: {num_holding_reg} for: {slave_id}')
+        record_request(0x03, True)
+        record_transaction(modbus_tcp_client, slave_id, 0x03, start_address, num_holding_reg, modbus_response, start)
+        log_request(LOGGER, 'modbus_read_holding_registers_handler: read holding register at: %s count: %s for: %s', start_address, num_holding_reg, slave_id, slave=(get_client_host(modbus_tcp_client), slave_id))
     else:
-        msg = f'modbus_poll_holding_register_handler: error reading holding register at: {start_address} count: {num_holding_reg} for: {slave_id}'
+        msg = f'modbus_read_holding_registers_handler: error reading holding register at: {start_address} count: {num_holding_reg} for: {slave_id}'
+        LOGGER.error(msg)
+        record_request(0x03, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x03, start_address, num_holding_reg, modbus_response, start)
+        print(f'[!] {msg}')
+
+
+async def modbus_write_holding_registers_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, start_address:int = 0x01, value:list = None):
+    LOGGER.debug('modbus_write_holding_registers_handler: slave=%s', slave_id)
+
+    # check parameters
+    assert modbus_tcp_client
+    assert slave_id
+
+    # declare local variables
+    modbus_response = None
+
+    try:
+        # pre-generated random list of between 1 and 60 floats, unless given by the traffic profile
+        if value is None:
+            value = get_payload_pool().registers()
+
+        # attempt to write holding register
+        #print('[*] writing holding registers')
+        print('.', end='')
+        start = time.perf_counter_ns()
+        modbus_response = await modbus_tcp_client.write_registers(address=start_address, values=value, slave=slave_id)
+        record_request(0x10, bool(modbus_response and not modbus_response.isError()))
+        record_transaction(modbus_tcp_client, slave_id, 0x10, start_address, len(value or ()), modbus_response, start)
+        log_request(LOGGER, 'modbus_write_holding_registers_handler: wrote: %s at: %s for slave: %s', value, start_address, slave_id, slave=(get_client_host(modbus_tcp_client), slave_id))
+    except ModbusException as me:
+        msg = f'modbus_write_holding_registers_handler: unable to write holdering register: {value} at: {start_address} for slave: {slave_id}'
         LOGGER.error(msg)
+        record_request(0x10, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x10, start_address, len(value or ()), modbus_response, start)
         print(f'[!] {msg}')
 
-    # randomly write holding registers
-    write_holding_registers = random.choice(fifty_fifty)
-    if write_holding_registers:
-        try:
-            # random number of holdering registers between 1 and 60
-            num_holding_reg = random.choice(range(1,MAX_HOLD_REG+1)) 
-
-            # create random list of floats
-            builder = BinaryPayloadBuilder(byteorder=Endian.LITTLE)
-            for i in range(num_holding_reg):
-                builder.add_32bit_float(random.uniform(0.0, 50.0))
-            value = builder.build()
-
-            # attempt to write holding register
-            #print('[*] writing holding registers')
-            print('.', end='')
-            await modbus_tcp_client.write_registers(address=start_address, values=value, slave=slave_id)
-            LOGGER.info(f'modbus_poll_holding_register_handler: wrote: {value} at: {start_address} for slave: {slave_id}')
-        except ModbusException as me:
-            msg = f'modbus_poll_holding_register_handler: unable to write holdering register: {value} at: {start_address} for slave: {slave_id}'
-            LOGGER.error(msg)
-            print(f'[!] {msg}')
-
-
-async def modbus_poll_discrete_input_handler(modbus_tcp_client, slave_id:int = SLAVE_ID):
-    LOGGER.debug(f'modbus_poll_discrete_input_handler: slave={slave_id}')
+
+async def modbus_poll_holding_register_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, traffic_group:TrafficGroup = None):
+    LOGGER.debug('modbus_poll_holding_register_handler: slave=%s', slave_id)
+
+    # declare local variables
+    traffic_group = traffic_group or get_traffic_profile().default_group
+
+    # read holding registers
+    if 0x03 in traffic_group.polled:
+        await modbus_read_holding_registers_handler(modbus_tcp_client, slave_id, *traffic_group.take(0x03))
+
+    # randomly write holding registers, with the group's pre-drawn write probability
+    if 0x10 in traffic_group.polled and traffic_group.take_write():
+        await modbus_write_holding_registers_handler(modbus_tcp_client, slave_id, *traffic_group.take(0x10))
+
+
+async def modbus_poll_discrete_input_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, start_address:int = 0x01, num_registers:int = None):
+    LOGGER.debug('modbus_poll_discrete_input_handler: slave=%s', slave_id)
 
     # check parameters
     assert modbus_tcp_client
     assert slave_id
 
     # declare local variables
-    start_address = 0x01
-    num_registers = None
     modbus_response = None
     value = None
 
-    # randomise the number of registers to read
-    num_registers = random.randint(1,MAX_DISCRETE_IN_REG) # TODO: investigate if random.choice or random.randint should be used
+    # randomise the number of registers to read, unless given by the traffic profile
+    if num_registers is None:
+        num_registers = random.randint(1,MAX_DISCRETE_IN_REG) # TODO: investigate if random.choice or random.randint should be used
 
     # read discrete input registers
     try:
         #print('[*] reading discrete input')
         print('.', end='')
+        start = time.perf_counter_ns()
         modbus_response = await modbus_tcp_client.read_discrete_inputs(
                 address=start_address, 
                 count=num_registers, 
@@ -165,30 +313,34 @@ async def modbus_poll_discrete_input_handler(modbus_tcp_client, slave_id:int = S
         print(f'[!] {msg}')
 
     if modbus_response and not modbus_response.isError():
-        LOGGER.info(f'modbus_poll_discrete_input_handler: read: {num_registers} discrete input registers at: {start_address} for slave: {slave_id}')
+        record_request(0x02, True)
+        record_transaction(modbus_tcp_client, slave_id, 0x02, start_address, num_registers, modbus_response, start)
+        log_request(LOGGER, 'modbus_poll_discrete_input_handler: read: %s discrete input registers at: %s for slave: %s', num_registers, start_address, slave_id, slave=(get_client_host(modbus_tcp_client), slave_id))
     else:
         msg= f'modbus_poll_discrete_input_handler: error reading: {num_registers} discrete input registers at: {start_address} for slave: {slave_id}'
         LOGGER.error(msg)
+        record_request(0x02, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x02, start_address, num_registers, modbus_response, start)
         print(f'[!] {msg}')
 
 
-async def modbus_poll_input_registers_handler(modbus_tcp_client, slave_id:int = SLAVE_ID):
-    LOGGER.debug(f'modbus_poll_input_registers_handler: slave={slave_id}')
+async def modbus_poll_input_registers_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, start_address:int = 0x01, num_registers:int = None):
+    LOGGER.debug('modbus_poll_input_registers_handler: slave=%s', slave_id)
 
     # check parameters
     assert modbus_tcp_client
     assert slave_id
 
     # declare local variables
-    start_address = 0x01
-    num_registers = None
     modbus_response = None
     value = None
 
-    # randomise the number of registers to read
-    num_registers = random.randint(1,MAX_INPUT_REG) 
+    # randomise the number of registers to read, unless given by the traffic profile
+    if num_registers is None:
+        num_registers = random.randint(1,MAX_INPUT_REG) 
 
     try:
+        start = time.perf_counter_ns()
         modbus_response = await modbus_tcp_client.read_input_registers(
                 address=start_address, 
                 count=num_registers, 
@@ -198,83 +350,147 @@ async def modbus_poll_input_registers_handler(modbus_tcp_client, slave_id:int =
         msg = f'modbus_poll_input_registers_handler: unable to read: {num_registers} input registers at: {start_address} for slave: {slave_id}'
         LOGGER.error(msg)
         print('!', end='', flush=True)
+        record_request(0x04, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x04, start_address, num_registers, modbus_response, start)
         return
 
     if modbus_response and not modbus_response.isError():
-        LOGGER.info(f'modbus_poll_input_registers_handler: read: {num_registers} input registers at: {start_address} for slave: {slave_id}')
+        record_request(0x04, True)
+        record_transaction(modbus_tcp_client, slave_id, 0x04, start_address, num_registers, modbus_response, start)
+        log_request(LOGGER, 'modbus_poll_input_registers_handler: read: %s input registers at: %s for slave: %s', num_registers, start_address, slave_id, slave=(get_client_host(modbus_tcp_client), slave_id))
     else:
         msg = f'modbus_poll_input_registers_handler: error reading: {num_registers} input registers at: {start_address} for slave: {slave_id}'
         LOGGER.error(msg)
+        record_request(0x04, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x04, start_address, num_registers, modbus_response, start)
         print('!', end='', flush=True)
 
 
 
-async def modbus_poll_coils_handler(modbus_tcp_client, slave_id:int = SLAVE_ID):
-    LOGGER.debug(f'modbus_poll_coils_handler: slave={slave_id}')
+async def modbus_read_coils_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, start_address:int = 0x01, num_coils:int = 1):
+    LOGGER.debug('modbus_read_coils_handler: slave=%s', slave_id)
 
     # check parameters
     assert modbus_tcp_client
     assert slave_id
 
     # declare local variables
-    start_address = 0x01
-    num_coils = 1
     modbus_response = None
-    value = None
-    fifty_fifty = [True,False]
 
     # read coils
     try:
         #print('[*] reading coils')
         print('.', end='')
+        start = time.perf_counter_ns()
         modbus_response = await modbus_tcp_client.read_coils(
                     address=start_address, 
                     count=num_coils, 
                     slave=slave_id
             )
     except ModbusException as me:
-        msg = f'modbus_poll_coils_handler: unable to read: {num_coils} coils at: {start_address} for slave: {slave_id}'
+        msg = f'modbus_read_coils_handler: unable to read: {num_coils} coils at: {start_address} for slave: {slave_id}'
         LOGGER.error(msg)
         print(f'[!] {msg}')
 
     if modbus_response and not modbus_response.isError():
-        LOGGER.info(f'modbus_poll_coils_handler: read: {num_coils} coils at: {start_address}, response has {len(modbus_response.bits)}-bits for slave: {slave_id}')
+        record_request(0x01, True)
+        record_transaction(modbus_tcp_client, slave_id, 0x01, start_address, num_coils, modbus_response, start)
+        log_request(LOGGER, 'modbus_read_coils_handler: read: %s coils at: %s, response has %s-bits for slave: %s', num_coils, start_address, len(modbus_response.bits), slave_id, slave=(get_client_host(modbus_tcp_client), slave_id))
     else:
-        msg = f'modbus_poll_coils_handler: error reading: {num_coils} coils at: {start_address} for slave: {slave_id}'
+        msg = f'modbus_read_coils_handler: error reading: {num_coils} coils at: {start_address} for slave: {slave_id}'
+        LOGGER.error(msg)
+        record_request(0x01, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x01, start_address, num_coils, modbus_response, start)
+        print(f'[!] {msg}')
+
+
+async def modbus_write_coils_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, start_address:int = 0x01, value:list = None):
+    LOGGER.debug('modbus_write_coils_handler: slave=%s', slave_id)
+
+    # check parameters
+    assert modbus_tcp_client
+    assert slave_id
+
+    # declare local variables
+    modbus_response = None
+
+    try:
+        if value is None:
+            value = get_payload_pool().coil_values() # pre-generated random values from 1 to 64 bits, unless given by the traffic profile
+        #print('[*] writing coils')
+        print('.', end='')
+        start = time.perf_counter_ns()
+        modbus_response = await modbus_tcp_client.write_coils(address=start_address, values=value, slave=slave_id)
+        record_request(0x0F, bool(modbus_response and not modbus_response.isError()))
+        record_transaction(modbus_tcp_client, slave_id, 0x0F, start_address, len(value or ()), modbus_response, start)
+        log_request(LOGGER, 'modbus_write_coils_handler: wrote: %s coils to: %s at: %s for slave: %s', len(value), value, start_address, slave_id, slave=(get_client_host(modbus_tcp_client), slave_id))
+    except ModbusException as me:
+        msg = f'modbus_write_coils_handler: unable to write coils to: {value} at: {start_address} for slave: {slave_id}'
         LOGGER.error(msg)
+        record_request(0x0F, False)
+        record_transaction(modbus_tcp_client, slave_id, 0x0F, start_address, len(value or ()), modbus_response, start)
         print(f'[!] {msg}')
 
-    # randomly write coils
-    write_coils = random.choice(fifty_fifty)
-    if write_coils:
-        try:
-            value = random.choice(fifty_fifty) # random value
-            rand_len = random.choice(range(1,MAX_COIL_REG+1)) # random length from 1 to 64 bits 
-            #print('[*] writing coils')
-            print('.', end='')
-            await modbus_tcp_client.write_coils(address=start_address, values=([value]*rand_len), slave=slave_id)
-            LOGGER.info(f'modbus_poll_coils_handler: wrote: {rand_len} coils to: {value} at: {start_address} for slave: {slave_id}')
-        except ModbusException as me:
-            msg = f'modbus_poll_coils_handler: unable to write: {rand_len} coils to: {value} at: {start_address} for slave: {slave_id}'
-            LOGGER.error(msg)
-            print(f'[!] {msg}')
-
-
-async def modbus_poll(modbus_tcp_client, slave_id:int = SLAVE_ID):
+
+async def modbus_poll_coils_handler(modbus_tcp_client, slave_id:int = SLAVE_ID, traffic_group:TrafficGroup = None):
+    LOGGER.debug('modbus_poll_coils_handler: slave=%s', slave_id)
+
+    # declare local variables
+    traffic_group = traffic_group or get_traffic_profile().default_group
+
+    # read coils
+    if 0x01 in traffic_group.polled:
+        await modbus_read_coils_handler(modbus_tcp_client, slave_id, *traffic_group.take(0x01))
+
+    # randomly write coils, with the group's pre-drawn write probability
+    if 0x0F in traffic_group.polled and traffic_group.take_write():
+        await modbus_write_coils_handler(modbus_tcp_client, slave_id, *traffic_group.take(0x0F))
+
+
+# handler for each function code the open-loop load generator can issue
+FUNCTION_CODE_HANDLERS = {
+    0x01: modbus_read_coils_handler,
+    0x02: modbus_poll_discrete_input_handler,
+    0x03: modbus_read_holding_registers_handler,
+    0x04: modbus_poll_input_registers_handler,
+    0x0F: modbus_write_coils_handler,
+    0x10: modbus_write_holding_registers_handler,
+}
+
+
+async def modbus_poll_slave(modbus_tcp_client, slave_id:int, traffic_group:TrafficGroup, pipelined:bool = False):
+    # one closed-loop poll of a slave, skipping the function codes its traffic group does not poll
+    polls = [
+            modbus_poll_coils_handler(modbus_tcp_client, slave_id, traffic_group),
+            modbus_poll_holding_register_handler(modbus_tcp_client, slave_id, traffic_group),
+        ]
+    if 0x02 in traffic_group.polled:
+        polls.append(modbus_poll_discrete_input_handler(modbus_tcp_client, slave_id, *traffic_group.take(0x02)))
+    if 0x04 in traffic_group.polled:
+        polls.append(modbus_poll_input_registers_handler(modbus_tcp_client, slave_id, *traffic_group.take(0x04)))
+
+    if pipelined:
+        # issue all handlers at once, the client window bounds how many requests are on the wire
+        await asyncio.gather(*polls)
+    else:
+        for poll in polls:
+            await poll
+
+
+async def modbus_poll(modbus_tcp_client, slave_id:int = SLAVE_ID, num_runs:int = NUM_RUNS):
     LOGGER.debug('modbus_poll')
 
     # check parameters
     assert modbus_tcp_client
 
+    # declare local variables
+    traffic_group = get_traffic_profile().get_group(get_client_host(modbus_tcp_client))
+
     # do client stuff
     # TODO - maybe thread these for more chaos
-    # TODO - accept number of runs as a cli paramter, or run forever if nothing supplied
     print('[*] modbus master running: ', end='')
-    for i in range(NUM_RUNS):
-        await modbus_poll_coils_handler(modbus_tcp_client, slave_id)
-        await modbus_poll_holding_register_handler(modbus_tcp_client, slave_id)
-        await modbus_poll_discrete_input_handler(modbus_tcp_client, slave_id)
-        await modbus_poll_input_registers_handler(modbus_tcp_client, slave_id)
+    for i in range(num_runs):
+        await modbus_poll_slave(modbus_tcp_client, slave_id, traffic_group)
     print('\n[+] done!')
 
     # TODO: do something sensible here
@@ -285,7 +501,7 @@ async def modbus_poll(modbus_tcp_client, slave_id:int = SLAVE_ID):
     #    rr = await modbus_tcp_client.read_holding_registers(4, 2, slave=1)
 
 
-async def run_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:int = SLAVE_ID):
+async def run_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:int = SLAVE_ID, num_runs:int = NUM_RUNS, transport:str = TRANSPORT, histograms:str = None):
     LOGGER.debug(f'run_modbus_client: socket={ipaddr}:{port} slave={slave_id}')
 
     # check parameters
@@ -301,7 +517,7 @@ async def run_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:
         return 
 
     # get a modbus client reference
-    modbus_client = get_modbus_client(ipaddr, port)
+    modbus_client = get_modbus_client(ipaddr, port, PIPELINE_WINDOW, transport)
     if not modbus_client:
         LOGGER.error('run_modbus_client: unable to get modbus client')
         return
@@ -314,11 +530,518 @@ async def run_modbus_client(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:
         print(f'[!] {msg}')
         return 
 
-    # modbus poll
-    await modbus_poll(modbus_client, slave_id)
+    # modbus poll, reporting the latencies of each interval
+    reporter_task = asyncio.create_task(modbus_latency_reporter(REPORT_INTERVAL, histograms))
+    try:
+        await modbus_poll(modbus_client, slave_id, num_runs)
+    finally:
+        reporter_task.cancel()
+        await asyncio.gather(reporter_task, return_exceptions=True)
+
+        # close connection
+        modbus_client.close()
+
 
-    # close connection
-    modbus_client.close()
+def get_slaves_list(slaves_list:str) -> list:
+    LOGGER.debug(f'get_slaves_list: {slaves_list}')
+
+    # declare local variables
+    slaves = {} # dict used as an ordered set to remove duplicates and keep file order
+
+    # check parameters
+    if not slaves_list:
+        return []
+
+    # read line separated list of slave IP addresses, skipping blank lines and invalid addresses
+    try:
+        with open(slaves_list, 'r') as file_handle:
+            for line in file_handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ipaddress.ip_address(line)
+                    slaves[line] = None
+                except ValueError as ve:
+                    LOGGER.error(f'get_slaves_list: skipping invalid IP address: {line} in {slaves_list}')
+    except OSError as oe:
+        msg = f'get_slaves_list: unable to read slaves list: {slaves_list}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+
+    return list(slaves)
+
+
+def raise_file_limit(num_files:int):
+    LOGGER.debug(f'raise_file_limit: {num_files}')
+
+    # each connection uses a file descriptor, so raise the soft limit towards the hard limit if needed
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if num_files <= soft_limit:
+        return
+    if hard_limit != resource.RLIM_INFINITY:
+        num_files = min(num_files, hard_limit)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (num_files, hard_limit))
+        LOGGER.info(f'raise_file_limit: raised open file limit from {soft_limit} to {num_files}')
+    except (ValueError, OSError) as e:
+        LOGGER.error(f'raise_file_limit: unable to raise open file limit from {soft_limit} to {num_files}')
+
+
+async def get_modbus_client_pool(targets:list, concurrency_limit, pipeline_window:int = PIPELINE_WINDOW, transport:str = TRANSPORT) -> dict:
+    LOGGER.debug(f'get_modbus_client_pool: {len(targets)} targets')
+
+    # declare local variables
+    modbus_client_pool = {} # one connection per (ipaddr, port) socket, shared by all slave ids behind it
+
+    async def connect(ipaddr:str, port:int):
+        async with concurrency_limit:
+            modbus_client = get_modbus_client(ipaddr, port, pipeline_window, transport)
+            if not modbus_client:
+                return
+            await modbus_client.connect()
+            if not modbus_client.connected:
+                msg = f'get_modbus_client_pool: unable to connect to socket {ipaddr}:{port}'
+                LOGGER.error(msg)
+                print(f'[!] {msg}')
+                return
+            modbus_client_pool[(ipaddr, port)] = modbus_client
+
+    # connect to every unique socket, bounded by the global concurrency limit
+    sockets = {(ipaddr, port): None for ipaddr, port, slave_id in targets}
+    await asyncio.gather(*(connect(ipaddr, port) for ipaddr, port in sockets))
+    LOGGER.info(f'get_modbus_client_pool: connected to {len(modbus_client_pool)} of {len(sockets)} sockets')
+
+    return modbus_client_pool
+
+
+async def modbus_poll_worker(modbus_tcp_client, slave_id:int, num_runs:int, concurrency_limit, connection_limit, traffic_group:TrafficGroup):
+    LOGGER.debug(f'modbus_poll_worker: slave={slave_id} runs={num_runs}')
+
+    # check parameters
+    assert modbus_tcp_client
+
+    # declare local variables
+    pipelined = isinstance(modbus_tcp_client, ModbusPipelineClient) and modbus_tcp_client.window_size > 1
+
+    # each run holds a slot on both the connection and the global limit while its handlers are in-flight
+    for i in range(num_runs):
+        async with connection_limit, concurrency_limit:
+            await modbus_poll_slave(modbus_tcp_client, slave_id, traffic_group, pipelined)
+
+
+def get_function_code_mix(mix:str = FUNCTION_CODE_MIX) -> dict:
+    LOGGER.debug(f'get_function_code_mix: {mix}')
+
+    # declare local variables
+    function_code_mix = {}
+
+    # parse comma separated function_code:weight pairs e.g., 1:2,3:1,16:1
+    try:
+        for pair in mix.split(','):
+            function_code, weight = pair.split(':')
+            function_code = int(function_code, 0)
+            weight = float(weight)
+            if function_code not in FUNCTION_CODE_HANDLERS or weight < 0:
+                raise ValueError(pair)
+            function_code_mix[function_code] = weight
+    except ValueError as ve:
+        msg = f'get_function_code_mix: invalid function code mix: {mix}, expected function_code:weight pairs for function codes {list(FUNCTION_CODE_HANDLERS)}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return {}
+
+    if not sum(function_code_mix.values()):
+        LOGGER.error(f'get_function_code_mix: function code mix: {mix} has no positive weights')
+        return {}
+
+    return function_code_mix
+
+
+def get_arrival_times(arrival:str = ARRIVAL, rate:float = RATE):
+    """
+    Generator of request arrival times in seconds from the start of the run, averaging rate requests per second
+    """
+    # declare local variables
+    offset = 0.0
+
+    while True:
+        if arrival == 'poisson':
+            offset += random.expovariate(rate)
+        elif arrival == 'bursty':
+            # bursts of back to back requests with exponential gaps between bursts
+            offset += random.expovariate(rate / BURST_SIZE)
+            for i in range(BURST_SIZE - 1):
+                yield offset
+        else:
+            offset += 1.0 / rate
+        yield offset
+
+
+async def modbus_scheduled_request(handler, modbus_tcp_client, slave_id:int, scheduled:float, stats:dict, *request):
+    # latency is measured from when the request was scheduled rather than sent, so a slow server is not hidden by a late send
+    await handler(modbus_tcp_client, slave_id, *request)
+    latency = asyncio.get_running_loop().time() - scheduled
+    stats['completed'] += 1
+    stats['latency_total'] += latency
+    stats['latency_max'] = max(stats['latency_max'], latency)
+
+
+def get_profile_requests(traffic_profile:TrafficProfile, targets:list, arrivals):
+    """
+    Generator of the (offset, target index, function code, request arguments) of each open-loop request, drawn from the
+    compiled traffic profile
+    """
+    request_table = traffic_profile.compile(targets)
+    groups = [traffic_profile.get_group(ipaddr) for ipaddr, port, slave_id in targets]
+    for offset in arrivals:
+        target_idx, function_code = request_table.take()
+        yield (offset, target_idx, function_code, groups[target_idx].take(function_code))
+
+
+async def modbus_open_loop(targets:list, modbus_client_pool:dict, rate:float = RATE, arrival:str = ARRIVAL, duration:float = DURATION, traffic_profile:TrafficProfile = None, max_outstanding:int = MAX_CONCURRENCY, schedule:RequestSchedule = None):
+    LOGGER.debug(f'modbus_open_loop: rate={rate} arrival={arrival} duration={duration}')
+
+    # check parameters
+    assert modbus_client_pool
+    assert rate > 0 or schedule
+    if not traffic_profile:
+        traffic_profile = get_traffic_profile()
+
+    # declare local variables
+    loop = asyncio.get_running_loop()
+    if schedule:
+        # replay the requests of a schedule, those of slaves which are not connected, or polled by another worker, are dropped
+        rate = schedule.rate
+        arrival = 'schedule'
+        slaves = [(modbus_client_pool.get((ipaddr, port)), slave_id) for ipaddr, port, slave_id in schedule.targets]
+        requests = schedule.read_requests()
+        duration = min(duration, schedule.duration) if duration else schedule.duration
+    else:
+        targets = [(ipaddr, port, slave_id) for ipaddr, port, slave_id in targets if (ipaddr, port) in modbus_client_pool]
+        slaves = [(modbus_client_pool[(ipaddr, port)], slave_id) for ipaddr, port, slave_id in targets]
+        requests = get_profile_requests(traffic_profile, targets, get_arrival_times(arrival, rate))
+    outstanding = set()
+    stats = {'issued': 0, 'completed': 0, 'skipped': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+    interval_issued = 0
+    interval_skipped = 0
+    interval_lag = 0.0
+
+    start = loop.time()
+    offset, target_idx, function_code, request = next(requests, END_OF_REQUESTS)
+    next_report = start + REPORT_INTERVAL
+    print(f'[*] modbus master issuing {rate} requests/s ({arrival}) to {len(slaves)} slaves: ', end='')
+    try:
+        while not duration or offset < duration:
+            now = loop.time()
+
+            # issue every request that is due, whether or not earlier requests have completed
+            while start + offset <= now and (not duration or offset < duration):
+                interval_lag = max(interval_lag, now - start - offset)
+                modbus_tcp_client, slave_id = slaves[target_idx]
+                if modbus_tcp_client is None:
+                    pass # scheduled for a slave this client does not poll
+                elif len(outstanding) >= max_outstanding:
+                    stats['skipped'] += 1
+                    interval_skipped += 1
+                else:
+                    task = loop.create_task(modbus_scheduled_request(FUNCTION_CODE_HANDLERS[function_code], modbus_tcp_client, slave_id, start + offset, stats, *request))
+                    outstanding.add(task)
+                    task.add_done_callback(outstanding.discard)
+                    stats['issued'] += 1
+                    interval_issued += 1
+                offset, target_idx, function_code, request = next(requests, END_OF_REQUESTS)
+
+            # report progress, and whether the schedule is being kept
+            if now >= next_report:
+                interval_rate = interval_issued / (now - next_report + REPORT_INTERVAL)
+                latency_mean = stats['latency_total'] / stats['completed'] if stats['completed'] else 0.0
+                msg = f'modbus_open_loop: issued {interval_rate:.1f} requests/s of {rate} target, {len(outstanding)} outstanding, lag {interval_lag:.3f}s, latency mean {latency_mean:.3f}s max {stats["latency_max"]:.3f}s'
+                LOGGER.info(msg)
+                if interval_lag > MAX_LAG or interval_skipped:
+                    msg = f'{msg}, falling behind target rate, skipped {interval_skipped} requests over the {max_outstanding} outstanding limit'
+                    LOGGER.warning(msg)
+                    print(f'\n[!] {msg}')
+                interval_issued = 0
+                interval_skipped = 0
+                interval_lag = 0.0
+                next_report = now + REPORT_INTERVAL
+
+            # wait until the next request is due, or the end of the run
+            await asyncio.sleep(max(0, start + min(offset, duration or offset) - loop.time()))
+
+        # wait for the requests still in-flight
+        await asyncio.gather(*outstanding)
+    finally:
+        elapsed = loop.time() - start
+        msg = f'modbus_open_loop: issued {stats["issued"]} requests in {elapsed:.1f}s ({stats["issued"] / elapsed:.1f} requests/s of {rate} target), completed {stats["completed"]}, skipped {stats["skipped"]}'
+        LOGGER.info(msg)
+        print(f'\n[+] {msg}')
+
+    return stats
+
+
+async def run_modbus_multi_client(targets:list, num_runs:int = NUM_RUNS, max_concurrency:int = MAX_CONCURRENCY, max_per_connection:int = MAX_PER_CONNECTION, pipeline_window:int = PIPELINE_WINDOW, rate:float = RATE, arrival:str = ARRIVAL, duration:float = DURATION, function_code_mix:dict = None, payload_distributions:dict = None, transport:str = TRANSPORT, journal:str = None, histograms:str = None, traffic_profile:str = None, schedule:str = None):
+    LOGGER.debug(f'run_modbus_multi_client: {len(targets)} targets')
+
+    # check parameters
+    if not targets:
+        msg = 'run_modbus_multi_client: no slaves to poll'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return
+    if rate < 0 or arrival not in ARRIVAL_DISTRIBUTIONS or duration < 0:
+        msg = f'run_modbus_multi_client: invalid rate: {rate}, arrival distribution: {arrival} or duration: {duration}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return
+    if max_concurrency < 1 or max_per_connection < 1 or pipeline_window < 0:
+        msg = f'run_modbus_multi_client: invalid concurrency: {max_concurrency}, per connection concurrency: {max_per_connection} or pipeline window: {pipeline_window}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return
+
+    # generate this process's write payloads, in each worker process as well as a single client
+    if payload_distributions:
+        set_payload_pool(**payload_distributions)
+    if journal:
+        set_journal(journal)
+
+    # compile the traffic profile, a profile with a rate for every slave runs the open-loop load generator at that rate
+    profile = set_traffic_profile(traffic_profile, function_code_mix, **(payload_distributions or {}))
+    if not profile:
+        return
+    if not rate:
+        rate = profile.get_rate(targets)
+
+    # a request schedule replaces the profile and arrivals with the requests it was generated with
+    request_schedule = None
+    if schedule:
+        request_schedule = open_schedule(schedule)
+        if not request_schedule:
+            return
+
+    # each poll has up to four requests in-flight when pipelined, so run enough polls per connection to fill the window
+    if pipeline_window:
+        max_per_connection = max(max_per_connection, math.ceil(pipeline_window / 4))
+
+    # declare local variables
+    concurrency_limit = asyncio.Semaphore(max_concurrency)
+    connection_limits = {}
+    workers = []
+
+    # connect a pool of clients, one per socket
+    raise_file_limit(len(targets) + 64)
+    modbus_client_pool = await get_modbus_client_pool(targets, concurrency_limit, pipeline_window, transport)
+    if not modbus_client_pool:
+        LOGGER.error('run_modbus_multi_client: unable to connect to any slaves')
+        if request_schedule:
+            request_schedule.close()
+        return
+
+    # report the latencies of each interval while polling
+    reporter_task = asyncio.create_task(modbus_latency_reporter(REPORT_INTERVAL, histograms))
+    try:
+        # open-loop load generator issues requests on a schedule instead of running polls back to back
+        if rate or request_schedule:
+            await modbus_open_loop(targets, modbus_client_pool, rate, arrival, duration, profile, max_concurrency, request_schedule)
+            return
+
+        # spread the runs for each slave across workers, at most max_per_connection per connection
+        for ipaddr, port, slave_id in targets:
+            modbus_client = modbus_client_pool.get((ipaddr, port))
+            if not modbus_client:
+                continue
+            connection_limit = connection_limits.setdefault((ipaddr, port), asyncio.Semaphore(max_per_connection))
+            num_workers = min(max_per_connection, num_runs)
+            for worker_idx in range(num_workers):
+                worker_runs = num_runs // num_workers + (1 if worker_idx < num_runs % num_workers else 0)
+                workers.append(modbus_poll_worker(modbus_client, slave_id, worker_runs, concurrency_limit, connection_limit, profile.get_group(ipaddr)))
+
+        # modbus poll all slaves from this event loop
+        print(f'[*] modbus master polling {len(targets)} slaves over {len(modbus_client_pool)} connections: ', end='')
+        await asyncio.gather(*workers)
+        print('\n[+] done!')
+    finally:
+        # stop reporting, then close connections
+        reporter_task.cancel()
+        await asyncio.gather(reporter_task, return_exceptions=True)
+        for modbus_client in modbus_client_pool.values():
+            modbus_client.close()
+        if request_schedule:
+            request_schedule.close()
+
+
+def get_modbus_targets(slaves:list, port:int = TCP_PORT, slave_id:int = SLAVE_ID, num_units:int = NUM_UNITS) -> list:
+    LOGGER.debug(f'get_modbus_targets: {len(slaves)} slaves, units {slave_id} - {slave_id + num_units - 1}')
+
+    # one target per unit id behind each slave address, the unit ids share the connection to the address
+    unit_ids = range(slave_id, min(slave_id + max(num_units, 1), MAX_UNITS + 1))
+    return [(slave_ip, int(port), unit_id) for slave_ip in slaves for unit_id in unit_ids]
+
+
+def get_target_partitions(targets:list, num_workers:int = WORKERS) -> list:
+    LOGGER.debug(f'get_target_partitions: {len(targets)} targets across {num_workers} workers')
+
+    # declare local variables
+    sockets = {}
+    partitions = [[] for i in range(num_workers)]
+
+    # keep every slave id behind the same socket on one worker so they share its connection
+    for target in targets:
+        ipaddr, port, slave_id = target
+        sockets.setdefault((ipaddr, port), []).append(target)
+
+    # deal sockets out round robin so each worker gets an even share
+    for socket_idx, socket_targets in enumerate(sockets.values()):
+        partitions[socket_idx % num_workers].extend(socket_targets)
+
+    return [partition for partition in partitions if partition]
+
+
+def get_request_totals(worker_counts:dict) -> dict:
+    # sum the request counts reported by each worker per function code
+    totals = {}
+    for counts in worker_counts.values():
+        for function_code, (ok, errors) in counts.items():
+            total = totals.setdefault(function_code, [0, 0])
+            total[0] += ok
+            total[1] += errors
+    return totals
+
+
+def modbus_worker_main(worker_idx:int, targets:list, client_args:dict, log_args:dict, stats_queue, stop_event):
+    # the parent handles ctrl-c and tells the workers to stop through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(**log_args)
+    try:
+        asyncio.run(run_modbus_worker(worker_idx, targets, client_args, stats_queue, stop_event))
+    finally:
+        # worker processes exit without running atexit handlers
+        close_journal()
+        stop_logging()
+
+
+async def run_modbus_worker(worker_idx:int, targets:list, client_args:dict, stats_queue, stop_event):
+    LOGGER.debug(f'run_modbus_worker: worker {worker_idx} polling {len(targets)} targets')
+
+    # poll this worker's share of the slaves, sending counter updates to the parent until done or told to stop
+    client_task = asyncio.create_task(run_modbus_multi_client(targets, **client_args))
+    try:
+        while not client_task.done():
+            await asyncio.wait({client_task}, timeout=WORKER_POLL_INTERVAL)
+            stats_queue.put((worker_idx, False, dict(REQUEST_COUNTS), None))
+            if stop_event.is_set():
+                client_task.cancel()
+    finally:
+        stats_queue.put((worker_idx, True, dict(REQUEST_COUNTS), LATENCY_RECORDER.to_dict()))
+
+
+async def run_modbus_workers(targets:list, num_workers:int = WORKERS, client_args:dict = None, log_args:dict = None):
+    LOGGER.debug(f'run_modbus_workers: {num_workers} workers')
+
+    # check parameters
+    if num_workers < 1:
+        msg = f'run_modbus_workers: invalid number of workers: {num_workers}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return
+
+    # declare local variables
+    client_args = dict(client_args or {})
+    log_args = dict(log_args or {'log_file': LOG_FILE})
+    partitions = get_target_partitions(targets, num_workers)
+    mp_context = multiprocessing.get_context('spawn') # fresh interpreter per worker, nothing inherited from this event loop
+    stats_queue = mp_context.Queue()
+    stop_event = mp_context.Event()
+    workers = []
+    worker_counts = {} # worker index -> latest request counts
+    finished = set()
+
+    if not partitions:
+        msg = 'run_modbus_workers: no slaves to poll'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return
+
+    # the open-loop target rate is for the whole client, so split it across the workers
+    client_args['rate'] = client_args.get('rate', RATE) / len(partitions)
+
+    def drain_stats_queue():
+        while True:
+            try:
+                worker_idx, done, counts, latencies = stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            worker_counts[worker_idx] = counts
+            if done:
+                finished.add(worker_idx)
+                LATENCY_RECORDER.merge(LatencyRecorder.from_dict(latencies))
+
+    def report(prefix:str, elapsed:float):
+        totals = get_request_totals(worker_counts)
+        ok = sum(total[0] for total in totals.values())
+        errors = sum(total[1] for total in totals.values())
+        by_function_code = ', '.join(f'fc {function_code}: {total[0]}/{total[1]}' for function_code, total in sorted(totals.items()))
+        msg = f'run_modbus_workers: {len(partitions) - len(finished)} of {len(partitions)} workers running, {ok} ok, {errors} errors, {ok / elapsed if elapsed else 0:.1f} requests/s (ok/errors {by_function_code})'
+        LOGGER.info(msg)
+        print(f'\n{prefix} {msg}')
+
+    # start one worker process per partition of the slaves, each with its own journal and histogram file
+    for worker_idx, partition in enumerate(partitions):
+        worker_args = dict(client_args)
+        for file_arg in ('journal', 'histograms'):
+            if client_args.get(file_arg):
+                worker_args[file_arg] = f'{client_args[file_arg]}_w{worker_idx}'
+        worker = mp_context.Process(
+                target=modbus_worker_main,
+                args=(worker_idx, partition, worker_args, log_args, stats_queue, stop_event),
+                name=f'proto_client worker {worker_idx}'
+            )
+        worker.start()
+        workers.append(worker)
+    LOGGER.info(f'run_modbus_workers: started {len(workers)} workers for {len(targets)} targets')
+
+    # stop the workers on SIGTERM as well as ctrl-c, shutting down as if they had finished
+    terminated = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, terminated.set)
+
+    start = time.monotonic()
+    next_report = start + REPORT_INTERVAL
+    try:
+        while len(finished) < len(workers) and not terminated.is_set():
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+            drain_stats_queue()
+
+            # a worker which exits without reporting it is done has failed
+            for worker_idx, worker in enumerate(workers):
+                if worker_idx not in finished and not worker.is_alive():
+                    msg = f'run_modbus_workers: worker {worker_idx} exited with code {worker.exitcode}'
+                    LOGGER.error(msg)
+                    print(f'\n[!] {msg}')
+                    finished.add(worker_idx)
+
+            now = time.monotonic()
+            if now >= next_report:
+                report('[*]', now - start)
+                next_report = now + REPORT_INTERVAL
+        if terminated.is_set():
+            LOGGER.info('run_modbus_workers: terminated')
+    finally:
+        # ask the workers to stop, then terminate any which do not
+        loop.remove_signal_handler(signal.SIGTERM)
+        stop_event.set()
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        for worker in workers:
+            if worker.is_alive():
+                LOGGER.error(f'run_modbus_workers: terminating {worker.name}')
+                worker.terminate()
+                worker.join()
+        drain_stats_queue()
+        report('[+]', time.monotonic() - start)
 
 
 async def run_main():
@@ -332,8 +1055,35 @@ async def run_main():
     parser.add_argument('-i', '--ipaddr', help='ip address to poll, default = "127.0.0.1"') 
     parser.add_argument('-p', '--port', help='port to connect to, default = 502') 
     parser.add_argument('-s', '--slave', help='slave ID to connect to, default = 0x01') 
+    parser.add_argument('-u', '--units', type=int, default=NUM_UNITS, help=f'number of unit ids to spread polls across behind each slave, starting at the slave id, default = {NUM_UNITS}') 
+    parser.add_argument('-l', '--slaves_list', help='file containing line separated list of slave IP addresses to poll from a single process, overrides -i') 
+    parser.add_argument('-c', '--concurrency', type=int, default=MAX_CONCURRENCY, help=f'max number of in-flight polls across all slaves, default = {MAX_CONCURRENCY}') 
+    parser.add_argument('-k', '--per_connection', type=int, default=MAX_PER_CONNECTION, help=f'max number of in-flight polls per connection, default = {MAX_PER_CONNECTION}') 
+    parser.add_argument('-P', '--pipeline', type=int, default=PIPELINE_WINDOW, help=f'max number of in-flight requests per connection matched by transaction id, 0 to wait for each response, default = {PIPELINE_WINDOW}') 
+    parser.add_argument('-n', '--runs', type=int, default=NUM_RUNS, help=f'number of closed-loop polls of each slave, ignored if a rate is given, default = {NUM_RUNS}') 
+    parser.add_argument('-r', '--rate', type=float, default=RATE, help='target requests per second across all slaves for the open-loop load generator, default = 0 i.e., closed-loop polls') 
+    parser.add_argument('-a', '--arrival', choices=ARRIVAL_DISTRIBUTIONS, default=ARRIVAL, help=f'open-loop request arrival distribution, default = "{ARRIVAL}"') 
+    parser.add_argument('-t', '--duration', type=float, default=DURATION, help='seconds to run the open-loop load generator for, default = 0 i.e., run forever') 
+    parser.add_argument('-m', '--mix', default=FUNCTION_CODE_MIX, help=f'function_code:weight mix of the open-loop requests, closed-loop polls skip the function codes given no weight, default = "{FUNCTION_CODE_MIX}"') 
+    parser.add_argument('-w', '--workers', type=int, default=WORKERS, help=f'number of worker processes to partition the slaves across, the rate is split between them, default = {WORKERS}') 
+    parser.add_argument('-f', '--floats', default=FLOAT_DISTRIBUTION, help=f'distribution of the floats written to holding registers, uniform:low:high, normal:mean:std or constant:value, default = "{FLOAT_DISTRIBUTION}"') 
+    parser.add_argument('-b', '--coils', default=COIL_DISTRIBUTION, help=f'distribution of the coils written, same:p for one value per write or bernoulli:p for each coil, True with probability p, default = "{COIL_DISTRIBUTION}"') 
+    parser.add_argument('-T', '--transport', choices=TRANSPORTS, default=TRANSPORT, help=f'build and parse frames with pymodbus objects, or with the raw struct codec, default = "{TRANSPORT}"') 
+    parser.add_argument('-L', '--log_level', choices=LOG_LEVELS, default=LOG_LEVEL, help=f'log level, WARNING or above skips the per request records, default = "{LOG_LEVEL}"') 
+    parser.add_argument('-S', '--log_sample', type=int, default=LOG_SAMPLE, help=f'log 1 in every N per request records, default = {LOG_SAMPLE} i.e., every request') 
+    parser.add_argument('-D', '--log_dir', help='directory to write per request records to, in a log file per slave and unit id, default = the one log file') 
+    parser.add_argument('-H', '--histograms', help=f'append the latency histograms of every {REPORT_INTERVAL}s interval, and of the whole run at exit, to this file as JSON lines, default = not written') 
+    parser.add_argument('-F', '--profile', help='JSON or TOML traffic profile of the function codes, addresses, counts, write probability, values and rates per group of slaves, see proto_profile.py, default = -m, -f and -b for every slave') 
+    parser.add_argument('-W', '--write_schedule', help='write every request of an open-loop run of -t seconds at -r requests/s to this request schedule file e.g., schedule.bin, then exit, default = no schedule') 
+    parser.add_argument('-R', '--schedule', help='replay the requests of this request schedule file to the slaves it was written for, overrides -i, -l, -r, -a and -F, default = no schedule') 
+    parser.add_argument('-e', '--seed', type=int, help='seed of the schedule written by -W, the same seed, options and slaves write the same schedule, default = a random seed, reported') 
+    parser.add_argument('-J', '--journal', help='append a binary record of every request to this rotating journal e.g., proto_client.journal, read with proto_journal.py, default = no journal') 
     args = parser.parse_args()
 
+    # hand log records to a writer thread, in each worker process as well as this one
+    log_args = {'log_file': LOG_FILE, 'level': args.log_level, 'log_dir': args.log_dir, 'sample': args.log_sample}
+    setup_logging(**log_args)
+
     # declare local variables
     ipaddr = None
     port = None
@@ -355,11 +1105,78 @@ async def run_main():
     else:
         slave_id = int(args.slave)
 
-    # run the client
-    await run_modbus_client(ipaddr, port, slave_id)
+    function_code_mix = get_function_code_mix(args.mix)
+    if not function_code_mix:
+        return
+
+    if not get_distribution(args.floats, FLOAT_DISTRIBUTIONS) or not get_distribution(args.coils, COIL_DISTRIBUTIONS):
+        return
+    payload_distributions = {'floats': args.floats, 'coils': args.coils}
+
+    # write a schedule of the run instead of running it
+    if args.write_schedule:
+        slaves = get_slaves_list(args.slaves_list) if args.slaves_list else [ipaddr]
+        targets = get_modbus_targets(slaves, port, slave_id, args.units)
+        seed = args.seed if args.seed is not None else get_schedule_seed()
+        traffic_profile = load_traffic_profile(args.profile, function_code_mix, args.floats, args.coils, seed=seed)
+        if traffic_profile:
+            write_schedule(args.write_schedule, targets, traffic_profile, args.rate or traffic_profile.get_rate(targets), args.arrival, args.duration, seed)
+        return
+
+    # run the client, polling every slave in the slaves list from this process, or from worker processes, if one is supplied
+    start = time.monotonic()
+    try:
+        if args.slaves_list or args.pipeline or args.rate or args.workers > 1 or args.units > 1 or args.profile or args.schedule:
+            if args.slaves_list:
+                targets = get_modbus_targets(get_slaves_list(args.slaves_list), port, slave_id, args.units)
+            else:
+                targets = get_modbus_targets([ipaddr], port, slave_id, args.units)
+
+            # replay a schedule to the slaves it was written for
+            if args.schedule:
+                request_schedule = open_schedule(args.schedule)
+                if not request_schedule:
+                    return
+                targets = request_schedule.targets
+                request_schedule.close()
+            client_args = {
+                    'num_runs': args.runs,
+                    'max_concurrency': args.concurrency,
+                    'max_per_connection': args.per_connection,
+                    'pipeline_window': args.pipeline,
+                    'rate': args.rate,
+                    'arrival': args.arrival,
+                    'duration': args.duration,
+                    'function_code_mix': function_code_mix,
+                    'payload_distributions': payload_distributions,
+                    'transport': args.transport,
+                    'journal': args.journal,
+                    'histograms': args.histograms,
+                    'traffic_profile': args.profile,
+                    'schedule': args.schedule,
+                }
+            if args.workers > 1:
+                await run_modbus_workers(targets, args.workers, client_args, log_args)
+            else:
+                await run_modbus_multi_client(targets, **client_args)
+        else:
+            set_payload_pool(**payload_distributions)
+            if not set_traffic_profile(None, function_code_mix, **payload_distributions):
+                return
+            if args.journal:
+                set_journal(args.journal)
+            await run_modbus_client(ipaddr, port, slave_id, args.runs, args.transport, args.histograms)
+    finally:
+        # latency percentiles, throughput and errors of every request made, by this process or its workers
+        report = get_latency_report(LATENCY_RECORDER, time.monotonic() - start)
+        LOGGER.info(f'run_main: request latencies\n{report}')
+        print(f'\n[+] request latencies:\n{report}')
 
 
 if __name__ == "__main__":
     LOGGER.debug('proto_client starting')
-    asyncio.run(run_main(), debug=True)
+    try:
+        asyncio.run(run_main(), debug=True)
+    except KeyboardInterrupt:
+        LOGGER.info('proto_client interrupted')
     LOGGER.debug('proto_client stopped')
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from pymodbus.exceptions import ConnectionException
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.exceptions import ParameterException
+
+from proto_transport import ModbusPipelineClient
+from proto_transport import PIPELINE_WINDOW
+from proto_transport import PIPELINE_TIMEOUT
+from proto_transport import COMMS_NAME
+from proto_datastore import BYTE_TO_BITS
+from proto_datastore import pack_bits
+
+
+import logging
+import asyncio
+import itertools
+import struct
+
+
+# declare contants
+
+MBAP_HEADER = struct.Struct('>HHH') # transaction id, protocol id, length of the unit id and pdu
+MBAP_SIZE = 7 # MBAP header including the unit id
+PROTOCOL_ID = 0
+
+MAX_READ_REGISTERS = 125
+MAX_WRITE_REGISTERS = 123
+MAX_WRITE_COILS = 1968
+
+# read requests and single writes share a layout: MBAP header, function code, address and count or value
+REQUEST_STRUCT = struct.Struct('>HHHBBHH')
+REQUEST_LENGTH = 6
+# multiple writes: MBAP header, function code, address, count and byte count, followed by the values
+WRITE_MULTIPLE_STRUCT = struct.Struct('>HHHBBHHB')
+WRITE_REGISTERS_STRUCTS = [struct.Struct(f'>HHHBBHHB{count}H') for count in range(MAX_WRITE_REGISTERS + 1)]
+REGISTER_STRUCTS = [struct.Struct(f'>{count}H') for count in range(MAX_READ_REGISTERS + 1)]
+ADDRESS_VALUE_STRUCT = struct.Struct('>HH')
+
+COIL_ON = 0xFF00
+COIL_OFF = 0x0000
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Raw modbus TCP codec
+
+Packs request frames for function codes 1 - 6, 15 and 16 with one call to a precompiled struct, and parses response frames
+with struct.unpack_from on a memoryview of the receive buffer, without building pymodbus request, response or framer objects.
+
+| Function code | Request                                   | Response                            |
+| ---           | ---                                       | ---                                 |
+| 0x01, 0x02    | address, count                            | byte count, packed bits             |
+| 0x03, 0x04    | address, count                            | byte count, registers               |
+| 0x05, 0x06    | address, value                            | address, value echoed               |
+| 0x0F          | address, count, byte count, packed bits   | address, count                      |
+| 0x10          | address, count, byte count, registers     | address, count                      |
+| fc + 0x80     |                                           | exception code                      |
+"""
+
+
+class RawResponse:
+    """
+    Decoded response with the attributes the poll handlers use from pymodbus responses
+    """
+
+    __slots__ = ('function_code', 'exception_code', 'registers', 'bits', 'address', 'value', 'slave_id', 'transaction_id')
+
+    def __init__(self, function_code:int, slave_id:int = 0, transaction_id:int = 0):
+        self.function_code = function_code
+        self.exception_code = None
+        self.registers = []
+        self.bits = []
+        self.address = None
+        self.value = None
+        self.slave_id = slave_id
+        self.transaction_id = transaction_id
+
+    def isError(self) -> bool:
+        return self.exception_code is not None
+
+    def __repr__(self):
+        if self.exception_code is not None:
+            return f'RawResponse(function_code={self.function_code:#04x}, exception_code={self.exception_code})'
+        return f'RawResponse(function_code={self.function_code:#04x}, registers={self.registers}, bits={self.bits})'
+
+
+def encode_request(transaction_id:int, slave_id:int, function_code:int, address:int, count_or_value:int) -> bytes:
+    # read request for function codes 1 - 4, or a single write for 5 and 6
+    return REQUEST_STRUCT.pack(transaction_id, PROTOCOL_ID, REQUEST_LENGTH, slave_id, function_code, address, count_or_value)
+
+
+def encode_write_registers(transaction_id:int, slave_id:int, address:int, values:list) -> bytes:
+    count = len(values)
+    if not 1 <= count <= MAX_WRITE_REGISTERS:
+        raise ParameterException(f'encode_write_registers: invalid number of registers: {count}, expected 1 - {MAX_WRITE_REGISTERS}')
+    return WRITE_REGISTERS_STRUCTS[count].pack(transaction_id, PROTOCOL_ID, REQUEST_LENGTH + 1 + 2 * count, slave_id, 0x10, address, count, 2 * count, *values)
+
+
+def encode_write_coils(transaction_id:int, slave_id:int, address:int, values:list) -> bytes:
+    count = len(values)
+    if not 1 <= count <= MAX_WRITE_COILS:
+        raise ParameterException(f'encode_write_coils: invalid number of coils: {count}, expected 1 - {MAX_WRITE_COILS}')
+    byte_count = -(-count // 8)
+    header = WRITE_MULTIPLE_STRUCT.pack(transaction_id, PROTOCOL_ID, REQUEST_LENGTH + 1 + byte_count, slave_id, 0x0F, address, count, byte_count)
+    return header + pack_bits(values).to_bytes(byte_count, 'little')
+
+
+def decode_response(pdu:memoryview, slave_id:int = 0, transaction_id:int = 0) -> RawResponse:
+    # decode a response pdu, raising struct.error or IndexError if it is truncated
+    function_code = pdu[0]
+    response = RawResponse(function_code & 0x7F, slave_id, transaction_id)
+    if function_code & 0x80:
+        response.exception_code = pdu[1]
+    elif function_code in (0x01, 0x02):
+        response.bits = list(itertools.chain.from_iterable(map(BYTE_TO_BITS.__getitem__, pdu[2:2 + pdu[1]])))
+    elif function_code in (0x03, 0x04):
+        response.registers = list(REGISTER_STRUCTS[pdu[1] // 2].unpack_from(pdu, 2))
+    else:
+        response.address, response.value = ADDRESS_VALUE_STRUCT.unpack_from(pdu, 1)
+    return response
+
+
+class ModbusRawProtocol(asyncio.Protocol):
+    """
+    asyncio protocol which parses every complete response frame in the receive buffer in place and resolves the pending
+    request with the same transaction id
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.databuffer = bytearray()
+        self.pending = {} # transaction id -> future for the response
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        databuffer = self.databuffer
+        databuffer += data
+        offset = 0
+        size = len(databuffer)
+
+        # walk the complete frames, then drop them from the buffer in one go once the view is released
+        with memoryview(databuffer) as view:
+            while size - offset > MBAP_SIZE:
+                transaction_id, protocol_id, length = MBAP_HEADER.unpack_from(view, offset)
+                if protocol_id != PROTOCOL_ID or length < 2:
+                    # the frame boundaries are lost, so drop the connection and let connection_lost fail the pending requests
+                    msg = f'ModbusRawProtocol: invalid MBAP header, protocol id: {protocol_id}, length: {length}, closing connection'
+                    LOGGER.error(msg)
+                    print(f'[!] {msg}')
+                    offset = size
+                    if self.transport:
+                        self.transport.close()
+                    break
+                end = offset + 6 + length
+                if end > size:
+                    break
+
+                response_future = self.pending.pop(transaction_id, None)
+                if not response_future or response_future.done():
+                    LOGGER.error(f'ModbusRawProtocol: discarding response for unknown transaction id: {transaction_id}')
+                else:
+                    try:
+                        response_future.set_result(decode_response(view[offset + MBAP_SIZE:end], view[offset + 6], transaction_id))
+                    except (struct.error, IndexError) as e:
+                        response_future.set_exception(ModbusIOException(f'unable to decode response for transaction id: {transaction_id}: {e}'))
+                offset = end
+        del databuffer[:offset]
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+        # fail every outstanding request, the caller decides whether to reconnect
+        for response_future in self.pending.values():
+            if not response_future.done():
+                response_future.set_exception(ConnectionException(f'connection lost: {exc}'))
+        self.pending.clear()
+
+
+class ModbusRawClient(ModbusPipelineClient):
+    """
+    Modbus TCP client which packs and parses frames with the raw codec, with the read_*/write_* methods the poll handlers
+    use. Up to window requests are kept in-flight on the connection, a window of 1 waits for each response
+    """
+
+    protocol_class = ModbusRawProtocol
+
+    def __init__(self, host:str, port:int, window:int = PIPELINE_WINDOW, timeout:float = PIPELINE_TIMEOUT, name:str = COMMS_NAME):
+        super().__init__(host, port, max(1, window), timeout, name)
+
+    async def request(self, encode, *args) -> RawResponse:
+        async with self.window:
+            if not self.connected:
+                raise ConnectionException(f'not connected to {self.host}:{self.port}')
+
+            # send the frame and wait for the response with the same transaction id, encoding first so an invalid request leaves nothing pending
+            transaction_id = self.get_transaction_id()
+            frame = encode(transaction_id, *args)
+            response_future = asyncio.get_running_loop().create_future()
+            self.protocol.pending[transaction_id] = response_future
+            self.protocol.transport.write(frame)
+            try:
+                return await asyncio.wait_for(response_future, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.protocol.pending.pop(transaction_id, None)
+                raise ModbusIOException(f'no response from {self.host}:{self.port} for transaction id: {transaction_id}')
+
+    async def read_coils(self, address:int, count:int = 1, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_request, slave, 0x01, address, count)
+
+    async def read_discrete_inputs(self, address:int, count:int = 1, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_request, slave, 0x02, address, count)
+
+    async def read_holding_registers(self, address:int, count:int = 1, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_request, slave, 0x03, address, count)
+
+    async def read_input_registers(self, address:int, count:int = 1, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_request, slave, 0x04, address, count)
+
+    async def write_coil(self, address:int, value:bool, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_request, slave, 0x05, address, COIL_ON if value else COIL_OFF)
+
+    async def write_register(self, address:int, value:int, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_request, slave, 0x06, address, value)
+
+    async def write_coils(self, address:int, values:list, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_write_coils, slave, address, values)
+
+    async def write_registers(self, address:int, values:list, slave:int = 1, **kwargs) -> RawResponse:
+        return await self.request(encode_write_registers, slave, address, values)
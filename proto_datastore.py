@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from pymodbus.datastore.store import BaseModbusDataBlock
+
+
+import logging
+import itertools
+import struct
+import functools
+import sys
+from array import array
+
+
+# declare contants
+
+REG_TYPECODE = 'H' # unsigned 16-bit registers, 2 bytes each
+BITS_PER_BYTE = 8
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Compact register datastore
+
+ModbusSequentialDataBlock keeps a python list with one int object reference per register or bit, which is 8 bytes for
+small cached ints and 36 bytes once a register holds anything larger than 256. The blocks below keep registers in an
+array('H') at 2 bytes per register and coils and discrete inputs packed 8 to a byte, and read and write ranges with slices
+instead of per element python loops. Both can also toggle every other value in a range with a single XOR of the range as
+one integer, which the server's register update engine uses to change whole blocks each tick.
+
+| Block                     | Storage     | Bytes per value |
+| ---                       | ---         | ---             |
+| ModbusSequentialDataBlock | list of int | 8 - 36          |
+| ModbusArrayDataBlock      | array('H')  | 2               |
+| ModbusBitArrayDataBlock   | bytearray   | 1/8             |
+"""
+
+
+# lookup of the 8 bits in each byte value, lowest address first as on the wire
+BYTE_TO_BITS = [tuple(bool(byte >> bit & 1) for bit in range(BITS_PER_BYTE)) for byte in range(256)]
+
+
+def unpack_bits(data:bytes) -> list:
+    # expand packed bytes to a list of bools, 8 at a time
+    return list(itertools.chain.from_iterable(map(BYTE_TO_BITS.__getitem__, data)))
+
+
+# maps a zero byte to '0' and any other byte to '1'
+BYTE_TO_DIGIT = b'0' + b'1' * 255
+
+
+def pack_bits(values) -> int:
+    # one byte per bit, translated to a binary string and parsed as an int with the lowest address in the lowest bit
+    try:
+        flags = bytes(values)
+    except (ValueError, TypeError):
+        flags = bytes(map(bool, values))
+    return int(flags.translate(BYTE_TO_DIGIT)[::-1] or b'0', 2)
+
+
+@functools.lru_cache(maxsize=None)
+def get_toggle_mask(count:int, parity:int, width:int) -> int:
+    # integer with the low bit of every other width-bit value set, starting from value parity, for count values, built as a
+    # binary string with the first value in the last (lowest) bits
+    values = ['0' * (width - 1) + ('1' if index % 2 == parity else '0') for index in range(count)]
+    return int(''.join(reversed(values)) or '0', 2)
+
+
+def get_block_size(block) -> int:
+    # number of values in a block, ModbusSequentialDataBlock has no len() so count its list instead
+    if hasattr(block, '__len__'):
+        return len(block)
+    return len(block.values)
+
+
+def toggle_values(block, address:int, count:int, parity:int = 0):
+    # toggle every other value from address + parity, with a per value fallback for blocks without a toggle e.g.,
+    # ModbusSequentialDataBlock
+    if hasattr(block, 'toggle'):
+        block.toggle(address, count, parity)
+        return
+    start = address - block.address
+    block.values[start + parity:start + count:2] = [not bool(value) for value in block.values[start + parity:start + count:2]]
+
+
+class ModbusArrayDataBlock(BaseModbusDataBlock):
+    """
+    Register data block backed by an array('H'), values is either the number of registers or their initial values
+    """
+
+    def __init__(self, address:int, values, default_value:int = 0):
+        self.address = address
+        self.default_value = default_value
+        if isinstance(values, int):
+            self.values = array(REG_TYPECODE, [default_value]) * values
+        else:
+            self.values = array(REG_TYPECODE, values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return enumerate(self.values, self.address)
+
+    def reset(self):
+        self.values = array(REG_TYPECODE, [self.default_value]) * len(self.values)
+
+    def validate(self, address:int, count:int = 1) -> bool:
+        return self.address <= address and address + count <= self.address + len(self.values)
+
+    def getValues(self, address:int, count:int = 1) -> list:
+        start = address - self.address
+        return self.values[start:start + count].tolist()
+
+    def setValues(self, address:int, values):
+        if isinstance(values, int):
+            values = [values]
+
+        # pack straight into the array's buffer rather than building an intermediate array
+        start = address - self.address
+        if start + len(values) > len(self.values):
+            self.values.extend(array(REG_TYPECODE, [self.default_value]) * (start + len(values) - len(self.values)))
+        struct.pack_into(f'={len(values)}{REG_TYPECODE}', self.values, start * self.values.itemsize, *values)
+
+    def get_bytes(self, address:int, count:int) -> bytes:
+        # count registers from address as big endian bytes, as in a read registers response
+        start = address - self.address
+        values = self.values[start:start + count]
+        if sys.byteorder == 'little':
+            values.byteswap()
+        return values.tobytes()
+
+    def set_bytes(self, address:int, data):
+        # write registers from big endian bytes, as in a write multiple registers request
+        values = array(REG_TYPECODE)
+        values.frombytes(data)
+        if sys.byteorder == 'little':
+            values.byteswap()
+        start = address - self.address
+        self.values[start:start + len(values)] = values
+
+    def toggle(self, address:int, count:int, parity:int = 0):
+        # XOR 1 into every other register as one integer over the bytes of the range, registers holding 0 or 1 are
+        # inverted as with not bool(value)
+        start = address - self.address
+        itemsize = self.values.itemsize
+        mask = get_toggle_mask(count, parity, itemsize * BITS_PER_BYTE)
+        if sys.byteorder == 'big':
+            mask <<= BITS_PER_BYTE * (itemsize - 1) # the low bit of each register is in its last byte
+        with memoryview(self.values) as view:
+            with view.cast('B')[start * itemsize:(start + count) * itemsize] as data:
+                data[:] = (int.from_bytes(data, 'little') ^ mask).to_bytes(len(data), 'little')
+
+
+class ModbusBitArrayDataBlock(BaseModbusDataBlock):
+    """
+    Coil and discrete input data block with bits packed 8 to a byte in a bytearray, values is either the number of bits or their
+    initial values
+    """
+
+    def __init__(self, address:int, values, default_value:bool = False):
+        self.address = address
+        self.default_value = bool(default_value)
+        if isinstance(values, int):
+            self.size = values
+            self.bits = bytearray(b'\xff' if self.default_value else b'\x00') * -(-values // BITS_PER_BYTE)
+        else:
+            values = list(values)
+            self.size = len(values)
+            self.bits = bytearray(pack_bits(values).to_bytes(-(-self.size // BITS_PER_BYTE), 'little'))
+
+    @property
+    def values(self) -> list:
+        return unpack_bits(self.bits)[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return enumerate(self.values, self.address)
+
+    def reset(self):
+        self.bits = bytearray(b'\xff' if self.default_value else b'\x00') * len(self.bits)
+
+    def validate(self, address:int, count:int = 1) -> bool:
+        return self.address <= address and address + count <= self.address + self.size
+
+    def getValues(self, address:int, count:int = 1) -> list:
+        start = address - self.address
+        offset = start % BITS_PER_BYTE
+        first_byte = start // BITS_PER_BYTE
+        last_byte = -(-(start + count) // BITS_PER_BYTE)
+        return unpack_bits(self.bits[first_byte:last_byte])[offset:offset + count]
+
+    def setValues(self, address:int, values):
+        if isinstance(values, (int, bool)):
+            values = [values]
+        if not values:
+            return
+
+        self.merge_bits(address, len(values), pack_bits(values))
+
+    def merge_bits(self, address:int, count:int, new:int):
+        # merge count new bits into the bytes they span as one integer, leaving the bits either side untouched
+        start = address - self.address
+        offset = start % BITS_PER_BYTE
+        first_byte = start // BITS_PER_BYTE
+        last_byte = -(-(start + count) // BITS_PER_BYTE)
+        current = int.from_bytes(self.bits[first_byte:last_byte], 'little')
+        mask = ((1 << count) - 1) << offset
+        new = (new << offset) & mask
+        self.bits[first_byte:last_byte] = ((current & ~mask) | new).to_bytes(last_byte - first_byte, 'little')
+
+    def get_bytes(self, address:int, count:int) -> bytes:
+        # count bits from address packed lowest address first, as in a read coils response
+        start = address - self.address
+        first_byte = start // BITS_PER_BYTE
+        last_byte = -(-(start + count) // BITS_PER_BYTE)
+        value = int.from_bytes(self.bits[first_byte:last_byte], 'little') >> (start % BITS_PER_BYTE)
+        return (value & ((1 << count) - 1)).to_bytes(-(-count // BITS_PER_BYTE), 'little')
+
+    def set_bytes(self, address:int, count:int, data):
+        # write count bits packed lowest address first, as in a write multiple coils request
+        self.merge_bits(address, count, int.from_bytes(data, 'little'))
+
+    def toggle(self, address:int, count:int, parity:int = 0):
+        # XOR every other bit of the range as one integer over the bytes it spans
+        start = address - self.address
+        offset = start % BITS_PER_BYTE
+        first_byte = start // BITS_PER_BYTE
+        last_byte = -(-(start + count) // BITS_PER_BYTE)
+        current = int.from_bytes(self.bits[first_byte:last_byte], 'little')
+        mask = get_toggle_mask(count, parity, 1) << offset
+        self.bits[first_byte:last_byte] = (current ^ mask).to_bytes(last_byte - first_byte, 'little')
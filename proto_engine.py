@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from pymodbus.device import DeviceInformationFactory
+from pymodbus.exceptions import ModbusException
+from pymodbus.framer.socket import FramerSocket
+from pymodbus.pdu import DecodePDU
+from pymodbus.pdu.mei_message import ReadDeviceInformationResponse
+
+from proto_datastore import pack_bits
+from proto_journal import get_request_fields
+from proto_journal import STATUS_OK
+
+
+import logging
+import asyncio
+import struct
+import time
+import types
+
+
+# declare contants
+
+MBAP_HEADER = struct.Struct('>HHHBB') # transaction id, protocol id, length, unit id, function code
+MBAP_UNIT = struct.Struct('>HHHB') # transaction id, protocol id, length, unit id
+MBAP_SIZE = 7 # MBAP header including the unit id
+MAX_FRAME_LENGTH = 254 # largest unit id and pdu in the MBAP length field
+PROTOCOL_ID = 0
+
+ADDRESS_COUNT = struct.Struct('>HH') # address and count or value following the function code
+WRITE_MULTIPLE = struct.Struct('>HHB') # address, count and byte count following the function code
+READ_RESPONSE = struct.Struct('>HHHBBB') # MBAP header, function code and byte count
+WRITE_RESPONSE = struct.Struct('>HHHBBHH') # MBAP header, function code, address and count or value
+EXCEPTION_RESPONSE = struct.Struct('>HHHBBB') # MBAP header, function code + 0x80 and exception code
+
+MAX_READ_BITS = 2000
+MAX_READ_REGISTERS = 125
+MAX_WRITE_BITS = 1968
+MAX_WRITE_REGISTERS = 123
+COIL_ON = 0xFF00
+COIL_OFF = 0x0000
+
+# function code -> ModbusSlaveContext store key
+FUNCTION_CODE_BLOCKS = {0x01: 'c', 0x02: 'd', 0x03: 'h', 0x04: 'i', 0x05: 'c', 0x06: 'h', 0x0F: 'c', 0x10: 'h'}
+READ_DEVICE_INFORMATION = 0x2B
+MEI_READ_DEVICE_ID = 0x0E
+
+ILLEGAL_FUNCTION = 0x01
+ILLEGAL_ADDRESS = 0x02
+ILLEGAL_VALUE = 0x03
+SLAVE_FAILURE = 0x04
+GATEWAY_NO_RESPONSE = 0x0B
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Fast modbus TCP server engine
+
+Serves the same server contexts as ModbusTcpServer, but parses every MBAP frame in the receive buffer in place with
+struct.unpack_from on a memoryview, and answers reads and writes straight from the register blocks, without building
+request, response or framer objects. ModbusArrayDataBlock and ModbusBitArrayDataBlock blocks are read and written as wire
+format bytes, any other block through getValues/setValues. The responses to every frame in a read are sent in one write.
+
+| Function code      | Served from                                      |
+| ---                | ---                                              |
+| 0x01 - 0x06        | the unit's block                                 |
+| 0x0F, 0x10         | the unit's block                                 |
+| 0x2B / 0x0E        | the server identity, as ModbusTcpServer does     |
+| anything else      | decoded and executed by pymodbus                 |
+"""
+
+
+def encode_exception(transaction_id:int, unit_id:int, function_code:int, exception_code:int) -> bytes:
+    return EXCEPTION_RESPONSE.pack(transaction_id, PROTOCOL_ID, 3, unit_id, function_code | 0x80, exception_code)
+
+
+class ModbusFastServerProtocol(asyncio.Protocol):
+    """
+    asyncio protocol answering every complete request frame in the receive buffer from the server context
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.context = server.context
+        self.journal = server.journal
+        self.metrics = server.metrics
+        self.endpoint = (server.address[0], int(server.address[1])) # slave endpoint the requests are journaled against
+        self.transport = None
+        self.databuffer = bytearray()
+        self.pymodbus_tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.transports.add(transport)
+        if self.metrics is not None:
+            self.metrics.connection_made()
+
+    def connection_lost(self, exc):
+        self.server.transports.discard(self.transport)
+        if self.metrics is not None and self.transport is not None:
+            self.metrics.connection_lost()
+        self.transport = None
+        for pymodbus_task in self.pymodbus_tasks:
+            pymodbus_task.cancel()
+
+    def data_received(self, data):
+        databuffer = self.databuffer
+        databuffer += data
+        metrics = self.metrics
+        if metrics is not None:
+            requests = metrics.requests
+            exceptions = metrics.exceptions
+        offset = 0
+        size = len(databuffer)
+        responses = bytearray()
+
+        # answer every complete frame, then drop them from the buffer in one go once the view is released
+        with memoryview(databuffer) as view:
+            while size - offset > MBAP_SIZE:
+                transaction_id, protocol_id, length, unit_id, function_code = MBAP_HEADER.unpack_from(view, offset)
+                if protocol_id != PROTOCOL_ID or length < 2 or length > MAX_FRAME_LENGTH:
+                    LOGGER.error(f'ModbusFastServerProtocol: discarding {size - offset} bytes with invalid MBAP header')
+                    offset = size
+                    break
+                end = offset + 6 + length
+                if end > size:
+                    break
+                if self.journal is None:
+                    response = self.execute(view[offset + MBAP_SIZE + 1:end], transaction_id, unit_id, function_code)
+                else:
+                    start = time.perf_counter_ns()
+                    response = self.execute(view[offset + MBAP_SIZE + 1:end], transaction_id, unit_id, function_code)
+                    if response:
+                        self.journal_request(view[offset + MBAP_SIZE + 1:end], unit_id, function_code, response, start)
+                responses += response
+                if metrics is not None:
+                    requests[function_code] += 1
+                    if response and response[7] & 0x80:
+                        exceptions[function_code] += 1
+                offset = end
+        del databuffer[:offset]
+
+        if metrics is not None:
+            metrics.bytes_in += len(data)
+            metrics.bytes_out += len(responses)
+        if responses and self.transport:
+            self.transport.write(responses)
+
+    def execute(self, data:memoryview, transaction_id:int, unit_id:int, function_code:int) -> bytes:
+        # response frame to the request data following the function code
+        if unit_id not in self.context:
+            return encode_exception(transaction_id, unit_id, function_code, GATEWAY_NO_RESPONSE)
+        if function_code == READ_DEVICE_INFORMATION:
+            return self.read_device_information(data, transaction_id, unit_id)
+        if function_code not in FUNCTION_CODE_BLOCKS:
+            return self.execute_pymodbus(data, transaction_id, unit_id, function_code)
+
+        try:
+            slave_context = self.context[unit_id]
+            block = slave_context.store[FUNCTION_CODE_BLOCKS[function_code]]
+            request_address, count = ADDRESS_COUNT.unpack_from(data)
+            address = request_address if slave_context.zero_mode else request_address + 1 # as ModbusSlaveContext does
+
+            # reads of bits and registers
+            if function_code <= 0x04:
+                is_bits = function_code <= 0x02
+                if count < 1 or count > (MAX_READ_BITS if is_bits else MAX_READ_REGISTERS):
+                    return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_VALUE)
+                if not block.validate(address, count):
+                    return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_ADDRESS)
+                if hasattr(block, 'get_bytes'):
+                    payload = block.get_bytes(address, count)
+                elif is_bits:
+                    payload = pack_bits(block.getValues(address, count)).to_bytes(-(-count // 8), 'little')
+                else:
+                    payload = struct.pack(f'>{count}H', *block.getValues(address, count))
+                return READ_RESPONSE.pack(transaction_id, PROTOCOL_ID, 3 + len(payload), unit_id, function_code, len(payload)) + payload
+
+            # single writes, echoing the request
+            if function_code <= 0x06:
+                value = count
+                if function_code == 0x05 and value not in (COIL_ON, COIL_OFF):
+                    return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_VALUE)
+                if not block.validate(address, 1):
+                    return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_ADDRESS)
+                block.setValues(address, [value == COIL_ON] if function_code == 0x05 else [value])
+                return WRITE_RESPONSE.pack(transaction_id, PROTOCOL_ID, 6, unit_id, function_code, request_address, value)
+
+            # multiple writes, with the values following the byte count
+            request_address, count, byte_count = WRITE_MULTIPLE.unpack_from(data)
+            is_bits = function_code == 0x0F
+            expected_bytes = -(-count // 8) if is_bits else 2 * count
+            if count < 1 or count > (MAX_WRITE_BITS if is_bits else MAX_WRITE_REGISTERS) or byte_count != expected_bytes or len(data) < 5 + byte_count:
+                return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_VALUE)
+            if not block.validate(address, count):
+                return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_ADDRESS)
+            payload = data[5:5 + byte_count]
+            if hasattr(block, 'set_bytes'):
+                if is_bits:
+                    block.set_bytes(address, count, payload)
+                else:
+                    block.set_bytes(address, payload)
+            elif is_bits:
+                bits = int.from_bytes(payload, 'little')
+                block.setValues(address, [bool(bits >> bit & 1) for bit in range(count)])
+            else:
+                block.setValues(address, list(struct.unpack(f'>{count}H', payload)))
+            return WRITE_RESPONSE.pack(transaction_id, PROTOCOL_ID, 6, unit_id, function_code, request_address, count)
+        except struct.error as se:
+            LOGGER.error(f'ModbusFastServerProtocol: truncated request for function code: {function_code} from unit id: {unit_id}')
+            return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_VALUE)
+
+    def execute_pymodbus(self, data:memoryview, transaction_id:int, unit_id:int, function_code:int) -> bytes:
+        # less common function codes e.g., diagnostics, are decoded and executed by pymodbus, and answered when done
+        try:
+            request = self.server.decoder.decode(bytes([function_code]) + bytes(data))
+        except ModbusException as me:
+            request = None
+        except (struct.error, IndexError, ValueError) as e:
+            LOGGER.error(f'ModbusFastServerProtocol: truncated request for function code: {function_code} from unit id: {unit_id}: {e}')
+            return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_VALUE)
+        if not request:
+            return encode_exception(transaction_id, unit_id, function_code, ILLEGAL_FUNCTION)
+        request.transaction_id = transaction_id
+        request.slave_id = unit_id
+        pymodbus_task = asyncio.ensure_future(self.respond_pymodbus(request, time.perf_counter_ns()))
+        self.pymodbus_tasks.add(pymodbus_task)
+        pymodbus_task.add_done_callback(self.pymodbus_tasks.discard)
+        return b''
+
+    async def respond_pymodbus(self, request, start:int):
+        try:
+            response = await request.update_datastore(self.context[request.slave_id])
+        except Exception as e:
+            LOGGER.error(f'ModbusFastServerProtocol: unable to execute function code: {request.function_code}: {e}')
+            response = request.doException(SLAVE_FAILURE)
+        response.transaction_id = request.transaction_id
+        response.slave_id = request.slave_id
+        if self.journal is not None:
+            address, count = get_request_fields(request)
+            status = getattr(response, 'exception_code', None) or STATUS_OK
+            self.journal.record(*self.endpoint, request.slave_id, request.function_code, address, count, status, (time.perf_counter_ns() - start) // 1000)
+        if self.transport:
+            frame = self.server.framer.buildFrame(response)
+            if self.metrics is not None:
+                self.metrics.exceptions[request.function_code] += bool(getattr(response, 'exception_code', None))
+                self.metrics.bytes_out += len(frame)
+            self.transport.write(frame)
+
+    def journal_request(self, data:memoryview, unit_id:int, function_code:int, response:bytes, start:int):
+        # the request fields, the exception code of the response if any, and the time taken to execute it
+        address, count = ADDRESS_COUNT.unpack_from(data) if len(data) >= ADDRESS_COUNT.size else (0, 0)
+        if function_code in (0x05, 0x06):
+            count = 1
+        status = response[8] if response[7] & 0x80 else STATUS_OK
+        self.journal.record(*self.endpoint, unit_id, function_code, address, count, status, (time.perf_counter_ns() - start) // 1000)
+
+    def read_device_information(self, data:memoryview, transaction_id:int, unit_id:int) -> bytes:
+        # device identification from the server identity, encoded by pymodbus as this is not on the polling path
+        if len(data) < 3 or data[0] != MEI_READ_DEVICE_ID or data[1] not in (1, 2, 3, 4):
+            return encode_exception(transaction_id, unit_id, READ_DEVICE_INFORMATION, ILLEGAL_VALUE)
+        information = DeviceInformationFactory.get(self.server.control, data[1], data[2])
+        pdu = bytes([READ_DEVICE_INFORMATION]) + ReadDeviceInformationResponse(read_code=data[1], information=information).encode()
+        return MBAP_UNIT.pack(transaction_id, PROTOCOL_ID, 1 + len(pdu), unit_id) + pdu
+
+
+class ModbusFastTcpServer:
+    """
+    Modbus TCP server running ModbusFastServerProtocol, with the listen, serving, serve_forever and shutdown interface of
+    ModbusTcpServer
+    """
+
+    def __init__(self, context, identity = None, address:tuple = ('127.0.0.1', 502), journal = None, metrics = None):
+        self.context = context
+        self.journal = journal
+        self.metrics = metrics # EndpointMetrics counting the requests, connections and bytes of this endpoint
+        self.control = types.SimpleNamespace(Identity=identity) # DeviceInformationFactory reads the identity of a control block
+        self.address = address
+        self.server = None
+        self.transports = set()
+        self.decoder = DecodePDU(True) # request decoder for the function codes executed by pymodbus
+        self.framer = FramerSocket(DecodePDU(True))
+        self.serving = asyncio.get_running_loop().create_future()
+
+    async def listen(self) -> bool:
+        LOGGER.debug(f'ModbusFastTcpServer.listen: {self.address[0]}:{self.address[1]}')
+        loop = asyncio.get_running_loop()
+        try:
+            self.server = await loop.create_server(lambda: ModbusFastServerProtocol(self), self.address[0], self.address[1], reuse_address=True)
+        except OSError as oe:
+            LOGGER.error(f'ModbusFastTcpServer.listen: unable to bind socket {self.address[0]}:{self.address[1]}: {oe}')
+            return False
+        return True
+
+    async def serve_forever(self):
+        if not self.server and not await self.listen():
+            raise PermissionError(f'unable to bind socket {self.address[0]}:{self.address[1]}')
+        await self.serving
+
+    async def shutdown(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+        for transport in list(self.transports):
+            transport.close()
+        if not self.serving.done():
+            self.serving.set_result(True)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import logging
+import array
+import json
+import time
+
+
+# declare contants
+
+MAX_LATENCY_US = 0xFFFFFFFF # latencies are recorded in microseconds, up to about 71 minutes
+FUNCTION_CODE_SUB_BITS = 7 # 64 buckets per power of two i.e., within 1.6% for the per function code histograms
+SLAVE_SUB_BITS = 4 # 8 buckets per power of two i.e., within 12.5% for the per slave histograms, 1.9KB per slave
+PERCENTILES = [50, 90, 99]
+SLOWEST_SLAVES = 10 # slaves listed in the exit report, by p99 latency
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Latency histograms
+
+HDR style log-linear histograms: latencies below 2^sub_bits microseconds have a bucket each, and every power of two above
+that is split into 2^(sub_bits - 1) equal buckets, so the relative error is the same across the whole range. The buckets are
+a fixed size array, so recording is an index calculation and an increment, and the memory does not grow with the number
+of requests.
+
+| sub_bits | Buckets per power of two | Relative error | Buckets to MAX_LATENCY_US | Memory |
+| ---      | ---                      | ---            | ---                       | ---    |
+| 7        | 64                       | 1.6%           | 1728                      | 13.8KB |
+| 4        | 8                        | 12.5%          | 240                       | 1.9KB  |
+
+Percentiles are reported as the highest latency of the bucket they fall in, capped at the highest latency recorded.
+"""
+
+
+class LatencyHistogram:
+    """
+    Fixed memory log-linear histogram of latencies in microseconds
+    """
+
+    def __init__(self, sub_bits:int = FUNCTION_CODE_SUB_BITS):
+        self.sub_bits = sub_bits
+        self.sub_half_bits = sub_bits - 1
+        self.sub_count = 1 << sub_bits
+        self.counts = array.array('Q', bytes(8 * (self.get_index(MAX_LATENCY_US) + 1)))
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def get_index(self, value:int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return (shift << self.sub_half_bits) + (value >> shift)
+
+    def get_value(self, index:int) -> int:
+        # highest latency counted in a bucket
+        if index < self.sub_count:
+            return index
+        shift = (index >> self.sub_half_bits) - 1
+        return ((index - (shift << self.sub_half_bits) + 1) << shift) - 1
+
+    def record(self, value:int):
+        if value > MAX_LATENCY_US:
+            value = MAX_LATENCY_US
+        self.counts[self.get_index(value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent:float) -> int:
+        # latency below which percent of the recorded latencies fall
+        if not self.total:
+            return 0
+        threshold = max(1, self.total * percent / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(self.get_value(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+    def copy(self):
+        histogram = LatencyHistogram(self.sub_bits)
+        histogram.merge(self)
+        return histogram
+
+    def subtract(self, other):
+        # latencies recorded since other, a copy of this histogram taken earlier, max is not known for the difference
+        histogram = LatencyHistogram(self.sub_bits)
+        histogram.counts = array.array('Q', (count - other_count for count, other_count in zip(self.counts, other.counts)))
+        histogram.total = self.total - other.total
+        histogram.sum = self.sum - other.sum
+        histogram.max = min(self.max, histogram.get_value(max((index for index, count in enumerate(histogram.counts) if count), default=0)))
+        return histogram
+
+    def to_dict(self) -> dict:
+        # only the buckets with counts, keyed by the highest latency of the bucket
+        return {
+            'sub_bits': self.sub_bits, 'total': self.total, 'sum': self.sum, 'max': self.max,
+            'counts': {self.get_value(index): count for index, count in enumerate(self.counts) if count},
+        }
+
+    @classmethod
+    def from_dict(cls, data:dict):
+        histogram = cls(data['sub_bits'])
+        for value, count in data['counts'].items():
+            histogram.counts[histogram.get_index(int(value))] += count
+        histogram.total = data['total']
+        histogram.sum = data['sum']
+        histogram.max = data['max']
+        return histogram
+
+
+class LatencyRecorder:
+    """
+    Latency histograms of successful requests per function code and per slave, with error counts
+    """
+
+    def __init__(self):
+        self.function_codes = {} # function code -> LatencyHistogram
+        self.slaves = {} # (ipaddr, port, unit id) -> LatencyHistogram
+        self.errors = {} # function code -> number of failed requests
+        self.slave_errors = {} # (ipaddr, port, unit id) -> number of failed requests
+
+    def record(self, function_code:int, slave:tuple, latency_us:int, ok:bool):
+        if not ok:
+            self.errors[function_code] = self.errors.get(function_code, 0) + 1
+            self.slave_errors[slave] = self.slave_errors.get(slave, 0) + 1
+            return
+        histogram = self.function_codes.get(function_code)
+        if histogram is None:
+            histogram = self.function_codes[function_code] = LatencyHistogram(FUNCTION_CODE_SUB_BITS)
+        histogram.record(latency_us)
+        histogram = self.slaves.get(slave)
+        if histogram is None:
+            histogram = self.slaves[slave] = LatencyHistogram(SLAVE_SUB_BITS)
+        histogram.record(latency_us)
+
+    def merge(self, other):
+        for histograms, other_histograms in ((self.function_codes, other.function_codes), (self.slaves, other.slaves)):
+            for key, histogram in other_histograms.items():
+                if key in histograms:
+                    histograms[key].merge(histogram)
+                else:
+                    histograms[key] = histogram.copy()
+        for errors, other_errors in ((self.errors, other.errors), (self.slave_errors, other.slave_errors)):
+            for key, count in other_errors.items():
+                errors[key] = errors.get(key, 0) + count
+
+    def snapshot(self) -> dict:
+        # copy of the function code histograms, to take the latencies of an interval from
+        return {function_code: histogram.copy() for function_code, histogram in self.function_codes.items()}
+
+    def to_dict(self) -> dict:
+        return {
+            'function_codes': {function_code: histogram.to_dict() for function_code, histogram in self.function_codes.items()},
+            'slaves': [[*slave, histogram.to_dict()] for slave, histogram in self.slaves.items()],
+            'errors': self.errors,
+            'slave_errors': [[*slave, count] for slave, count in self.slave_errors.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data:dict):
+        recorder = cls()
+        recorder.function_codes = {int(function_code): LatencyHistogram.from_dict(histogram) for function_code, histogram in data['function_codes'].items()}
+        recorder.slaves = {(ipaddr, port, unit_id): LatencyHistogram.from_dict(histogram) for ipaddr, port, unit_id, histogram in data['slaves']}
+        recorder.errors = {int(function_code): count for function_code, count in data['errors'].items()}
+        recorder.slave_errors = {(ipaddr, port, unit_id): count for ipaddr, port, unit_id, count in data['slave_errors']}
+        return recorder
+
+
+def format_latency(latency_us:float) -> str:
+    return f'{latency_us / 1000:.2f}'
+
+
+def get_interval_summary(recorder:LatencyRecorder, previous:dict, elapsed:float) -> str:
+    # one line of request rate and percentiles per function code since the previous snapshot
+    parts = []
+    for function_code, histogram in sorted(recorder.function_codes.items()):
+        interval = histogram.subtract(previous[function_code]) if function_code in previous else histogram
+        if interval.total:
+            parts.append(f'fc {function_code}: {interval.total / elapsed:.1f}/s p50 {format_latency(interval.percentile(50))}ms p99 {format_latency(interval.percentile(99))}ms')
+    return ', '.join(parts)
+
+
+def write_histograms(histogram_file:str, recorder:LatencyRecorder, previous:dict = None, elapsed:float = None, final:bool = False):
+    # append the function code histograms of the interval, or every cumulative histogram and the time they cover at exit, as a JSON line
+    if previous is not None:
+        histograms = {function_code: (histogram.subtract(previous[function_code]) if function_code in previous else histogram).to_dict()
+                        for function_code, histogram in recorder.function_codes.items()}
+        record = {'time': time.time(), 'interval': elapsed, 'function_codes': histograms}
+    else:
+        record = dict(recorder.to_dict(), time=time.time(), interval=elapsed, final=final)
+    try:
+        with open(histogram_file, 'a') as file_handle:
+            file_handle.write(json.dumps(record) + '\n')
+    except OSError as oe:
+        msg = f'write_histograms: unable to write latency histograms to: {histogram_file}: {oe}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+
+
+def get_latency_report(recorder:LatencyRecorder, elapsed:float) -> str:
+    # table of requests, errors, throughput and percentiles per function code, then the slowest slaves
+    lines = [get_report_header('fc', 4)]
+    overall = LatencyHistogram(FUNCTION_CODE_SUB_BITS)
+    for function_code in sorted(set(recorder.function_codes) | set(recorder.errors)):
+        histogram = recorder.function_codes.get(function_code) or LatencyHistogram(FUNCTION_CODE_SUB_BITS)
+        overall.merge(histogram)
+        errors = recorder.errors.get(function_code, 0)
+        lines.append(get_report_line(str(function_code), histogram, errors, elapsed))
+    lines.append(get_report_line('all', overall, sum(recorder.errors.values()), elapsed))
+
+    # slowest slaves by p99
+    if len(recorder.slaves) > 1:
+        slowest = sorted(recorder.slaves.items(), key=lambda item: item[1].percentile(99), reverse=True)[:SLOWEST_SLAVES]
+        lines.append(f'slowest {len(slowest)} of {len(recorder.slaves)} slaves by p99:')
+        lines.append(get_report_header('slave', 28))
+        for (ipaddr, port, unit_id), histogram in slowest:
+            lines.append(get_report_line(f'{ipaddr}:{port}/{unit_id}', histogram, recorder.slave_errors.get((ipaddr, port, unit_id), 0), elapsed, 28))
+    return '\n'.join(lines)
+
+
+def get_report_header(label:str, width:int) -> str:
+    percentiles = ''.join(f'{"p" + str(percent) + " ms":>10}' for percent in PERCENTILES)
+    return f'{label:>{width}} {"requests":>10} {"errors":>8} {"req/s":>10}{percentiles}{"max ms":>10}'
+
+
+def get_report_line(label:str, histogram:LatencyHistogram, errors:int, elapsed:float, width:int = 4) -> str:
+    percentiles = ''.join(f'{format_latency(histogram.percentile(percent)):>10}' for percent in PERCENTILES)
+    rate = (histogram.total + errors) / elapsed if elapsed else 0
+    return f'{label:>{width}} {histogram.total + errors:>10} {errors:>8} {rate:>10.1f}{percentiles}{format_latency(histogram.max):>10}'
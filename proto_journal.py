@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import argparse
+import logging
+import atexit
+import csv
+import glob
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import sys
+import time
+
+
+# declare contants
+
+JOURNAL_MAGIC = b'MBTJ'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<4sHHQ') # magic, version, record size, number of records written
+JOURNAL_COUNT = struct.Struct('<Q') # number of records written, at the end of the header
+JOURNAL_COUNT_OFFSET = 8
+# timestamp (ns), slave endpoint address (IPv6, IPv4 mapped), port, unit id, function code, address, count, status, latency (us)
+JOURNAL_RECORD = struct.Struct('<Q16sHBBHHB3xI')
+JOURNAL_FIELDS = ['timestamp', 'ipaddr', 'port', 'unit_id', 'function_code', 'address', 'count', 'status', 'latency_us']
+
+JOURNAL_RECORDS = 1048576 # records in each journal file before rotating to the next, 40MB
+JOURNAL_FILES = 8 # journal files kept, the oldest is deleted when rotating past this
+JOURNAL_READ_RECORDS = 65536 # records read at a time by the reader
+
+STATUS_OK = 0x00 # otherwise the modbus exception code of the response
+STATUS_ERROR = 0xFE # error response without an exception code
+STATUS_NO_RESPONSE = 0xFF # no response, timeout or connection lost
+MAX_LATENCY_US = 0xFFFFFFFF
+
+ZERO_ENDPOINT = bytes(16) # endpoint of a host name which does not resolve
+JOURNAL = None # journal of this process
+JOURNAL_ATEXIT = False # close_journal registered to run at exit
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Transaction journal
+
+Both the client and the server can append a fixed size binary record per request to a memory-mapped journal file, which
+is a fraction of the size of the equivalent log line and is read back with struct.iter_unpack. Each journal file holds
+JOURNAL_RECORDS records, after which the next file is started and the oldest past JOURNAL_FILES is deleted. The count in
+the header is updated with every record, so a journal can be read while it is being written, or after a crash.
+
+| Field          | Size | Description                                                          |
+| ---            | ---  | ---                                                                  |
+| timestamp      | 8b   | ns since the epoch                                                   |
+| ipaddr         | 16b  | slave endpoint address, IPv4 addresses are stored IPv4 mapped        |
+| port           | 2b   | slave endpoint port                                                  |
+| unit_id        | 1b   | slave/unit id                                                        |
+| function_code  | 1b   | function code of the request                                         |
+| address        | 2b   | start address of the request                                         |
+| count          | 2b   | number of registers or bits, 1 for single writes                     |
+| status         | 1b   | 0 ok, the exception code, 0xFE error or 0xFF no response             |
+| latency_us     | 4b   | round trip on the client, execution time on the server, microseconds |
+
+Journal files are named <journal>.<index>, e.g. proto_client.journal.000003, and `proto_journal.py proto_client.journal`
+streams every file of a journal, oldest first, into a summary or CSV.
+"""
+
+
+def pack_endpoint(ipaddr:str) -> bytes:
+    # 16 byte address, IPv4 addresses mapped into IPv6
+    address = ipaddress.ip_address(ipaddr)
+    if address.version == 4:
+        return b'\x00' * 10 + b'\xff\xff' + address.packed
+    return address.packed
+
+
+def resolve_endpoint(host:str) -> bytes:
+    # 16 byte address of an IP address or host name, the zero endpoint if the name does not resolve
+    try:
+        return pack_endpoint(host)
+    except ValueError:
+        pass
+    try:
+        return pack_endpoint(socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)[0][4][0])
+    except (OSError, ValueError, IndexError) as e:
+        LOGGER.error(f'resolve_endpoint: unable to resolve {host}, journaling it as {unpack_endpoint(ZERO_ENDPOINT)}: {e}')
+        return ZERO_ENDPOINT
+
+
+def unpack_endpoint(packed:bytes) -> str:
+    address = ipaddress.IPv6Address(packed)
+    return str(address.ipv4_mapped or address)
+
+
+class TransactionJournal:
+    """
+    Rotating memory-mapped journal of fixed size transaction records
+    """
+
+    def __init__(self, path:str, records_per_file:int = JOURNAL_RECORDS, max_files:int = JOURNAL_FILES):
+        self.path = path
+        self.records_per_file = max(1, records_per_file)
+        self.max_files = max(1, max_files)
+        self.endpoints = {} # ipaddr -> packed endpoint
+        self.file_handle = None
+        self.journal_map = None
+        self.num_records = 0
+        indexes = get_journal_files(path)
+        self.index = indexes[-1][0] + 1 if indexes else 0
+        self.open_file()
+
+    def open_file(self):
+        # start the next journal file, deleting the oldest beyond max_files
+        file_name = f'{self.path}.{self.index:06d}'
+        LOGGER.debug(f'TransactionJournal.open_file: {file_name}')
+        size = JOURNAL_HEADER.size + self.records_per_file * JOURNAL_RECORD.size
+        self.file_handle = open(file_name, 'w+b')
+        self.file_handle.truncate(size)
+        self.journal_map = mmap.mmap(self.file_handle.fileno(), size)
+        JOURNAL_HEADER.pack_into(self.journal_map, 0, JOURNAL_MAGIC, JOURNAL_VERSION, JOURNAL_RECORD.size, 0)
+        self.num_records = 0
+
+        for index, old_file in get_journal_files(self.path)[:-self.max_files]:
+            try:
+                os.remove(old_file)
+            except OSError as oe:
+                LOGGER.error(f'TransactionJournal.open_file: unable to delete old journal file: {old_file}: {oe}')
+
+    def close_file(self):
+        # trim the unused records from the end of the file
+        if not self.journal_map:
+            return
+        self.journal_map.flush()
+        self.journal_map.close()
+        self.journal_map = None
+        self.file_handle.truncate(JOURNAL_HEADER.size + self.num_records * JOURNAL_RECORD.size)
+        self.file_handle.close()
+        self.file_handle = None
+
+    def record(self, ipaddr:str, port:int, unit_id:int, function_code:int, address:int, count:int, status:int, latency_us:int, timestamp:int = None):
+        # host names are resolved once, on their first record
+        endpoint = self.endpoints.get(ipaddr)
+        if endpoint is None:
+            endpoint = self.endpoints[ipaddr] = resolve_endpoint(ipaddr)
+        JOURNAL_RECORD.pack_into(
+                self.journal_map, JOURNAL_HEADER.size + self.num_records * JOURNAL_RECORD.size,
+                timestamp or time.time_ns(), endpoint, port, unit_id, function_code, address & 0xFFFF, count & 0xFFFF, status,
+                min(latency_us, MAX_LATENCY_US))
+        self.num_records += 1
+        JOURNAL_COUNT.pack_into(self.journal_map, JOURNAL_COUNT_OFFSET, self.num_records)
+        if self.num_records == self.records_per_file:
+            self.close_file()
+            self.index += 1
+            self.open_file()
+
+    def close(self):
+        self.close_file()
+
+
+def get_request_fields(request) -> tuple:
+    # (address, count) of a pymodbus request, count is the number of values written, or 1 for a single write
+    count = getattr(request, 'count', None)
+    if count is None:
+        values = getattr(request, 'values', None)
+        count = len(values) if values is not None else 1
+    return (getattr(request, 'address', 0) or 0, count)
+
+
+def set_journal(path:str, records_per_file:int = JOURNAL_RECORDS, max_files:int = JOURNAL_FILES) -> TransactionJournal:
+    LOGGER.debug(f'set_journal: {path}')
+    global JOURNAL, JOURNAL_ATEXIT
+
+    close_journal()
+    try:
+        JOURNAL = TransactionJournal(path, records_per_file, max_files)
+    except (OSError, ValueError) as e:
+        msg = f'set_journal: unable to create transaction journal: {path}: {e}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+    if not JOURNAL_ATEXIT:
+        atexit.register(close_journal)
+        JOURNAL_ATEXIT = True
+    return JOURNAL
+
+
+def get_journal() -> TransactionJournal:
+    # the journal of this process, None if not journaling
+    return JOURNAL
+
+
+def close_journal():
+    global JOURNAL
+    if JOURNAL:
+        JOURNAL.close()
+        JOURNAL = None
+
+
+def get_journal_files(path:str) -> list:
+    # (index, file name) of every file of a journal, oldest first
+    journal_files = []
+    for file_name in glob.glob(f'{glob.escape(path)}.*'):
+        suffix = file_name[len(path) + 1:]
+        if suffix.isdigit():
+            journal_files.append((int(suffix), file_name))
+    return sorted(journal_files)
+
+
+def read_journal_file(file_name:str):
+    """
+    Generator of the records in a journal file, read JOURNAL_READ_RECORDS at a time
+    """
+    with open(file_name, 'rb') as file_handle:
+        header = file_handle.read(JOURNAL_HEADER.size)
+        if len(header) < JOURNAL_HEADER.size:
+            LOGGER.error(f'read_journal_file: skipping truncated journal file: {file_name}')
+            return
+        magic, version, record_size, num_records = JOURNAL_HEADER.unpack(header)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION or record_size != JOURNAL_RECORD.size:
+            LOGGER.error(f'read_journal_file: skipping {file_name}, not a version {JOURNAL_VERSION} journal file')
+            return
+
+        while num_records > 0:
+            data = file_handle.read(min(num_records, JOURNAL_READ_RECORDS) * JOURNAL_RECORD.size)
+            data = data[:len(data) - len(data) % JOURNAL_RECORD.size]
+            if not data:
+                return
+            yield from JOURNAL_RECORD.iter_unpack(data)
+            num_records -= len(data) // JOURNAL_RECORD.size
+
+
+def read_journal(path:str):
+    """
+    Generator of the records of every file in a journal, oldest first, with the endpoint address unpacked
+    """
+    endpoints = {} # packed endpoint -> ipaddr
+    journal_files = [(0, path)] if os.path.isfile(path) else get_journal_files(path)
+    for index, file_name in journal_files:
+        for timestamp, endpoint, port, unit_id, function_code, address, count, status, latency_us in read_journal_file(file_name):
+            ipaddr = endpoints.get(endpoint)
+            if ipaddr is None:
+                ipaddr = endpoints[endpoint] = unpack_endpoint(endpoint)
+            yield (timestamp, ipaddr, port, unit_id, function_code, address, count, status, latency_us)
+
+
+def write_journal_csv(records, output):
+    # one CSV row per record, with the timestamp in seconds
+    writer = csv.writer(output)
+    writer.writerow(JOURNAL_FIELDS)
+    for record in records:
+        writer.writerow((f'{record[0] / 1e9:.6f}',) + record[1:])
+
+
+def write_journal_summary(records, output):
+    # request count, errors and latency per endpoint and function code, accumulated as the records stream past
+    summary = {} # (ipaddr, port, function code) -> [requests, errors, total latency, max latency]
+    first = None
+    last = None
+    for timestamp, ipaddr, port, unit_id, function_code, address, count, status, latency_us in records:
+        if first is None:
+            first = timestamp
+        last = timestamp
+        totals = summary.get((ipaddr, port, function_code))
+        if not totals:
+            totals = summary[(ipaddr, port, function_code)] = [0, 0, 0, 0]
+        totals[0] += 1
+        if status != STATUS_OK:
+            totals[1] += 1
+        totals[2] += latency_us
+        totals[3] = max(totals[3], latency_us)
+
+    num_records = sum(totals[0] for totals in summary.values())
+    elapsed = (last - first) / 1e9 if num_records > 1 else 0
+    output.write(f'{num_records} records over {elapsed:.1f}s ({num_records / elapsed if elapsed else 0:.1f} requests/s)\n')
+    output.write(f'{"endpoint":<28} {"fc":>4} {"requests":>10} {"errors":>8} {"mean us":>9} {"max us":>9}\n')
+    for (ipaddr, port, function_code), (requests, errors, latency_total, latency_max) in sorted(summary.items()):
+        output.write(f'{ipaddr + ":" + str(port):<28} {function_code:>4} {requests:>10} {errors:>8} {latency_total / requests:>9.0f} {latency_max:>9}\n')
+
+
+def run_main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(
+                    prog='proto_journal',
+                    description='Stream a transaction journal written by proto_client or proto_server into a summary or CSV')
+    parser.add_argument('journal', help='journal e.g., proto_client.journal to read all its files, or a single journal file')
+    parser.add_argument('-o', '--output', choices=['summary', 'csv'], default='summary', help='write a summary per endpoint and function code, or every record as CSV, default = "summary"')
+    parser.add_argument('-e', '--endpoint', help='only the records of this slave ip address')
+    parser.add_argument('-f', '--function_code', type=int, help='only the records of this function code')
+    parser.add_argument('-x', '--errors', action='store_true', help='only the records of failed requests')
+    args = parser.parse_args()
+
+    # check parameters
+    if not os.path.isfile(args.journal) and not get_journal_files(args.journal):
+        print(f'[!] proto_journal: no journal files found for: {args.journal}')
+        return
+
+    records = read_journal(args.journal)
+    if args.endpoint:
+        records = (record for record in records if record[1] == args.endpoint)
+    if args.function_code is not None:
+        records = (record for record in records if record[4] == args.function_code)
+    if args.errors:
+        records = (record for record in records if record[7] != STATUS_OK)
+
+    if args.output == 'csv':
+        write_journal_csv(records, sys.stdout)
+    else:
+        write_journal_summary(records, sys.stdout)
+
+
+if __name__ == '__main__':
+    run_main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import logging
+import logging.handlers
+import atexit
+import collections
+import itertools
+import os
+import queue
+import threading
+import time
+
+
+# declare contants
+
+LOG_LEVEL = 'INFO'
+LOG_LEVELS = ['DEBUG', 'INFO', 'WARNING', 'ERROR']
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+LOG_SAMPLE = 1 # log 1 in every N per request records, 1 to log every request
+LOG_DIR = None # directory for per slave/unit log files, None to log every record to the one log file
+LOG_BATCH_SIZE = 1024 # max records written by the writer thread in one batch
+LOG_LINGER = 0.05 # seconds the writer thread waits for more records before writing a batch
+MAX_LOG_FILES = 256 # per slave/unit log files kept open, the least recently used is closed first
+MAX_QUEUED_REQUESTS = 100000 # per request records waiting for the writer thread, further records are dropped and counted
+
+LOG_WRITER = None # writer thread of this process
+LOG_ATEXIT = False # stop_logging registered to run at exit
+REQUEST_COUNTER = itertools.count() # per request records seen, for sampling
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Queued logging
+
+logging.basicConfig writes and flushes the log file on the calling thread, i.e. on the event loop, for every record. Here
+every logger hands its records through a QueueHandler to a writer thread, which formats them, groups them by log file and
+writes each group with a single unbuffered write, so worker processes appending to the same file do not interleave lines.
+
+Per request records are logged with log_request, which returns straight away when INFO is off, keeps only 1 in every
+LOG_SAMPLE records, and queues just the time, logger name, message and arguments, leaving the record to be built and
+formatted on the writer thread. If the writer falls MAX_QUEUED_REQUESTS behind, request records are dropped and the number
+dropped is logged. With a log directory each request record goes to a log file for its slave and unit id, everything else
+to the main log file.
+
+| Log file                              | Records                                       |
+| ---                                   | ---                                           |
+| proto_client.log                      | everything not logged against a slave         |
+| <log_dir>/proto_client_<ip>_<unit>.log | per request records of that slave and unit id |
+"""
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler which leaves formatting to the writer thread, the record is only read by the writer in this process
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class BatchingLogWriter(threading.Thread):
+    """
+    Writer thread which drains the log queue in batches and appends each batch to the log files its records belong to
+    """
+
+    def __init__(self, log_queue, log_file:str, log_dir:str = LOG_DIR, log_format:str = LOG_FORMAT):
+        super().__init__(name='log writer', daemon=True)
+        self.log_queue = log_queue
+        self.log_file = log_file
+        self.log_dir = log_dir
+        self.log_prefix = os.path.splitext(os.path.basename(log_file))[0]
+        self.formatter = logging.Formatter(log_format)
+        self.files = collections.OrderedDict() # log file -> file descriptor, in least recently used order
+        self.dropped = 0 # request records dropped while the queue was full
+
+    def get_log_file(self, record) -> str:
+        # per slave/unit log file if the record was logged against a slave and there is a log directory
+        slave = getattr(record, 'slave', None)
+        if not slave or not self.log_dir:
+            return self.log_file
+        ipaddr, unit_id = slave
+        return os.path.join(self.log_dir, f'{self.log_prefix}_{str(ipaddr).replace(":", "-")}_{unit_id}.log')
+
+    def get_file(self, log_file:str) -> int:
+        # open log files are reused, closing the least recently used once there are too many
+        fd = self.files.pop(log_file, None)
+        if fd is None:
+            if len(self.files) >= MAX_LOG_FILES:
+                os.close(self.files.popitem(last=False)[1])
+            fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.files[log_file] = fd
+        return fd
+
+    def write_batch(self, records:list):
+        # one write per log file for the whole batch
+        lines = {}
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            records.append(logging.makeLogRecord({'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f'BatchingLogWriter: dropped {dropped} request records, the log writer is falling behind'}))
+        for record in records:
+            if type(record) is tuple:
+                record = make_request_record(*record)
+            try:
+                line = self.formatter.format(record)
+            except Exception as e:
+                line = f'{self.formatter.formatTime(record)} ERROR: unable to format log record: {record.msg!r}: {e}'
+            lines.setdefault(self.get_log_file(record), []).append(line)
+        for log_file, file_lines in lines.items():
+            try:
+                os.write(self.get_file(log_file), ('\n'.join(file_lines) + '\n').encode('utf-8'))
+            except OSError as oe:
+                print(f'[!] BatchingLogWriter: unable to write {len(file_lines)} records to log file: {log_file}: {oe}')
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            record = self.log_queue.get()
+            if record is None:
+                break
+
+            # gather whatever else arrives shortly after the first record, up to a full batch
+            records = [record]
+            deadline = time.monotonic() + LOG_LINGER
+            while len(records) < LOG_BATCH_SIZE:
+                try:
+                    record = self.log_queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                records.append(record)
+            self.write_batch(records)
+
+        for fd in self.files.values():
+            os.close(fd)
+        self.files.clear()
+
+    def stop(self):
+        self.log_queue.put(None)
+        self.join()
+
+
+def make_request_record(created:float, name:str, msg:str, args:tuple, slave:tuple) -> logging.LogRecord:
+    # INFO record for a request queued by log_request
+    return logging.makeLogRecord({
+            'name': name, 'levelno': logging.INFO, 'levelname': 'INFO', 'msg': msg, 'args': args, 'slave': slave,
+            'created': created, 'msecs': int(created * 1000) % 1000,
+        })
+
+
+def setup_logging(log_file:str, level:str = LOG_LEVEL, log_dir:str = LOG_DIR, sample:int = LOG_SAMPLE) -> BatchingLogWriter:
+    # replace any handlers on the root logger with a queue to this process's writer thread
+    global LOG_WRITER, LOG_SAMPLE, LOG_ATEXIT
+
+    # check parameters
+    if level not in LOG_LEVELS:
+        print(f'[!] setup_logging: invalid log level: {level}, using {LOG_LEVEL}')
+        level = LOG_LEVEL
+    if log_dir:
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+        except OSError as oe:
+            print(f'[!] setup_logging: unable to create log directory: {log_dir}: {oe}, logging to {log_file}')
+            log_dir = None
+
+    stop_logging()
+    LOG_SAMPLE = max(1, sample)
+    log_queue = queue.SimpleQueue()
+    LOG_WRITER = BatchingLogWriter(log_queue, log_file, log_dir)
+    LOG_WRITER.start()
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+    root_logger.addHandler(DeferredQueueHandler(log_queue))
+    root_logger.setLevel(level)
+    if not LOG_ATEXIT:
+        atexit.register(stop_logging)
+        LOG_ATEXIT = True
+
+    LOGGER.debug(f'setup_logging: {log_file} level={level} log_dir={log_dir} sample={LOG_SAMPLE}')
+    return LOG_WRITER
+
+
+def stop_logging():
+    # write out whatever is still queued
+    global LOG_WRITER
+    if LOG_WRITER:
+        LOG_WRITER.stop()
+        LOG_WRITER = None
+
+
+def log_request(logger, msg:str, *args, slave:tuple = None):
+    # per request INFO record, sampled, formatted on the writer thread and logged against (ipaddr, unit id) if given
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    if LOG_SAMPLE > 1 and next(REQUEST_COUNTER) % LOG_SAMPLE:
+        return
+    if LOG_WRITER:
+        if LOG_WRITER.log_queue.qsize() >= MAX_QUEUED_REQUESTS:
+            LOG_WRITER.dropped += 1
+            return
+        LOG_WRITER.log_queue.put((time.time(), logger.name, msg, args, slave))
+    else:
+        logger.info(msg, *args, extra={'slave': slave})
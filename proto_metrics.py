@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import logging
+import asyncio
+import os
+import stat
+
+
+# declare contants
+
+NUM_FUNCTION_CODES = 256 # request and exception counters are preallocated for every function code
+METRICS_PATH = '/metrics'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8' # Prometheus text exposition format
+METRICS_TIMEOUT = 5 # seconds a scraper has to send its request
+
+METRICS = None # metrics of this process
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Server metrics
+
+Each endpoint keeps its counters in an EndpointMetrics created when the endpoint's server is created, with preallocated
+lists of request and exception counts indexed by function code, so counting a request is a list increment on the event
+loop, about half the cost of incrementing an array('Q').
+
+The metrics are rendered in the Prometheus text format only when scraped, over HTTP on a local TCP port or on a Unix
+socket e.g., `curl http://127.0.0.1:9502/metrics` or `curl --unix-socket /tmp/proto_server.sock http://localhost/metrics`.
+
+| Metric                                 | Type    | Labels                  | Description                                    |
+| ---                                    | ---     | ---                     | ---                                            |
+| modbus_requests_total                  | counter | endpoint, function_code | requests received                              |
+| modbus_exceptions_total                | counter | endpoint, function_code | exception responses sent                       |
+| modbus_connections                     | gauge   | endpoint                | open client connections                        |
+| modbus_connections_total               | counter | endpoint                | client connections accepted                    |
+| modbus_received_bytes_total            | counter | endpoint                | bytes received from clients                    |
+| modbus_sent_bytes_total                | counter | endpoint                | bytes sent to clients                          |
+| modbus_register_update_ticks_total     | counter |                         | register update ticks                          |
+| modbus_register_update_seconds_total   | counter |                         | time the register updater held the event loop  |
+| modbus_register_update_last_seconds    | gauge   |                         | time taken by the last tick                    |
+| modbus_register_update_max_seconds     | gauge   |                         | longest tick                                   |
+| modbus_register_update_overruns_total  | counter |                         | ticks longer than the update interval          |
+| modbus_register_update_blocks          | gauge   |                         | blocks updated by the last tick                |
+"""
+
+
+class EndpointMetrics:
+    """
+    Counters and gauges of a single endpoint, updated in place by the server engines
+    """
+
+    def __init__(self, ipaddr:str, port:int):
+        self.endpoint = f'[{ipaddr}]:{port}' if ':' in ipaddr else f'{ipaddr}:{port}'
+        self.requests = [0] * NUM_FUNCTION_CODES # function code -> requests received
+        self.exceptions = [0] * NUM_FUNCTION_CODES # function code -> exception responses sent
+        self.connections = 0
+        self.connections_total = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def connection_made(self):
+        self.connections += 1
+        self.connections_total += 1
+
+    def connection_lost(self):
+        self.connections -= 1
+
+
+class ServerMetrics:
+    """
+    Metrics of every endpoint served by this process and of the register updater
+    """
+
+    def __init__(self):
+        self.endpoints = {} # (ipaddr, port) -> EndpointMetrics
+        self.update_ticks = 0
+        self.update_seconds = 0.0
+        self.update_last_seconds = 0.0
+        self.update_max_seconds = 0.0
+        self.update_overruns = 0
+        self.update_blocks = 0
+
+    def get_endpoint(self, ipaddr:str, port:int) -> EndpointMetrics:
+        endpoint = self.endpoints.get((ipaddr, int(port)))
+        if endpoint is None:
+            endpoint = self.endpoints[(ipaddr, int(port))] = EndpointMetrics(ipaddr, int(port))
+        return endpoint
+
+    def record_tick(self, tick_time:float, num_blocks:int, overrun:bool):
+        self.update_ticks += 1
+        self.update_seconds += tick_time
+        self.update_last_seconds = tick_time
+        self.update_max_seconds = max(self.update_max_seconds, tick_time)
+        self.update_overruns += overrun
+        self.update_blocks = num_blocks
+
+    def render(self) -> str:
+        # Prometheus text format, only the function codes seen are listed
+        lines = []
+        endpoints = list(self.endpoints.values())
+
+        for name, kind, help_text, attribute in (
+                ('modbus_requests_total', 'counter', 'Requests received', 'requests'),
+                ('modbus_exceptions_total', 'counter', 'Exception responses sent', 'exceptions')):
+            lines.append(f'# HELP {name} {help_text} per endpoint and function code')
+            lines.append(f'# TYPE {name} {kind}')
+            for endpoint in endpoints:
+                for function_code, count in enumerate(getattr(endpoint, attribute)):
+                    if count:
+                        lines.append(f'{name}{{endpoint="{endpoint.endpoint}",function_code="{function_code}"}} {count}')
+
+        for name, kind, help_text, attribute in (
+                ('modbus_connections', 'gauge', 'Open client connections', 'connections'),
+                ('modbus_connections_total', 'counter', 'Client connections accepted', 'connections_total'),
+                ('modbus_received_bytes_total', 'counter', 'Bytes received from clients', 'bytes_in'),
+                ('modbus_sent_bytes_total', 'counter', 'Bytes sent to clients', 'bytes_out')):
+            lines.append(f'# HELP {name} {help_text} per endpoint')
+            lines.append(f'# TYPE {name} {kind}')
+            for endpoint in endpoints:
+                lines.append(f'{name}{{endpoint="{endpoint.endpoint}"}} {getattr(endpoint, attribute)}')
+
+        for name, kind, help_text, value in (
+                ('modbus_register_update_ticks_total', 'counter', 'Register update ticks', self.update_ticks),
+                ('modbus_register_update_seconds_total', 'counter', 'Time the register updater held the event loop', self.update_seconds),
+                ('modbus_register_update_last_seconds', 'gauge', 'Time taken by the last register update tick', self.update_last_seconds),
+                ('modbus_register_update_max_seconds', 'gauge', 'Longest register update tick', self.update_max_seconds),
+                ('modbus_register_update_overruns_total', 'counter', 'Register update ticks longer than the update interval', self.update_overruns),
+                ('modbus_register_update_blocks', 'gauge', 'Blocks updated by the last register update tick', self.update_blocks)):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def set_metrics() -> ServerMetrics:
+    LOGGER.debug('set_metrics')
+    global METRICS
+
+    METRICS = ServerMetrics()
+    return METRICS
+
+
+def get_metrics() -> ServerMetrics:
+    # the metrics of this process, None if not collecting metrics
+    return METRICS
+
+
+def get_endpoint_metrics(server_addr:tuple) -> EndpointMetrics:
+    # metrics of the endpoint at (ipaddr, port), None if not collecting metrics
+    if METRICS is None:
+        return None
+    return METRICS.get_endpoint(server_addr[0], server_addr[1])
+
+
+async def handle_metrics_request(metrics:ServerMetrics, reader, writer):
+    # minimal HTTP/1.0, the request line and headers are read and the metrics returned for METRICS_PATH
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), METRICS_TIMEOUT)
+        while True:
+            header = await asyncio.wait_for(reader.readline(), METRICS_TIMEOUT)
+            if header in (b'\r\n', b'\n', b''):
+                break
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] in (METRICS_PATH, '/'):
+            status = '200 OK'
+            body = metrics.render().encode('utf-8')
+        else:
+            status = '404 Not Found'
+            body = f'metrics are served at {METRICS_PATH}\n'.encode('utf-8')
+        writer.write(f'HTTP/1.0 {status}\r\nContent-Type: {METRICS_CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        LOGGER.debug(f'handle_metrics_request: dropping metrics connection: {e!r}')
+    finally:
+        writer.close()
+
+
+async def serve_metrics(metrics:ServerMetrics, listen:str):
+    """
+    Serve the metrics over HTTP on host:port e.g., 127.0.0.1:9502, or on a Unix socket at any other path
+    """
+    LOGGER.debug(f'serve_metrics: {listen}')
+
+    # declare local variables
+    handler = lambda reader, writer: handle_metrics_request(metrics, reader, writer)
+    host, separator, port = listen.rpartition(':')
+
+    try:
+        if separator and port.isdigit():
+            metrics_server = await asyncio.start_server(handler, host.strip('[]') or '127.0.0.1', int(port), reuse_address=True)
+        else:
+            if os.path.exists(listen) and stat.S_ISSOCK(os.stat(listen).st_mode):
+                os.remove(listen) # socket left behind by a previous run
+            metrics_server = await asyncio.start_unix_server(handler, listen)
+    except OSError as oe:
+        msg = f'serve_metrics: unable to serve metrics on: {listen}: {oe}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+
+    msg = f'serve_metrics: serving metrics on: {listen}'
+    LOGGER.info(msg)
+    print(f'[+] {msg}')
+    return metrics_server
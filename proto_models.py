@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import numpy as np
+
+
+import logging
+import json
+import math
+
+
+# declare contants
+
+MODEL_SEED = None # seed for the per slave phases and noise, None for a different run each time
+
+# default parameters of every slave, overridden per slave by the config file
+MODEL_DEFAULTS = {
+    'ramp_min': 0.0,            # ramp wraps back to ramp_min after reaching ramp_max
+    'ramp_max': 1000.0,
+    'ramp_rate': 10.0,          # units/s
+    'sine_offset': 500.0,
+    'sine_amplitude': 250.0,
+    'sine_period': 60.0,        # seconds
+    'sine_noise': 10.0,         # standard deviation of the gaussian noise added to the sine
+    'tank_area': 2.0,           # m2
+    'tank_height': 5.0,         # m, the level is clipped to 0 - tank_height
+    'tank_level': 2.5,          # m, initial level
+    'tank_inflow': 0.5,         # m3/s with the inlet valve fully open
+    'tank_outflow': 0.2,        # outflow coefficient, outflow = tank_outflow * sqrt(level) m3/s
+    'tank_disturbance': 0.02,   # random walk in the outflow coefficient, per sqrt(s)
+    'pid_setpoint': 2.5,        # m, level held by the PID loop driving the inlet valve
+    'pid_kp': 0.8,
+    'pid_ki': 0.1,
+    'pid_kd': 0.05,
+    'alarm_level_high': 3.0,    # m, level high alarm
+    'alarm_level_low': 2.0,     # m, level low alarm
+    'alarm_sine_high': 700.0,   # sine high alarm
+    'alarm_hysteresis': 0.05,   # alarms clear once back inside the threshold by this fraction of it
+}
+
+# parameters which divide the model equations, so must be greater than zero
+MODEL_POSITIVE_PARAMETERS = ('sine_period', 'tank_area', 'tank_inflow')
+
+# input registers written by the models from address 0, and the scale from engineering units to register counts
+MODEL_REGISTERS = ['ramp', 'sine', 'tank_level', 'valve', 'outflow']
+MODEL_REGISTER_SCALE = np.array([1.0, 1.0, 100.0, 10000.0, 1000.0]) # -, -, cm, 0.01%, l/s
+MAX_REGISTER_VALUE = 0xFFFF
+
+# discrete inputs written by the models from address 0
+MODEL_ALARMS = ['level_high', 'level_low', 'sine_high']
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Process signal models
+
+Each slave simulates a small process and exposes it in its input registers and discrete inputs. Every parameter and state
+variable is a numpy array with one element per slave, so a tick is a fixed number of array operations however many slaves
+are hosted.
+
+| Address | Type           | Signal                                              |
+| ---     | ---            | ---                                                 |
+| 0       | input register | ramp, wrapping from ramp_max back to ramp_min       |
+| 1       | input register | sine with gaussian noise                            |
+| 2       | input register | tank level (cm)                                     |
+| 3       | input register | inlet valve position driven by the PID loop (0.01%) |
+| 4       | input register | tank outflow (l/s)                                  |
+| 0       | discrete input | tank level high alarm                               |
+| 1       | discrete input | tank level low alarm                                |
+| 2       | discrete input | sine high alarm                                     |
+
+Per slave parameters are read from a JSON config, with a default section applied to every slave and overrides per slave
+IP address, and optionally per unit id:
+
+    {
+        "seed": 1,
+        "default": {"sine_period": 30},
+        "slaves": {
+            "10.10.10.1": {"pid_setpoint": 3.0, "units": {"2": {"ramp_rate": 5}}}
+        }
+    }
+"""
+
+
+def load_model_config(config_file:str = None) -> dict:
+    LOGGER.debug(f'load_model_config: {config_file}')
+
+    # check parameters
+    if not config_file:
+        return {}
+
+    # read the JSON config, unknown parameters are reported and ignored
+    try:
+        with open(config_file, 'r') as file_handle:
+            config = json.load(file_handle)
+    except (OSError, ValueError) as e:
+        msg = f'load_model_config: unable to read model config: {config_file}: {e}, using default parameters'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return {}
+
+    sections = [config.get('default', {})]
+    for slave_params in config.get('slaves', {}).values():
+        sections.append(slave_params)
+        sections.extend(slave_params.get('units', {}).values())
+    for section in sections:
+        for name in list(section):
+            if name == 'units':
+                continue
+            if name not in MODEL_DEFAULTS:
+                LOGGER.error(f'load_model_config: ignoring unknown model parameter: {name}')
+            elif get_model_parameter(name, section[name]) is None:
+                msg = f'load_model_config: invalid value for model parameter {name}: {section[name]!r}, using default {MODEL_DEFAULTS[name]}'
+                LOGGER.error(msg)
+                print(f'[!] {msg}')
+                del section[name]
+
+    return config
+
+
+def get_model_parameter(name:str, value) -> float:
+    # the value of a model parameter as a float, or None if it is not a finite number or would divide by zero
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value) or (name in MODEL_POSITIVE_PARAMETERS and value <= 0):
+        return None
+    return value
+
+
+def get_slave_parameters(config:dict, ipaddr:str, unit_id:int) -> dict:
+    # defaults, then the config default section, then the slave's section, then the slave's unit section, skipping invalid values
+    slave_config = config.get('slaves', {}).get(ipaddr, {})
+    params = dict(MODEL_DEFAULTS)
+    for section in (config.get('default', {}), slave_config, slave_config.get('units', {}).get(str(unit_id), {})):
+        for name, value in section.items():
+            if name in MODEL_DEFAULTS and (value := get_model_parameter(name, value)) is not None:
+                params[name] = value
+    return params
+
+
+class ProcessModelBank:
+    """
+    Process models for every slave hosted by the server, with one row per slave in every parameter and state array
+    """
+
+    def __init__(self, config:dict = None):
+        self.config = config or {}
+        self.rng = np.random.default_rng(self.config.get('seed', MODEL_SEED))
+        self.slaves = [] # (ipaddr, unit_id) of each row
+        self.params = {name: np.empty(0) for name in MODEL_DEFAULTS}
+        self.time = 0.0
+        self.ramp = np.empty(0)
+        self.sine_phase = np.empty(0)
+        self.level = np.empty(0)
+        self.outflow = np.empty(0)
+        self.outflow_coefficient = np.empty(0)
+        self.valve = np.empty(0)
+        self.integral = np.empty(0)
+        self.alarms = np.empty((0, len(MODEL_ALARMS)), dtype=bool)
+
+    def __len__(self):
+        return len(self.slaves)
+
+    def add_slaves(self, slaves:list):
+        LOGGER.debug(f'ProcessModelBank.add_slaves: {len(slaves)} slaves')
+
+        # check parameters
+        if not slaves:
+            return
+
+        # append a row per slave to every array in one go, starting each slave at a random point of its ramp and sine
+        slave_params = [get_slave_parameters(self.config, ipaddr, unit_id) for ipaddr, unit_id in slaves]
+        new_params = {name: np.array([params[name] for params in slave_params]) for name in MODEL_DEFAULTS}
+        num_new = len(slaves)
+
+        ramp = new_params['ramp_min'] + self.rng.random(num_new) * (new_params['ramp_max'] - new_params['ramp_min'])
+        sine_phase = self.rng.random(num_new) * 2 * np.pi
+        outflow = new_params['tank_outflow'] * np.sqrt(new_params['tank_level'])
+        valve = np.clip(outflow / new_params['tank_inflow'], 0, 1) # start each tank in balance
+
+        self.slaves.extend(slaves)
+        for name in MODEL_DEFAULTS:
+            self.params[name] = np.concatenate((self.params[name], new_params[name]))
+        self.ramp = np.concatenate((self.ramp, ramp))
+        self.sine_phase = np.concatenate((self.sine_phase, sine_phase))
+        self.level = np.concatenate((self.level, new_params['tank_level']))
+        self.outflow = np.concatenate((self.outflow, outflow))
+        self.outflow_coefficient = np.concatenate((self.outflow_coefficient, new_params['tank_outflow']))
+        self.valve = np.concatenate((self.valve, valve))
+        self.integral = np.concatenate((self.integral, valve / np.where(new_params['pid_ki'] > 0, new_params['pid_ki'], 1)))
+        self.alarms = np.concatenate((self.alarms, np.zeros((num_new, len(MODEL_ALARMS)), dtype=bool)))
+
+    def step(self, dt:float) -> tuple:
+        # advance every model by dt seconds, returns the input register values and discrete input states of every slave
+        p = self.params
+        self.time += dt
+
+        # ramp
+        span = np.maximum(p['ramp_max'] - p['ramp_min'], 1e-9)
+        self.ramp = p['ramp_min'] + np.mod(self.ramp - p['ramp_min'] + p['ramp_rate'] * dt, span)
+
+        # sine and noise
+        sine = p['sine_offset'] + p['sine_amplitude'] * np.sin(2 * np.pi * self.time / p['sine_period'] + self.sine_phase)
+        sine += self.rng.standard_normal(len(self.slaves)) * p['sine_noise']
+
+        # PID loop on the tank level driving the inlet valve, integrating only while the valve is not saturated
+        error = p['pid_setpoint'] - self.level
+        integral = self.integral + error * dt
+        level_rate = (self.valve * p['tank_inflow'] - self.outflow) / p['tank_area']
+        valve = p['pid_kp'] * error + p['pid_ki'] * integral - p['pid_kd'] * level_rate
+        saturated = (valve < 0) | (valve > 1)
+        self.integral = np.where(saturated, self.integral, integral)
+        self.valve = np.clip(valve, 0, 1)
+
+        # tank level, with the outflow coefficient drifting as a random walk around its configured value
+        drift = np.exp(self.rng.standard_normal(len(self.slaves)) * p['tank_disturbance'] * np.sqrt(dt))
+        self.outflow_coefficient = np.clip(self.outflow_coefficient * drift, 0.5 * p['tank_outflow'], 2 * p['tank_outflow'])
+        self.outflow = self.outflow_coefficient * np.sqrt(self.level)
+        self.level = np.clip(self.level + (self.valve * p['tank_inflow'] - self.outflow) * dt / p['tank_area'], 0, p['tank_height'])
+
+        # threshold alarms, which set above (or below) their threshold and clear once back inside it by the hysteresis
+        hysteresis = p['alarm_hysteresis']
+        for index, (signal, threshold, is_high) in enumerate((
+                (self.level, p['alarm_level_high'], True),
+                (self.level, p['alarm_level_low'], False),
+                (sine, p['alarm_sine_high'], True))):
+            if is_high:
+                self.alarms[:, index] = np.where(signal > threshold, True, self.alarms[:, index] & (signal > threshold * (1 - hysteresis)))
+            else:
+                self.alarms[:, index] = np.where(signal < threshold, True, self.alarms[:, index] & (signal < threshold * (1 + hysteresis)))
+
+        # scale to register counts
+        signals = np.column_stack((self.ramp, sine, self.level, self.valve, self.outflow))
+        registers = np.clip(np.rint(signals * MODEL_REGISTER_SCALE), 0, MAX_REGISTER_VALUE).astype(np.uint16)
+        return (registers, self.alarms)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import numpy as np
+
+
+import logging
+import asyncio
+
+
+# declare contants
+
+POOL_SIZE = 4096 # number of payloads of each kind in the ring buffer, half is regenerated each time it is used up
+FLOAT_DISTRIBUTION = 'uniform:0:50' # distribution of the 32-bit floats written to holding registers
+FLOAT_DISTRIBUTIONS = {'uniform': 2, 'normal': 2, 'constant': 1} # name -> number of parameters
+COIL_DISTRIBUTION = 'same:0.5' # distribution of the coils written, same writes one random value to every coil
+COIL_DISTRIBUTIONS = {'same': 1, 'bernoulli': 1}
+MAX_FLOATS = 60 # up to 60 32-bit floats i.e., 120 holding registers per write
+MAX_COILS = 64 # up to 64 coils per write
+PAYLOAD_SEED = None # seed for the generated payloads, None for a different run each time
+
+PAYLOAD_POOL = None # pool shared by the write handlers of this process
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Pre-generated write payloads
+
+Building a payload per write with BinaryPayloadBuilder and random.uniform costs a python call per float. The pool generates
+a few thousand payloads at a time with numpy and hands them out from a ring buffer, so a write just takes the next payload.
+Once half the ring has been handed out that half is regenerated on the event loop in the background, and if the writers
+get round to it before it is regenerated they reuse the older payloads rather than waiting.
+
+| Distribution      | Payload                                                          |
+| ---               | ---                                                              |
+| uniform:low:high  | floats uniformly distributed from low to high                    |
+| normal:mean:std   | floats normally distributed                                      |
+| constant:value    | every float set to value                                         |
+| same:p            | every coil of a write set to one value, which is True with prob p |
+| bernoulli:p       | each coil True with probability p                                |
+
+Floats are packed as BinaryPayloadBuilder(byteorder=Endian.LITTLE) packs them, i.e. little endian bytes with the two
+registers of each float in big endian word order.
+"""
+
+
+def get_distribution(spec:str, distributions:dict) -> tuple:
+    LOGGER.debug(f'get_distribution: {spec}')
+
+    # parse name:param:param, returning (name, [params]) or None if invalid
+    try:
+        name, *params = spec.split(':')
+        params = [float(param) for param in params]
+    except ValueError as ve:
+        name, params = None, []
+    if name not in distributions or len(params) != distributions[name]:
+        msg = f'get_distribution: invalid distribution: {spec}, must be one of: ' + ', '.join(f'{name}({distributions[name]} parameters)' for name in distributions)
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+    return (name, params)
+
+
+class PayloadRing:
+    """
+    Ring buffer of payloads created by generate(count), regenerating each half of the ring once it has been handed out
+    """
+
+    def __init__(self, generate, size:int = POOL_SIZE):
+        self.generate = generate
+        self.size = max(2, size)
+        self.half = self.size // 2
+        self.payloads = generate(self.size)
+        self.index = 0
+
+    def refill(self, start:int, count:int):
+        self.payloads[start:start + count] = self.generate(count)
+
+    def take(self):
+        payload = self.payloads[self.index]
+        self.index = (self.index + 1) % self.size
+
+        # the half just finished with is regenerated after the current request, or now if there is no event loop
+        if self.index % self.half == 0:
+            start = (self.index - self.half) % self.size
+            try:
+                asyncio.get_running_loop().call_soon(self.refill, start, self.half)
+            except RuntimeError:
+                self.refill(start, self.half)
+        return payload
+
+
+class ModbusPayloadPool:
+    """
+    Pools of holding register and coil payloads for the write handlers
+    """
+
+    def __init__(self, floats:str = FLOAT_DISTRIBUTION, coils:str = COIL_DISTRIBUTION, size:int = POOL_SIZE, seed:int = PAYLOAD_SEED, fixed_length:bool = False):
+        self.rng = np.random.default_rng(seed)
+        self.fixed_length = fixed_length # every payload MAX_FLOATS floats or MAX_COILS coils long, for writers that slice their own length
+        self.floats = get_distribution(floats, FLOAT_DISTRIBUTIONS) or get_distribution(FLOAT_DISTRIBUTION, FLOAT_DISTRIBUTIONS)
+        self.coils = get_distribution(coils, COIL_DISTRIBUTIONS) or get_distribution(COIL_DISTRIBUTION, COIL_DISTRIBUTIONS)
+        self.register_ring = PayloadRing(self.generate_registers, size)
+        self.coil_ring = PayloadRing(self.generate_coils, size)
+
+    def generate_registers(self, count:int) -> list:
+        # count payloads of 1 to MAX_FLOATS floats, or all MAX_FLOATS if fixed length, as lists of register values
+        name, params = self.floats
+        if name == 'uniform':
+            floats = self.rng.uniform(params[0], params[1], (count, MAX_FLOATS))
+        elif name == 'normal':
+            floats = self.rng.normal(params[0], params[1], (count, MAX_FLOATS))
+        else:
+            floats = np.full((count, MAX_FLOATS), params[0])
+        registers = floats.astype('<f4').view('>u2').reshape(count, MAX_FLOATS, 2)[:, :, ::-1].reshape(count, 2 * MAX_FLOATS)
+        if self.fixed_length:
+            return registers.tolist()
+        num_registers = 2 * self.rng.integers(1, MAX_FLOATS + 1, count)
+        return [payload[:length] for payload, length in zip(registers.tolist(), num_registers.tolist())]
+
+    def generate_coils(self, count:int) -> list:
+        # count payloads of 1 to MAX_COILS coils, or all MAX_COILS if fixed length, as lists of bools
+        name, params = self.coils
+        if name == 'same':
+            coils = np.repeat(self.rng.random((count, 1)) < params[0], MAX_COILS, axis=1)
+        else:
+            coils = self.rng.random((count, MAX_COILS)) < params[0]
+        if self.fixed_length:
+            return coils.tolist()
+        num_coils = self.rng.integers(1, MAX_COILS + 1, count)
+        return [payload[:length] for payload, length in zip(coils.tolist(), num_coils.tolist())]
+
+    def registers(self) -> list:
+        return self.register_ring.take()
+
+    def coil_values(self) -> list:
+        return self.coil_ring.take()
+
+
+def set_payload_pool(floats:str = FLOAT_DISTRIBUTION, coils:str = COIL_DISTRIBUTION, size:int = POOL_SIZE, seed:int = PAYLOAD_SEED):
+    LOGGER.debug(f'set_payload_pool: floats={floats} coils={coils} size={size}')
+    global PAYLOAD_POOL
+    PAYLOAD_POOL = ModbusPayloadPool(floats, coils, size, seed)
+    return PAYLOAD_POOL
+
+
+def get_payload_pool() -> ModbusPayloadPool:
+    # the pool for this process, created with the default distributions on first use if not set
+    if PAYLOAD_POOL is None:
+        return set_payload_pool()
+    return PAYLOAD_POOL
@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import proto_server
+from proto_engine import ModbusFastTcpServer
+from proto_engine import ModbusFastServerProtocol
+from proto_codec import encode_request
+from proto_codec import encode_write_coils
+from proto_codec import encode_write_registers
+from proto_codec import MBAP_SIZE
+from proto_client import get_profile_requests
+from proto_client import get_arrival_times
+from proto_client import get_function_code_mix
+from proto_client import get_modbus_targets
+from proto_client import get_slaves_list
+from proto_client import ARRIVAL
+from proto_client import ARRIVAL_DISTRIBUTIONS
+from proto_client import FUNCTION_CODE_MIX
+from proto_client import TCP_PORT
+from proto_client import SLAVE_ID
+from proto_client import NUM_UNITS
+from proto_profile import load_traffic_profile
+from proto_schedule import open_schedule
+from proto_schedule import get_schedule_seed
+from proto_payload import FLOAT_DISTRIBUTION
+from proto_payload import COIL_DISTRIBUTION
+from proto_models import ProcessModelBank
+from proto_models import load_model_config
+from test_harness import create_mac_addr
+from test_harness import chunkify
+from test_harness import get_host_addresses
+from test_harness import get_num_hosts
+from test_harness import SLAVE_SUBNETS
+
+
+import argparse
+import logging
+import asyncio
+import heapq
+import ipaddress
+import itertools
+import math
+import random
+import struct
+import time
+
+
+# declare contants
+
+PCAP_FILE = 'proto_pcap.pcap'
+NUM_SLAVES = 10 # slaves from the first address of the slave subnets upwards, unless a slaves list or schedule is given
+NUM_MASTERS = 1 # masters from the last address of the master subnets downwards, each polling a contiguous chunk of the slaves, as test_harness.py
+RATE = 1000 # requests per second across all slaves
+DURATION = 60 # seconds of traffic
+RESPONSE_TIME = 0.0005 # seconds between a request and its response
+START_TIME = 1700000000.0 # capture time of the first packet, seconds since the epoch, fixed so a seed gives the same capture
+PCAP_BATCH = 4096 # packets written at a time
+
+LINKTYPE_ETHERNET = 1
+SNAPLEN = 65535
+PCAP_MAGIC_NS = 0xA1B23C4D # pcap with nanosecond timestamps
+PCAP_HEADER = struct.Struct('<IHHiIII') # magic, major, minor, time zone, sigfigs, snaplen, link type
+PCAP_RECORD = struct.Struct('<IIII') # seconds, nanoseconds, captured length, original length
+PCAPNG_SECTION = struct.Struct('<IIIHHqI') # block type, length, byte order magic, major, minor, section length, length
+PCAPNG_INTERFACE = struct.Struct('<IIHHIHHB3xHHI') # block type, length, link type, reserved, snaplen, if_tsresol, end of options, length
+PCAPNG_PACKET = struct.Struct('<IIIIIII') # block type, length, interface, timestamp high, timestamp low, captured, original length
+PCAPNG_LENGTH = struct.Struct('<I')
+
+ETHERNET_HEADER = struct.Struct('>6s6sH') # destination, source, ether type
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+IPV4_HEADER = struct.Struct('>BBHHHBBH4s4s') # version and header length, tos, total length, id, flags, ttl, protocol, checksum, source, destination
+IPV4_CHECKSUM_OFFSET = ETHERNET_HEADER.size + 10
+IPV6_HEADER = struct.Struct('>IHBB16s16s') # version, traffic class and flow label, payload length, next header, hop limit, source, destination
+IPV6_VERSION = 0x60000000
+IP_TTL = 64
+IP_DONT_FRAGMENT = 0x4000
+IPPROTO_TCP = 6
+TCP_HEADER = struct.Struct('>HHIIBBHHH') # source port, destination port, seq, ack, data offset, flags, window, checksum, urgent
+TCP_CHECKSUM_OFFSET = 16 # from the start of the TCP header
+TCP_PSEUDO_HEADER = struct.Struct('>4s4sBBH') # source, destination, zero, protocol, tcp length
+TCP_PSEUDO_HEADER_V6 = struct.Struct('>16s16sI3xB') # source, destination, tcp length, zeros, next header
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_WINDOW = 64240
+MASTER_PORTS = (32768, 60999) # linux ephemeral port range of the masters' connections
+MASTER_PREFIX_LENGTHS = {4: 24, 6: 64} # subnet of the slaves the masters are taken from, without master subnets of their IP version
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Offline pcap synthesis
+
+Writes the Modbus/TCP traffic of a simulation straight to a pcap or pcapng file, without sockets or VMs, for replay into an
+IDS. Requests come from the client's traffic profile and arrival options, or a request schedule written by proto_client
+-W, and are framed with the raw client codec. Each is answered by the fast server engine from the slave's own register
+context, so reads return what earlier writes stored, and the input registers and discrete inputs are updated every
+simulated second, toggling or from the process models, as the server updates them.
+
+| Layer    | Fields                                                                                                    |
+| ---      | ---                                                                                                       |
+| Ethernet | Siemens MACs from test_harness.create_mac_addr, one per master and slave                                  |
+| IPv4/6   | by default slaves 10.10.10.1 upwards, masters 10.10.10.254 downwards, DF, TTL 64, per host ids, checksums |
+| TCP      | a connection per master and slave with handshake and teardown, sequence and ack numbers, checksums        |
+| Modbus   | a request and its response RESPONSE_TIME later, transaction ids per connection                            |
+
+-S and -P set the slave and master subnets in place of those defaults as test_harness.py does, IPv4 or IPv6. Without a
+master subnet of a slave's IP version, its master is taken from the top of the slave subnets, or of a listed slave's /24
+or /64, skipping the slaves' own addresses.
+
+Packets are built with precompiled structs and written PCAP_BATCH at a time, a .pcapng output file writes pcapng and
+anything else pcap, both with nanosecond timestamps. The seed, START_TIME and options give the same capture every run.
+"""
+
+
+def get_checksum(data:bytes) -> int:
+    # internet checksum, summed in native byte order and so packed back in native byte order
+    if len(data) & 1:
+        data += b'\x00'
+    total = sum(memoryview(data).cast('H'))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def get_mac_bytes(mac_addr:str) -> bytes:
+    return bytes.fromhex(mac_addr.replace(':', ''))
+
+
+class TcpHost:
+    """
+    Ethernet and IPv4 or IPv6 addresses of a master or slave, with its IP id counter
+    """
+
+    def __init__(self, ipaddr:str, mac_addr:str):
+        address = ipaddress.ip_address(ipaddr)
+        self.ipaddr = ipaddr
+        self.mac_addr = mac_addr
+        self.mac = get_mac_bytes(mac_addr)
+        self.version = address.version
+        self.address = address.packed
+        self.ip_id = 0
+
+
+class TcpConnection:
+    """
+    A master's connection to a slave, building its frames with the sequence and ack numbers of each side
+    """
+
+    def __init__(self, client:TcpHost, client_port:int, server:TcpHost, server_port:int, rng:random.Random):
+        if client.version != server.version:
+            raise ValueError(f'master {client.ipaddr} and slave {server.ipaddr} are not the same IP version')
+        self.client = client
+        self.client_port = client_port
+        self.server = server
+        self.server_port = server_port
+        self.client_seq = rng.getrandbits(32) # initial sequence numbers, the SYNs take one each
+        self.server_seq = rng.getrandbits(32)
+        self.transaction_id = 0
+        self.open = False
+
+    def get_frame(self, from_client:bool, flags:int, payload:bytes = b'') -> bytes:
+        # Ethernet, IPv4 or IPv6 and TCP headers with checksums, then the payload, advancing the sender's sequence number
+        if from_client:
+            source, destination, source_port, destination_port = self.client, self.server, self.client_port, self.server_port
+            seq, ack = self.client_seq, self.server_seq
+            self.client_seq = (seq + len(payload) + bool(flags & (TCP_SYN | TCP_FIN))) & 0xFFFFFFFF
+        else:
+            source, destination, source_port, destination_port = self.server, self.client, self.server_port, self.client_port
+            seq, ack = self.server_seq, self.client_seq
+            self.server_seq = (seq + len(payload) + bool(flags & (TCP_SYN | TCP_FIN))) & 0xFFFFFFFF
+        if flags == TCP_SYN:
+            ack = 0
+        source.ip_id = (source.ip_id + 1) & 0xFFFF
+        tcp_length = TCP_HEADER.size + len(payload)
+
+        if source.version == 4:
+            frame = bytearray(ETHERNET_HEADER.pack(destination.mac, source.mac, ETHERTYPE_IPV4))
+            frame += IPV4_HEADER.pack(0x45, 0, IPV4_HEADER.size + tcp_length, source.ip_id, IP_DONT_FRAGMENT, IP_TTL, IPPROTO_TCP, 0, source.address, destination.address)
+            struct.pack_into('=H', frame, IPV4_CHECKSUM_OFFSET, get_checksum(frame[ETHERNET_HEADER.size:]))
+            pseudo_header = TCP_PSEUDO_HEADER.pack(source.address, destination.address, 0, IPPROTO_TCP, tcp_length)
+        else:
+            frame = bytearray(ETHERNET_HEADER.pack(destination.mac, source.mac, ETHERTYPE_IPV6))
+            frame += IPV6_HEADER.pack(IPV6_VERSION, tcp_length, IPPROTO_TCP, IP_TTL, source.address, destination.address)
+            pseudo_header = TCP_PSEUDO_HEADER_V6.pack(source.address, destination.address, tcp_length, IPPROTO_TCP)
+        tcp_offset = len(frame)
+        frame += TCP_HEADER.pack(source_port, destination_port, seq, ack, 0x50, flags, TCP_WINDOW, 0, 0)
+        frame += payload
+        struct.pack_into('=H', frame, tcp_offset + TCP_CHECKSUM_OFFSET, get_checksum(pseudo_header + frame[tcp_offset:]))
+        return bytes(frame)
+
+    def next_transaction_id(self) -> int:
+        self.transaction_id = self.transaction_id % 0xFFFF + 1
+        return self.transaction_id
+
+
+class PcapWriter:
+    """
+    pcap or pcapng file of Ethernet frames with nanosecond timestamps, written in batches
+    """
+
+    def __init__(self, pcap_file:str):
+        self.pcapng = pcap_file.endswith('.pcapng')
+        self.file_handle = open(pcap_file, 'wb')
+        self.batch = []
+        self.num_packets = 0
+        self.last_timestamp = 0
+        if self.pcapng:
+            self.file_handle.write(PCAPNG_SECTION.pack(0x0A0D0D0A, PCAPNG_SECTION.size, 0x1A2B3C4D, 1, 0, -1, PCAPNG_SECTION.size))
+            self.file_handle.write(PCAPNG_INTERFACE.pack(0x00000001, PCAPNG_INTERFACE.size, LINKTYPE_ETHERNET, 0, SNAPLEN, 9, 1, 9, 0, 0, PCAPNG_INTERFACE.size))
+        else:
+            self.file_handle.write(PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, SNAPLEN, LINKTYPE_ETHERNET))
+
+    def write(self, timestamp:int, frame:bytes):
+        # timestamps never go backwards, packets due at the same time keep the order they are written in
+        timestamp = max(timestamp, self.last_timestamp)
+        self.last_timestamp = timestamp
+        if self.pcapng:
+            padding = -len(frame) % 4
+            length = PCAPNG_PACKET.size + len(frame) + padding + PCAPNG_LENGTH.size
+            self.batch.append(PCAPNG_PACKET.pack(0x00000006, length, 0, timestamp >> 32, timestamp & 0xFFFFFFFF, len(frame), len(frame)))
+            self.batch.append(frame + b'\x00' * padding + PCAPNG_LENGTH.pack(length))
+        else:
+            self.batch.append(PCAP_RECORD.pack(timestamp // 1000000000, timestamp % 1000000000, len(frame), len(frame)))
+            self.batch.append(frame)
+        self.num_packets += 1
+        if len(self.batch) >= 2 * PCAP_BATCH:
+            self.flush()
+
+    def flush(self):
+        self.file_handle.write(b''.join(self.batch))
+        self.batch.clear()
+
+    def close(self):
+        self.flush()
+        self.file_handle.close()
+
+
+def get_request_frame(transaction_id:int, unit_id:int, function_code:int, request:tuple) -> bytes:
+    # MBAP frame of a request from the client's handler arguments, (address, count) or (address, values) of a write
+    if function_code == 0x10:
+        return encode_write_registers(transaction_id, unit_id, request[0], request[1])
+    if function_code == 0x0F:
+        return encode_write_coils(transaction_id, unit_id, request[0], request[1])
+    return encode_request(transaction_id, unit_id, function_code, request[0], request[1])
+
+
+def get_master_addresses(slaves:list, master_networks:list = None) -> dict:
+    # generator of master addresses per IP version, counting down the master subnets of that version, or else the subnet of its first slave
+    networks = {}
+    for network in master_networks or []:
+        networks.setdefault(network.version, []).append(network)
+    for ipaddr in slaves:
+        version = ipaddress.ip_address(ipaddr).version
+        if version not in networks:
+            networks[version] = [ipaddress.ip_network(f'{ipaddr}/{MASTER_PREFIX_LENGTHS[version]}', strict=False)]
+    slave_addresses = set(slaves)
+    return {version: (ipaddr for ipaddr, prefix_len in get_host_addresses(version_networks, descending=True) if ipaddr not in slave_addresses)
+            for version, version_networks in networks.items()}
+
+
+def get_hosts(slaves:list, num_masters:int = NUM_MASTERS, master_networks:list = None) -> tuple:
+    # a host per slave, and a master for each contiguous chunk of the slaves and IP version, with MACs from the test harness
+    slave_hosts = {ipaddr: TcpHost(ipaddr, create_mac_addr()) for ipaddr in slaves}
+    master_hosts = {}
+    master_addresses = get_master_addresses(slaves, master_networks)
+    chunks = list(chunkify(slaves, math.ceil(len(slaves) / max(1, num_masters))))
+    for chunk in chunks:
+        masters = {} # IP version -> master of the chunk's slaves of that version
+        for ipaddr in chunk:
+            version = slave_hosts[ipaddr].version
+            master = masters.get(version)
+            if master is None:
+                master_addr = next(master_addresses[version], None)
+                if master_addr is None:
+                    raise ValueError(f'no IPv{version} master addresses left for {len(chunks)} masters')
+                master = masters[version] = TcpHost(master_addr, create_mac_addr())
+            master_hosts[ipaddr] = master
+    return (slave_hosts, master_hosts)
+
+
+def get_networks(subnets:str) -> list:
+    # comma separated IPv4 or IPv6 CIDR networks, None if any is invalid
+    try:
+        return [ipaddress.ip_network(subnet.strip(), strict=False) for subnet in subnets.split(',')]
+    except ValueError as ve:
+        msg = f'get_networks: invalid subnets: {subnets}: {ve}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+
+
+async def write_modbus_pcap(pcap_file:str, targets:list, requests, duration:float, num_masters:int = NUM_MASTERS, num_units:int = NUM_UNITS, datastore:str = proto_server.DATASTORE, num_registers:int = proto_server.NUM_REGISTERS, process_models:ProcessModelBank = None, start_time:float = START_TIME, response_time:float = RESPONSE_TIME, seed:int = None, master_networks:list = None) -> int:
+    """
+    Write the request and response frames of every request to pcap_file, returning the number of packets written
+    """
+    LOGGER.debug(f'write_modbus_pcap: {pcap_file} targets={len(targets)} duration={duration}')
+
+    # declare local variables
+    rng = random.Random(seed) # ports and initial sequence numbers
+    slaves = list(dict.fromkeys(ipaddr for ipaddr, port, unit_id in targets))
+    try:
+        slave_hosts, master_hosts = get_hosts(slaves, num_masters, master_networks)
+    except ValueError as ve:
+        msg = f'write_modbus_pcap: unable to address the masters: {ve}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return 0
+    server_id = proto_server.get_server_identity()
+    server_contexts = {}
+    server_protocols = {} # slave ipaddr -> fast server engine protocol answering its requests
+    connections = {} # (slave ipaddr, port) -> TcpConnection
+    master_ports = {} # master ipaddr -> ports in use
+    target_connections = []
+    for ipaddr, port, unit_id in targets:
+        if ipaddr not in server_protocols:
+            server_contexts[ipaddr] = proto_server.get_modbus_server_context(num_units, datastore, num_registers)
+            server_protocols[ipaddr] = ModbusFastServerProtocol(ModbusFastTcpServer(server_contexts[ipaddr], server_id, (ipaddr, port)))
+        connection = connections.get((ipaddr, port))
+        if connection is None:
+            master = master_hosts[ipaddr]
+            ports = master_ports.setdefault(master.ipaddr, set())
+            client_port = rng.randint(*MASTER_PORTS)
+            while client_port in ports:
+                client_port = rng.randint(*MASTER_PORTS)
+            ports.add(client_port)
+            try:
+                connection = connections[(ipaddr, port)] = TcpConnection(master, client_port, slave_hosts[ipaddr], port, rng)
+            except ValueError as ve:
+                msg = f'write_modbus_pcap: unable to connect: {ve}'
+                LOGGER.error(msg)
+                print(f'[!] {msg}')
+                return 0
+        target_connections.append((connection, server_protocols[ipaddr], unit_id))
+    update_state = {}
+    next_update = 0.0
+    responses = [] # heap of (time, order, connection, response frame) of the responses not yet written
+    start_ns = int(start_time * 1e9)
+    response_ns = int(response_time * 1e9)
+    order = 0
+
+    try:
+        pcap_writer = PcapWriter(pcap_file)
+    except OSError as oe:
+        msg = f'write_modbus_pcap: unable to write: {pcap_file}: {oe}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return 0
+
+    try:
+        for offset, target_idx, function_code, request in requests:
+            if duration and offset >= duration:
+                break
+
+            # the register updates due by now, then the responses due before this request
+            while next_update <= offset:
+                proto_server.update_server_registers(server_contexts, SLAVE_ID, update_state, process_models, proto_server.UPDATE_INTERVAL)
+                next_update += proto_server.UPDATE_INTERVAL
+            timestamp = start_ns + int(offset * 1e9)
+            while responses and responses[0][0] <= timestamp:
+                response_timestamp, response_order, connection, response = heapq.heappop(responses)
+                pcap_writer.write(response_timestamp, connection.get_frame(False, TCP_PSH | TCP_ACK, response))
+
+            # the connection's handshake before its first request
+            connection, server_protocol, unit_id = target_connections[target_idx]
+            if not connection.open:
+                connection.open = True
+                pcap_writer.write(timestamp - 3000, connection.get_frame(True, TCP_SYN))
+                pcap_writer.write(timestamp - 2000, connection.get_frame(False, TCP_SYN | TCP_ACK))
+                pcap_writer.write(timestamp - 1000, connection.get_frame(True, TCP_ACK))
+
+            # the request, executed on the slave's registers now, and its response when due
+            transaction_id = connection.next_transaction_id()
+            frame = get_request_frame(transaction_id, unit_id, function_code, request)
+            pcap_writer.write(timestamp, connection.get_frame(True, TCP_PSH | TCP_ACK, frame))
+            response = server_protocol.execute(memoryview(frame)[MBAP_SIZE + 1:], transaction_id, unit_id, function_code)
+            order += 1
+            heapq.heappush(responses, (timestamp + response_ns, order, connection, response))
+
+        # the responses still due, then close every connection
+        while responses:
+            response_timestamp, response_order, connection, response = heapq.heappop(responses)
+            pcap_writer.write(response_timestamp, connection.get_frame(False, TCP_PSH | TCP_ACK, response))
+        for connection in connections.values():
+            if connection.open:
+                timestamp = pcap_writer.last_timestamp
+                pcap_writer.write(timestamp + 1000, connection.get_frame(True, TCP_FIN | TCP_ACK))
+                pcap_writer.write(timestamp + 2000, connection.get_frame(False, TCP_FIN | TCP_ACK))
+                pcap_writer.write(timestamp + 3000, connection.get_frame(True, TCP_ACK))
+    finally:
+        pcap_writer.close()
+
+    return pcap_writer.num_packets
+
+
+async def run_main():
+    LOGGER.debug('run_main')
+
+    # parse command line arguments
+    parser = argparse.ArgumentParser(
+                    prog='proto_pcap',
+                    description='Write the Modbus/TCP traffic of a simulation straight to a pcap or pcapng file')
+    parser.add_argument('-o', '--output', default=PCAP_FILE, help=f'capture file, pcapng if it ends in .pcapng, otherwise pcap, default = "{PCAP_FILE}"')
+    parser.add_argument('-n', '--slaves', type=int, default=NUM_SLAVES, help=f'number of slaves from the first address of the slave subnets up, at most the number of host addresses in them, ignored with -l or -R, default = {NUM_SLAVES}')
+    parser.add_argument('-l', '--slaves_list', help='file containing line separated list of slave IP addresses, overrides -n')
+    parser.add_argument('-S', '--slave_subnets', default=SLAVE_SUBNETS, help=f'comma separated IPv4 or IPv6 CIDR networks the -n slaves are allocated from, as test_harness.py -S, default = "{SLAVE_SUBNETS}"')
+    parser.add_argument('-m', '--masters', type=int, default=NUM_MASTERS, help=f'number of masters, each polling a contiguous chunk of the slaves, default = {NUM_MASTERS}')
+    parser.add_argument('-P', '--master_subnets', help='comma separated IPv4 or IPv6 CIDR networks the masters are allocated from, counting down from the last address, as test_harness.py -M, default = the slave subnets, or the /24 or /64 of listed slaves')
+    parser.add_argument('-p', '--port', type=int, default=TCP_PORT, help=f'slave port, default = {TCP_PORT}')
+    parser.add_argument('-u', '--units', type=int, default=NUM_UNITS, help=f'number of unit ids polled behind each slave, default = {NUM_UNITS}')
+    parser.add_argument('-r', '--rate', type=float, default=RATE, help=f'requests per second across all slaves, default = {RATE}')
+    parser.add_argument('-a', '--arrival', choices=ARRIVAL_DISTRIBUTIONS, default=ARRIVAL, help=f'request arrival distribution, default = "{ARRIVAL}"')
+    parser.add_argument('-t', '--duration', type=float, default=DURATION, help=f'seconds of traffic, default = {DURATION}')
+    parser.add_argument('-x', '--mix', default=FUNCTION_CODE_MIX, help=f'function_code:weight mix, as proto_client -m, default = "{FUNCTION_CODE_MIX}"')
+    parser.add_argument('-f', '--floats', default=FLOAT_DISTRIBUTION, help=f'distribution of the floats written to holding registers, as proto_client -f, default = "{FLOAT_DISTRIBUTION}"')
+    parser.add_argument('-b', '--coils', default=COIL_DISTRIBUTION, help=f'distribution of the coils written, as proto_client -b, default = "{COIL_DISTRIBUTION}"')
+    parser.add_argument('-F', '--profile', help='traffic profile, as proto_client -F, default = -x, -f and -b for every slave')
+    parser.add_argument('-R', '--schedule', help='write the requests of this request schedule written by proto_client -W instead, overrides -n, -l, -u, -r, -a and -F')
+    parser.add_argument('-e', '--seed', type=int, help='seed of the requests, ports, sequence numbers and MACs, default = a random seed, reported')
+    parser.add_argument('-d', '--datastore', choices=proto_server.DATASTORES, default=proto_server.DATASTORE, help=f'register storage of the slaves, as proto_server -d, default = "{proto_server.DATASTORE}"')
+    parser.add_argument('-g', '--registers', type=int, default=proto_server.NUM_REGISTERS, help='number of registers or bits in each block, as proto_server -r, default = 0 i.e., just enough for the client requests')
+    parser.add_argument('-M', '--models', nargs='?', const='', default=None, help='drive the input registers and discrete inputs from process models, as proto_server -M, default = toggle every other value')
+    parser.add_argument('-s', '--start', type=float, default=START_TIME, help=f'capture time of the first request, seconds since the epoch, default = {START_TIME}')
+    parser.add_argument('-T', '--response_time', type=float, default=RESPONSE_TIME, help=f'seconds between each request and its response, default = {RESPONSE_TIME}')
+    args = parser.parse_args()
+
+    # declare local variables
+    seed = args.seed if args.seed is not None else get_schedule_seed()
+    process_models = ProcessModelBank(load_model_config(args.models)) if args.models is not None else None
+    schedule = None
+    slave_networks = get_networks(args.slave_subnets)
+    master_networks = get_networks(args.master_subnets) if args.master_subnets else []
+    if slave_networks is None or master_networks is None:
+        return
+
+    # requests from a schedule, or drawn from the profile as the open-loop client draws them
+    random.seed(seed) # arrival times and MACs
+    if args.schedule:
+        schedule = open_schedule(args.schedule)
+        if not schedule:
+            return
+        targets = schedule.targets
+        requests = schedule.read_requests()
+        duration = schedule.duration
+    else:
+        function_code_mix = get_function_code_mix(args.mix)
+        if not function_code_mix:
+            return
+        num_hosts = get_num_hosts(slave_networks)
+        if not args.slaves_list and not 1 <= args.slaves <= num_hosts:
+            msg = f'run_main: number of slaves {args.slaves} must be 1 - {num_hosts}, the host addresses in {args.slave_subnets}'
+            LOGGER.error(msg)
+            print(f'[!] {msg}')
+            return
+        slaves = get_slaves_list(args.slaves_list) if args.slaves_list else [ipaddr for ipaddr, prefix_len in itertools.islice(get_host_addresses(slave_networks), args.slaves)]
+        if not args.slaves_list:
+            master_networks = master_networks + slave_networks # masters count down the slave subnets of their IP version, as test_harness.py
+        targets = get_modbus_targets(slaves, args.port, SLAVE_ID, args.units)
+        traffic_profile = load_traffic_profile(args.profile, function_code_mix, args.floats, args.coils, seed=seed)
+        if not traffic_profile or not targets or args.rate <= 0 or args.duration <= 0:
+            msg = 'run_main: a capture needs slaves, a rate and a duration'
+            LOGGER.error(msg)
+            print(f'[!] {msg}')
+            return
+        requests = get_profile_requests(traffic_profile, targets, get_arrival_times(args.arrival, args.rate))
+        duration = args.duration
+
+    start = time.perf_counter()
+    try:
+        num_packets = await write_modbus_pcap(args.output, targets, requests, duration, args.masters, args.units, args.datastore, args.registers, process_models, args.start, args.response_time, seed, master_networks)
+    finally:
+        if schedule:
+            schedule.close()
+    elapsed = time.perf_counter() - start
+    if not num_packets:
+        return
+    msg = f'proto_pcap: wrote {num_packets} packets of {duration}s of traffic to {len(targets)} targets with seed {seed} to: {args.output} in {elapsed:.1f}s ({num_packets / elapsed * 60 if elapsed else 0:.0f} packets/minute)'
+    LOGGER.info(msg)
+    print(f'[+] {msg}')
+
+
+if __name__ == '__main__':
+    asyncio.run(run_main())
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import numpy as np
+
+from proto_payload import ModbusPayloadPool
+from proto_payload import get_distribution
+from proto_payload import FLOAT_DISTRIBUTION
+from proto_payload import FLOAT_DISTRIBUTIONS
+from proto_payload import COIL_DISTRIBUTION
+from proto_payload import COIL_DISTRIBUTIONS
+from proto_payload import POOL_SIZE
+
+
+import logging
+import ipaddress
+import json
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None # python < 3.11, TOML profiles are not available
+
+
+# declare contants
+
+PROFILE_SEED = None # seed for the request tables, None for a different run each time
+SAMPLE_BATCH = 4096 # requests, addresses, counts and write decisions drawn at a time
+WRITE_PROBABILITY = 0.5 # chance a closed-loop poll writes the coils and holding registers it has read
+FUNCTION_CODE_WEIGHTS = {0x01: 2, 0x02: 2, 0x03: 2, 0x04: 2, 0x0F: 1, 0x10: 1} # as FUNCTION_CODE_MIX in proto_client
+WRITE_FUNCTION_CODES = [0x0F, 0x10]
+
+# function code -> (first address range, count range) of each request, inclusive, matching the client's default polls
+REQUEST_RANGES = {
+    0x01: ((1, 1), (1, 1)),     # read coils
+    0x02: ((1, 1), (1, 123)),   # read discrete inputs
+    0x03: ((1, 1), (1, 1)),     # read holding registers
+    0x04: ((1, 1), (1, 123)),   # read input registers
+    0x0F: ((1, 1), (1, 64)),    # write coils, count is the number of coils
+    0x10: ((1, 1), (2, 120)),   # write holding registers, count is the number of registers, rounded down to whole floats
+}
+MAX_ADDRESS = 0xFFFF
+MAX_COUNTS = {0x01: 2000, 0x02: 2000, 0x03: 125, 0x04: 125, 0x0F: 64, 0x10: 120} # writes are limited by the payload pool
+
+GROUP_FIELDS = ['name', 'slaves', 'rate', 'function_codes', 'addresses', 'counts', 'write_probability', 'floats', 'coils']
+
+TRAFFIC_PROFILE = None # profile shared by the handlers of this process
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Traffic profiles
+
+A traffic profile describes the requests the client sends to groups of slaves. It is read once at startup, from JSON or
+TOML, and compiled into sampling tables: the (slave, function code) pairs of every slave polled are weighted by the rate
+of the slave's group and the function code weights, and put into a Walker alias table, and each group's address ranges,
+count ranges and write probability become vectors of bounds. Requests, addresses, counts and write decisions are then
+drawn SAMPLE_BATCH at a time with numpy, so picking the next request is a list index with no parsing or per request random
+calls.
+
+| Field             | Description                                                                              |
+| ---               | ---                                                                                      |
+| name              | name of the group, reported in the log                                                   |
+| slaves            | slave IP addresses and CIDR networks in the group, the default group has every other slave |
+| rate              | open-loop requests per second to each slave of the group, relative weight with -r        |
+| function_codes    | function code weights, closed-loop polls skip function codes with no weight              |
+| addresses         | first address of the requests per function code, an address or [low, high]              |
+| counts            | registers or coils per request per function code, a count or [low, high]                |
+| write_probability | chance each closed-loop poll writes the coils and holding registers after reading them   |
+| floats / coils    | distributions of the values written, as -f and -b                                         |
+
+The default group takes its function code weights from -m and its value distributions from -f and -b, and every group
+inherits whatever it does not set from the default group, e.g.
+
+    {
+        "seed": 1,
+        "default": {"rate": 2, "write_probability": 0.1},
+        "groups": [
+            {"name": "tanks", "slaves": ["10.10.10.0/28"], "rate": 10, "function_codes": {"3": 4, "16": 1},
+                "addresses": {"3": [1, 40]}, "counts": {"3": [2, 20], "16": [2, 10]}, "floats": "normal:2.5:0.3"}
+        ]
+    }
+
+With every group setting a rate and no -r, the open-loop generator runs at the total rate of the profile.
+"""
+
+
+class AliasTable:
+    """
+    Walker alias table, drawing indexes in proportion to their weights in constant time per draw
+    """
+
+    def __init__(self, weights:list):
+        # check parameters
+        total = sum(weights)
+        assert weights and total > 0
+
+        # split every weight above the mean with the weights below it, so each slot holds at most two indexes
+        num_weights = len(weights)
+        probabilities = [weight * num_weights / total for weight in weights]
+        aliases = list(range(num_weights))
+        small = [index for index, probability in enumerate(probabilities) if probability < 1]
+        large = [index for index, probability in enumerate(probabilities) if probability >= 1]
+        while small and large:
+            index = small.pop()
+            alias = large.pop()
+            aliases[index] = alias
+            probabilities[alias] += probabilities[index] - 1
+            (small if probabilities[alias] < 1 else large).append(alias)
+        for index in small + large:
+            probabilities[index] = 1.0
+
+        self.probabilities = np.array(probabilities)
+        self.aliases = np.array(aliases)
+
+    def sample(self, rng, size:int) -> np.ndarray:
+        indexes = rng.integers(0, len(self.aliases), size)
+        return np.where(rng.random(size) < self.probabilities[indexes], indexes, self.aliases[indexes])
+
+
+class BatchSampler:
+    """
+    Values drawn by draw(count) SAMPLE_BATCH at a time and handed out in order
+    """
+
+    def __init__(self, draw, batch:int = SAMPLE_BATCH):
+        self.draw = draw
+        self.batch = batch
+        self.values = []
+        self.index = 0
+
+    def take(self):
+        if self.index == len(self.values):
+            self.values = self.draw(self.batch)
+            self.index = 0
+        value = self.values[self.index]
+        self.index += 1
+        return value
+
+
+class TrafficGroup:
+    """
+    Compiled requests of a group of slaves
+    """
+
+    def __init__(self, name:str, networks:list, rate:float, function_codes:dict, addresses:dict, counts:dict, write_probability:float, payload_pool, rng):
+        self.name = name
+        self.networks = networks
+        self.rate = rate
+        self.function_codes = function_codes # function code -> weight
+        self.polled = {function_code for function_code, weight in function_codes.items() if weight > 0}
+        self.write_probability = write_probability
+        self.payload_pool = payload_pool
+        self.addresses = addresses # function code -> (low, high) first address
+        self.counts = counts # function code -> (low, high) registers or coils
+        self.rng = rng
+        self.samplers = {function_code: BatchSampler(self.get_draw(addresses[function_code], counts[function_code], 2 if function_code == 0x10 else 1)) for function_code in REQUEST_RANGES}
+        self.writes = BatchSampler(lambda size: (rng.random(size) < write_probability).tolist())
+
+    def get_draw(self, address_range:tuple, count_range:tuple, scale:int):
+        # (address, count) pairs uniform over the ranges, holding register writes drawn in whole floats of 2 registers
+        address_low, address_high = address_range
+        count_low, count_high = max(1, count_range[0] // scale), max(1, count_range[1] // scale)
+
+        def draw(size:int) -> list:
+            addresses = self.rng.integers(address_low, address_high + 1, size)
+            counts = self.rng.integers(count_low, count_high + 1, size) * scale
+            return list(zip(addresses.tolist(), counts.tolist()))
+        return draw
+
+    def contains(self, ipaddr:str) -> bool:
+        # a target given by host name is in no network, so falls through to the default group
+        try:
+            address = ipaddress.ip_address(ipaddr)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+    def take(self, function_code:int) -> tuple:
+        # (address, count) of the next request, or (address, values) of a write
+        address, count = self.samplers[function_code].take()
+        if function_code == 0x10:
+            return (address, self.payload_pool.registers()[:count])
+        if function_code == 0x0F:
+            return (address, self.payload_pool.coil_values()[:count])
+        return (address, count)
+
+    def take_write(self) -> bool:
+        return self.writes.take()
+
+
+class RequestTable:
+    """
+    (target index, function code) of every request the open-loop generator can issue, drawn from an alias table
+    """
+
+    def __init__(self, entries:list, rng):
+        targets, function_codes, weights = zip(*entries)
+        self.targets = np.array(targets)
+        self.function_codes = np.array(function_codes)
+        self.alias_table = AliasTable(list(weights))
+        self.rng = rng
+        self.requests = BatchSampler(self.draw)
+
+    def draw(self, size:int) -> list:
+        indexes = self.alias_table.sample(self.rng, size)
+        return list(zip(self.targets[indexes].tolist(), self.function_codes[indexes].tolist()))
+
+    def take(self) -> tuple:
+        return self.requests.take()
+
+
+class TrafficProfile:
+    """
+    Groups of slaves and the requests sent to them, with the default group for slaves in no other group
+    """
+
+    def __init__(self, groups:list, default_group:TrafficGroup, rng):
+        self.groups = groups
+        self.default_group = default_group
+        self.rng = rng
+        self.slave_groups = {} # ipaddr -> group, filled as slaves are looked up
+
+    def get_group(self, ipaddr:str) -> TrafficGroup:
+        group = self.slave_groups.get(ipaddr)
+        if group is None:
+            group = next((group for group in self.groups if group.contains(ipaddr)), self.default_group)
+            self.slave_groups[ipaddr] = group
+        return group
+
+    def get_rate(self, targets:list) -> float:
+        # total requests/s of the targets if every group they fall in sets a rate, otherwise 0
+        rates = [self.get_group(ipaddr).rate for ipaddr, port, slave_id in targets]
+        if not rates or None in rates:
+            return 0
+        return sum(rates)
+
+    def compile(self, targets:list) -> RequestTable:
+        LOGGER.debug(f'TrafficProfile.compile: {len(targets)} targets')
+
+        # weight each function code of each target by its group's rate per slave and function code weights
+        entries = []
+        for target_index, (ipaddr, port, slave_id) in enumerate(targets):
+            group = self.get_group(ipaddr)
+            total_weight = sum(group.function_codes.values())
+            for function_code, weight in group.function_codes.items():
+                if weight > 0:
+                    entries.append((target_index, function_code, (group.rate or 1) * weight / total_weight))
+        if not entries:
+            return None
+        return RequestTable(entries, self.rng)
+
+
+def get_range(value, function_code:int, limit:int, field:str) -> tuple:
+    # (low, high) from a number or a [low, high] pair, within 0/1 - limit
+    low, high = (value, value) if isinstance(value, (int, float)) else value
+    low, high = int(low), int(high)
+    minimum = 0 if field == 'addresses' else 1
+    if low < minimum or high < low or high > limit:
+        raise ValueError(f'{field} of function code {function_code}: {value} must be within {minimum} - {limit}')
+    return (low, high)
+
+
+def get_function_codes(section:dict, field:str) -> dict:
+    # function code keys of a profile section as integers, decimal e.g., "3" or "03", or hex with a 0x prefix e.g., "0x03"
+    function_codes = {}
+    for function_code, value in section.get(field, {}).items():
+        if isinstance(function_code, str) and function_code.strip().lower().startswith('0x'):
+            function_code = int(function_code, 16)
+        else:
+            function_code = int(function_code)
+        if function_code not in REQUEST_RANGES:
+            raise ValueError(f'{field}: unsupported function code: {function_code}, must be one of {list(REQUEST_RANGES)}')
+        function_codes[function_code] = value
+    return function_codes
+
+
+def get_traffic_group(section:dict, default:dict, rng, payload_pools:dict, pool_size:int, seed:int) -> TrafficGroup:
+    # group from a profile section, with whatever it does not set taken from the default group's section
+    for name in section:
+        if name not in GROUP_FIELDS:
+            LOGGER.error(f'get_traffic_group: ignoring unknown traffic profile field: {name}')
+
+    # declare local variables
+    name = section.get('name', default.get('name'))
+    networks = [ipaddress.ip_network(spec, strict=False) for spec in section.get('slaves', [])]
+    rate = section.get('rate', default.get('rate'))
+    function_codes = get_function_codes(section, 'function_codes') or get_function_codes(default, 'function_codes') or dict(FUNCTION_CODE_WEIGHTS)
+    addresses = {function_code: address_range for function_code, (address_range, count_range) in REQUEST_RANGES.items()}
+    counts = {function_code: count_range for function_code, (address_range, count_range) in REQUEST_RANGES.items()}
+    write_probability = float(section.get('write_probability', default.get('write_probability', WRITE_PROBABILITY)))
+    floats = section.get('floats', default.get('floats', FLOAT_DISTRIBUTION))
+    coils = section.get('coils', default.get('coils', COIL_DISTRIBUTION))
+
+    # check parameters
+    if rate is not None and float(rate) <= 0:
+        raise ValueError(f'group {name}: rate: {rate} must be above 0')
+    if any(float(weight) < 0 for weight in function_codes.values()) or not sum(float(weight) for weight in function_codes.values()):
+        raise ValueError(f'group {name}: function code weights: {function_codes} must not be negative and must not all be 0')
+    if not 0 <= write_probability <= 1:
+        raise ValueError(f'group {name}: write_probability: {write_probability} must be within 0 - 1')
+    if not get_distribution(floats, FLOAT_DISTRIBUTIONS) or not get_distribution(coils, COIL_DISTRIBUTIONS):
+        raise ValueError(f'group {name}: invalid value distributions: floats {floats}, coils {coils}')
+
+    for source in (default, section):
+        for function_code, value in get_function_codes(source, 'addresses').items():
+            addresses[function_code] = get_range(value, function_code, MAX_ADDRESS, 'addresses')
+        for function_code, value in get_function_codes(source, 'counts').items():
+            counts[function_code] = get_range(value, function_code, MAX_COUNTS[function_code], 'counts')
+    for function_code in REQUEST_RANGES:
+        if addresses[function_code][1] + counts[function_code][1] > MAX_ADDRESS + 1:
+            raise ValueError(f'group {name}: function code {function_code}: addresses up to {addresses[function_code][1]} with counts up to {counts[function_code][1]} run past address {MAX_ADDRESS}')
+
+    # groups writing the same distributions share a payload pool
+    payload_pool = payload_pools.get((floats, coils))
+    if payload_pool is None:
+        payload_pool = payload_pools[(floats, coils)] = ModbusPayloadPool(floats, coils, pool_size, seed, fixed_length=True)
+
+    return TrafficGroup(name, networks, float(rate) if rate is not None else None,
+            {function_code: float(weight) for function_code, weight in function_codes.items()}, addresses, counts,
+            write_probability, payload_pool, rng)
+
+
+def read_profile_file(profile_file:str) -> dict:
+    # JSON, or TOML for .toml files
+    if profile_file.endswith('.toml'):
+        if tomllib is None:
+            raise ValueError('TOML traffic profiles need python 3.11 or later')
+        with open(profile_file, 'rb') as file_handle:
+            return tomllib.load(file_handle)
+    with open(profile_file, 'r') as file_handle:
+        return json.load(file_handle)
+
+
+def load_traffic_profile(profile_file:str = None, function_code_mix:dict = None, floats:str = FLOAT_DISTRIBUTION, coils:str = COIL_DISTRIBUTION, pool_size:int = POOL_SIZE, seed:int = None) -> TrafficProfile:
+    LOGGER.debug(f'load_traffic_profile: {profile_file}')
+
+    # the command line sets the default group, then the profile file overrides it and adds groups
+    default = {'name': 'default', 'function_codes': dict(function_code_mix or FUNCTION_CODE_WEIGHTS), 'floats': floats, 'coils': coils}
+    config = {}
+    try:
+        if profile_file:
+            config = read_profile_file(profile_file)
+        if seed is None:
+            seed = config.get('seed', PROFILE_SEED)
+        rng = np.random.default_rng(seed)
+        default.update(config.get('default', {}))
+        payload_pools = {}
+        default_group = get_traffic_group(default, {}, rng, payload_pools, pool_size, seed)
+        groups = [get_traffic_group(section, default, rng, payload_pools, pool_size, seed) for section in config.get('groups', [])]
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        msg = f'load_traffic_profile: unable to load traffic profile: {profile_file}: {e}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+
+    for index, group in enumerate(groups):
+        group.name = group.name or f'group {index + 1}'
+        LOGGER.info(f'load_traffic_profile: {group.name}: {len(group.networks)} networks, rate {group.rate}, function codes {group.function_codes}, write probability {group.write_probability}')
+    return TrafficProfile(groups, default_group, rng)
+
+
+def set_traffic_profile(profile_file:str = None, function_code_mix:dict = None, floats:str = FLOAT_DISTRIBUTION, coils:str = COIL_DISTRIBUTION, pool_size:int = POOL_SIZE) -> TrafficProfile:
+    LOGGER.debug(f'set_traffic_profile: {profile_file}')
+    global TRAFFIC_PROFILE
+
+    traffic_profile = load_traffic_profile(profile_file, function_code_mix, floats, coils, pool_size)
+    if traffic_profile:
+        TRAFFIC_PROFILE = traffic_profile
+    return traffic_profile
+
+
+def get_traffic_profile() -> TrafficProfile:
+    # the profile for this process, created from the defaults on first use if not set
+    if TRAFFIC_PROFILE is None:
+        return set_traffic_profile()
+    return TRAFFIC_PROFILE
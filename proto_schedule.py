@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+import numpy as np
+
+from proto_profile import TrafficProfile
+from proto_profile import WRITE_FUNCTION_CODES
+from proto_payload import MAX_FLOATS
+from proto_payload import MAX_COILS
+from proto_journal import pack_endpoint
+from proto_journal import unpack_endpoint
+
+
+import argparse
+import logging
+import mmap
+import struct
+import secrets
+
+
+# declare contants
+
+SCHEDULE_MAGIC = b'MBRS'
+SCHEDULE_VERSION = 1
+# magic, version, record size, seed, number of records, rate, duration, number of targets, payloads per pool, number of pools
+SCHEDULE_HEADER = struct.Struct('<4sHHQQddIII')
+SCHEDULE_TARGET = struct.Struct('<16sHBx') # slave endpoint address (IPv6, IPv4 mapped), port, unit id
+# offset (ns), target index, function code, address, count, payload index
+SCHEDULE_RECORD = struct.Struct('<QIB3xHHI')
+SCHEDULE_DTYPE = np.dtype({
+    'names': ['offset', 'target', 'function_code', 'address', 'count', 'payload'],
+    'formats': ['<u8', '<u4', 'u1', '<u2', '<u2', '<u4'],
+    'offsets': [0, 8, 12, 16, 18, 20],
+    'itemsize': SCHEDULE_RECORD.size,
+})
+SCHEDULE_FIELDS = ['offset', 'ipaddr', 'port', 'unit_id', 'function_code', 'address', 'count', 'payload']
+REGISTER_PAYLOAD_SIZE = 2 * MAX_FLOATS * 2 # bytes of a full length holding register payload, 2 registers per float
+COIL_PAYLOAD_SIZE = MAX_COILS # bytes of a full length coil payload, one per coil
+
+SCHEDULE_PAYLOADS = 4096 # holding register and coil payloads of each value distribution stored in the schedule
+SCHEDULE_CHUNK = 65536 # records generated, written and read at a time
+BURST_SIZE = 10 # number of back to back requests in each burst for bursty arrivals, as proto_client
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Request schedules
+
+A schedule is every request of an open-loop run generated up front from a seed, the targets and the traffic profile, and
+written to a binary file, so the same traffic can be replayed any number of times e.g., to validate IDS rules against it.
+The client streams a schedule back through mmap, SCHEDULE_CHUNK records at a time, so runs of hundreds of millions of
+requests replay in constant memory with no random numbers drawn while running. Arrival times, targets, function codes,
+addresses and counts are drawn SCHEDULE_CHUNK at a time with numpy, and the write payloads are stored once per value
+distribution and referenced by index from each write.
+
+| Section  | Size                                       | Description                                                     |
+| ---      | ---                                        | ---                                                             |
+| header   | 52b                                        | magic, version, record size, seed, records, rate, duration, ... |
+| targets  | 20b per target                             | slave endpoint address (IPv4 mapped), port and unit id          |
+| payloads | (240b + 64b) x SCHEDULE_PAYLOADS per pool  | full length holding register values (uint16) and coils (bytes)  |
+| records  | 24b per request                            | offset ns, target, function code, address, count, payload       |
+
+Writes send the first count values of their payload. `proto_client.py -W schedule.bin -e SEED -r RATE -t SECONDS` writes a
+schedule for the client's targets, profile, mix and arrival options, `proto_client.py -R schedule.bin` replays it, and
+`proto_schedule.py schedule.bin` summarises it, or lists its records with -o csv.
+"""
+
+
+def get_arrival_offsets(rng, arrival:str, rate:float, start:float, size:int) -> np.ndarray:
+    # about size arrival times in seconds following start, averaging rate requests per second
+    if arrival == 'poisson':
+        return start + np.cumsum(rng.exponential(1.0 / rate, size))
+    if arrival == 'bursty':
+        # bursts of back to back requests with exponential gaps between bursts
+        num_bursts = max(1, size // BURST_SIZE)
+        return np.repeat(start + np.cumsum(rng.exponential(BURST_SIZE / rate, num_bursts)), BURST_SIZE)
+    return start + np.arange(1, size + 1) / rate
+
+
+def get_schedule_tables(traffic_profile:TrafficProfile, targets:list, request_table) -> tuple:
+    # per request table entry bounds of the addresses and counts, and the payload pool of each group
+    payload_pools = []
+    columns = {name: [] for name in ('address_low', 'address_high', 'count_low', 'count_high', 'scale', 'pool')}
+    for target_index, function_code in zip(request_table.targets.tolist(), request_table.function_codes.tolist()):
+        group = traffic_profile.get_group(targets[target_index][0])
+        if group.payload_pool not in payload_pools:
+            payload_pools.append(group.payload_pool)
+        scale = 2 if function_code == 0x10 else 1 # holding register writes are whole floats
+        columns['address_low'].append(group.addresses[function_code][0])
+        columns['address_high'].append(group.addresses[function_code][1])
+        columns['count_low'].append(max(1, group.counts[function_code][0] // scale))
+        columns['count_high'].append(max(1, group.counts[function_code][1] // scale))
+        columns['scale'].append(scale)
+        columns['pool'].append(payload_pools.index(group.payload_pool))
+    return ({name: np.array(values) for name, values in columns.items()}, payload_pools)
+
+
+def get_schedule_seed() -> int:
+    # a fresh seed, reported so the schedule can be regenerated
+    return secrets.randbits(63)
+
+
+def write_schedule(schedule_file:str, targets:list, traffic_profile:TrafficProfile, rate:float, arrival:str, duration:float, seed:int = None, num_payloads:int = SCHEDULE_PAYLOADS) -> int:
+    """
+    Generate every request of an open-loop run of duration seconds at rate requests/s to the targets into schedule_file
+    """
+    LOGGER.debug(f'write_schedule: {schedule_file} rate={rate} arrival={arrival} duration={duration} seed={seed}')
+
+    # check parameters
+    if not targets or rate <= 0 or duration <= 0:
+        msg = f'write_schedule: a schedule needs targets, a rate and a duration, got {len(targets)} targets, rate: {rate}, duration: {duration}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return 0
+    try:
+        endpoints = [pack_endpoint(ipaddr) for ipaddr, port, slave_id in targets]
+    except ValueError as ve:
+        msg = f'write_schedule: schedules can only store IP address targets, not host names: {ve}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return 0
+
+    # declare local variables
+    if seed is None:
+        seed = get_schedule_seed()
+    rng = np.random.default_rng(seed)
+    request_table = traffic_profile.compile(targets)
+    tables, payload_pools = get_schedule_tables(traffic_profile, targets, request_table)
+    num_records = 0
+    offset = 0.0
+
+    try:
+        with open(schedule_file, 'wb') as file_handle:
+            file_handle.write(SCHEDULE_HEADER.pack(SCHEDULE_MAGIC, SCHEDULE_VERSION, SCHEDULE_RECORD.size, seed, 0, rate, duration, len(targets), num_payloads, len(payload_pools)))
+            for endpoint, (ipaddr, port, slave_id) in zip(endpoints, targets):
+                file_handle.write(SCHEDULE_TARGET.pack(endpoint, int(port), slave_id))
+
+            # full length payloads of each value distribution, holding registers then coils
+            for payload_pool in payload_pools:
+                file_handle.write(np.array(payload_pool.generate_registers(num_payloads), dtype='<u2').tobytes())
+                file_handle.write(np.array(payload_pool.generate_coils(num_payloads), dtype='u1').tobytes())
+
+            # requests a chunk at a time until the duration is reached
+            records = np.zeros(SCHEDULE_CHUNK, dtype=SCHEDULE_DTYPE)
+            while offset < duration:
+                offsets = get_arrival_offsets(rng, arrival, rate, offset, SCHEDULE_CHUNK)
+                offset = offsets[-1]
+                offsets = offsets[offsets < duration]
+                size = len(offsets)
+                entries = request_table.alias_table.sample(rng, size)
+                chunk = records[:size]
+                chunk['offset'] = (offsets * 1e9).astype('<u8')
+                chunk['target'] = request_table.targets[entries]
+                chunk['function_code'] = request_table.function_codes[entries]
+                chunk['address'] = rng.integers(tables['address_low'][entries], tables['address_high'][entries] + 1)
+                chunk['count'] = rng.integers(tables['count_low'][entries], tables['count_high'][entries] + 1) * tables['scale'][entries]
+                payloads = tables['pool'][entries] * num_payloads + rng.integers(0, num_payloads, size)
+                chunk['payload'] = np.where(np.isin(chunk['function_code'], WRITE_FUNCTION_CODES), payloads, 0)
+                file_handle.write(chunk.tobytes())
+                num_records += size
+
+            # the record count is written last, so an interrupted schedule reads as empty
+            file_handle.seek(0)
+            file_handle.write(SCHEDULE_HEADER.pack(SCHEDULE_MAGIC, SCHEDULE_VERSION, SCHEDULE_RECORD.size, seed, num_records, rate, duration, len(targets), num_payloads, len(payload_pools)))
+    except OSError as oe:
+        msg = f'write_schedule: unable to write request schedule: {schedule_file}: {oe}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return 0
+
+    msg = f'write_schedule: wrote {num_records} requests over {duration}s to {len(targets)} targets with seed {seed} to: {schedule_file}'
+    LOGGER.info(msg)
+    print(f'[+] {msg}')
+    return num_records
+
+
+class RequestSchedule:
+    """
+    Memory-mapped request schedule, read back a chunk of records at a time
+    """
+
+    def __init__(self, schedule_file:str):
+        self.schedule_file = schedule_file
+        self.file_handle = open(schedule_file, 'rb')
+        try:
+            self.schedule_map = mmap.mmap(self.file_handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file_handle.close()
+            raise ValueError('empty schedule file')
+
+        # header, then the targets and payloads
+        if len(self.schedule_map) < SCHEDULE_HEADER.size:
+            self.close()
+            raise ValueError('truncated schedule file')
+        (magic, version, record_size, self.seed, self.num_records, self.rate, self.duration, num_targets, self.num_payloads,
+                num_pools) = SCHEDULE_HEADER.unpack_from(self.schedule_map, 0)
+        if magic != SCHEDULE_MAGIC or version != SCHEDULE_VERSION or record_size != SCHEDULE_RECORD.size:
+            self.close()
+            raise ValueError(f'not a version {SCHEDULE_VERSION} request schedule')
+        position = SCHEDULE_HEADER.size
+        self.targets = []
+        for endpoint, port, unit_id in SCHEDULE_TARGET.iter_unpack(self.schedule_map[position:position + num_targets * SCHEDULE_TARGET.size]):
+            self.targets.append((unpack_endpoint(endpoint), port, unit_id))
+        position += num_targets * SCHEDULE_TARGET.size
+        self.payload_offset = position
+        self.num_pools = num_pools
+        self.records_offset = position + num_pools * self.num_payloads * (REGISTER_PAYLOAD_SIZE + COIL_PAYLOAD_SIZE)
+        if len(self.schedule_map) < self.records_offset + self.num_records * SCHEDULE_RECORD.size:
+            self.close()
+            raise ValueError('truncated schedule file')
+        self.registers = None # payload index -> holding register values, loaded by load_payloads
+        self.coils = None # payload index -> coil values
+
+    def load_payloads(self):
+        # the payloads as lists, sliced by each write
+        self.registers = []
+        self.coils = []
+        position = self.payload_offset
+        for pool_index in range(self.num_pools):
+            size = self.num_payloads * REGISTER_PAYLOAD_SIZE
+            self.registers.extend(np.frombuffer(self.schedule_map, '<u2', size // 2, position).reshape(self.num_payloads, -1).tolist())
+            position += size
+            size = self.num_payloads * COIL_PAYLOAD_SIZE
+            self.coils.extend(np.frombuffer(self.schedule_map, 'u1', size, position).astype(bool).reshape(self.num_payloads, -1).tolist())
+            position += size
+
+    def read_records(self):
+        """
+        Generator of the (offset ns, target index, function code, address, count, payload index) records
+        """
+        for start in range(0, self.num_records, SCHEDULE_CHUNK):
+            position = self.records_offset + start * SCHEDULE_RECORD.size
+            size = min(SCHEDULE_CHUNK, self.num_records - start) * SCHEDULE_RECORD.size
+            yield from SCHEDULE_RECORD.iter_unpack(self.schedule_map[position:position + size])
+
+    def read_requests(self):
+        """
+        Generator of the (offset, target index, function code, request arguments) of every request, as issued by the open-loop
+        load generator
+        """
+        if self.registers is None:
+            self.load_payloads()
+        registers = self.registers
+        coils = self.coils
+        for offset, target_index, function_code, address, count, payload in self.read_records():
+            if function_code == 0x10:
+                request = (address, registers[payload][:count])
+            elif function_code == 0x0F:
+                request = (address, coils[payload][:count])
+            else:
+                request = (address, count)
+            yield (offset / 1e9, target_index, function_code, request)
+
+    def close(self):
+        self.schedule_map.close()
+        self.file_handle.close()
+
+
+def open_schedule(schedule_file:str) -> RequestSchedule:
+    LOGGER.debug(f'open_schedule: {schedule_file}')
+
+    try:
+        return RequestSchedule(schedule_file)
+    except (OSError, ValueError) as e:
+        msg = f'open_schedule: unable to read request schedule: {schedule_file}: {e}'
+        LOGGER.error(msg)
+        print(f'[!] {msg}')
+        return None
+
+
+def write_schedule_summary(schedule:RequestSchedule):
+    # requests per target and function code, accumulated as the records stream past
+    counts = np.zeros((len(schedule.targets), 256), dtype=np.int64)
+    for start in range(0, schedule.num_records, SCHEDULE_CHUNK):
+        position = schedule.records_offset + start * SCHEDULE_RECORD.size
+        chunk = np.frombuffer(schedule.schedule_map, SCHEDULE_DTYPE, min(SCHEDULE_CHUNK, schedule.num_records - start), position)
+        np.add.at(counts, (chunk['target'], chunk['function_code']), 1)
+
+    print(f'{schedule.num_records} requests over {schedule.duration}s ({schedule.rate} requests/s) to {len(schedule.targets)} targets, seed {schedule.seed}')
+    print(f'{"target":<28} {"fc":>4} {"requests":>10}')
+    for target_index, (ipaddr, port, unit_id) in enumerate(schedule.targets):
+        for function_code in np.nonzero(counts[target_index])[0].tolist():
+            print(f'{ipaddr + ":" + str(port) + "/" + str(unit_id):<28} {function_code:>4} {counts[target_index][function_code]:>10}')
+
+
+def run_main():
+    # parse command line arguments
+    parser = argparse.ArgumentParser(
+                    prog='proto_schedule',
+                    description='Summarise or list a request schedule written by proto_client -W')
+    parser.add_argument('schedule', help='request schedule file e.g., schedule.bin')
+    parser.add_argument('-o', '--output', choices=['summary', 'csv'], default='summary', help='write a summary per target and function code, or every request as CSV, default = "summary"')
+    args = parser.parse_args()
+
+    schedule = open_schedule(args.schedule)
+    if not schedule:
+        return
+    try:
+        if args.output == 'csv':
+            print(','.join(SCHEDULE_FIELDS))
+            for offset, target_index, function_code, address, count, payload in schedule.read_records():
+                ipaddr, port, unit_id = schedule.targets[target_index]
+                print(f'{offset / 1e9:.9f},{ipaddr},{port},{unit_id},{function_code},{address},{count},{payload}')
+        else:
+            write_schedule_summary(schedule)
+    except BrokenPipeError:
+        pass
+    finally:
+        schedule.close()
+
+
+if __name__ == '__main__':
+    run_main()
@@ -1,15 +1,40 @@
 #!/usr/bin/env python
 
 # import library modules
-from pymodbus.server import StartAsyncTcpServer
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.async_io import ModbusServerRequestHandler
+from pymodbus.exceptions import ModbusException
+from pymodbus.exceptions import NoSuchSlaveException
 from pymodbus.device import ModbusDeviceIdentification
 from pymodbus.datastore import ModbusSequentialDataBlock
 from pymodbus.datastore import ModbusSlaveContext
 from pymodbus.datastore import ModbusServerContext
 
+from proto_datastore import ModbusArrayDataBlock
+from proto_datastore import ModbusBitArrayDataBlock
+from proto_datastore import get_block_size
+from proto_datastore import toggle_values
+from proto_models import ProcessModelBank
+from proto_models import load_model_config
+from proto_engine import ModbusFastTcpServer
+from proto_logging import setup_logging
+from proto_logging import LOG_LEVEL
+from proto_logging import LOG_LEVELS
+from proto_journal import set_journal
+from proto_journal import get_journal
+from proto_journal import get_request_fields
+from proto_journal import STATUS_OK
+from proto_metrics import set_metrics
+from proto_metrics import get_metrics
+from proto_metrics import get_endpoint_metrics
+from proto_metrics import serve_metrics
+
 import argparse
 import logging
 import asyncio
+import ipaddress
+import functools
+import time
 
 
 # declare contants
@@ -19,6 +44,16 @@ MAX_COIL_REG_SIZE = 64
 MAX_HOLD_REG_SIZE = 60
 MAX_DISCRETE_IN_REG_SIZE = 123 
 MAX_INPUT_REG_SIZE = 123
+REG_PADDING = 2 # clients address registers from 0x01 and pymodbus adds 1 to every address, so pad blocks to keep the full range addressable
+NUM_REGISTERS = 0 # number of registers or bits in each block, 0 for just enough for the client's requests, theoretical size 10K
+DATASTORE = 'array' # register storage, array packs registers in array('H') and bits 8 to a byte, sequential uses python lists
+DATASTORES = ['array', 'sequential']
+ENGINE = 'pymodbus' # pymodbus serves requests with the pymodbus server, fast answers them straight from the register blocks
+ENGINES = ['pymodbus', 'fast']
+UPDATE_FUNCTION_CODES = [0x02, 0x04] # discrete input and input register blocks changed by the register update engine
+UPDATE_ADDRESS = 1 # block address of the first register as addressed by clients, pymodbus adds 1 to every address
+UPDATE_INTERVAL = 1 # 1s between register update ticks
+UPDATE_REPORT_INTERVAL = 60 # 60s between reports of the register update tick time
 
 
 """
@@ -55,37 +90,93 @@ DEV_VENDOR_URL = 'https://github.com/kushfj/modbus_sim'
 IP_ADDR = '127.0.0.1'
 TCP_PORT = 502
 SLAVE_ID = 0x01
+NUM_UNITS = 1 # number of distinct unit ids per endpoint, 1 for a single context answering every unit id
+MAX_UNITS = 247 # modbus unit ids 1 - 247, 0 is broadcast and 248 - 255 are reserved
 
 LOG_FILE = 'proto_server.log'
 
 
 # declare global variables - this is a bad things, but...
-logging.basicConfig(filename=LOG_FILE, encoding='utf-8', level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 LOGGER = logging.getLogger(__name__)
 #LOGGER.setLevel(logging.INFO)
 
 
-def get_modbus_data_model():
+def get_modbus_data_model(datastore:str = DATASTORE, num_registers:int = NUM_REGISTERS):
     LOGGER.debug('get_modbus_data_model')
-    
+
     # declare local variables
-    discrete_input_registers = ModbusSequentialDataBlock(0, [15]*MAX_DISCRETE_IN_REG_SIZE) # input registers block data store
-    coil_output_registers = ModbusSequentialDataBlock(0, [16]*MAX_COIL_REG_SIZE) # coil/output block data store
-    holding_registers = ModbusSequentialDataBlock(0, [17]*MAX_HOLD_REG_SIZE) # holding registers block data store
-    input_registers = ModbusSequentialDataBlock(0, [18]*MAX_INPUT_REG_SIZE) # input registers block data store
+    discrete_input_size = max(MAX_DISCRETE_IN_REG_SIZE + REG_PADDING, num_registers)
+    coil_size = max(MAX_COIL_REG_SIZE + REG_PADDING, num_registers)
+    holding_size = max(2*MAX_HOLD_REG_SIZE + REG_PADDING, num_registers) # clients write up to MAX_HOLD_REG_SIZE 32-bit floats
+    input_size = max(MAX_INPUT_REG_SIZE + REG_PADDING, num_registers)
+
+    if datastore == 'sequential':
+        discrete_input_registers = ModbusSequentialDataBlock(0, [15]*discrete_input_size) # input registers block data store
+        coil_output_registers = ModbusSequentialDataBlock(0, [16]*coil_size) # coil/output block data store
+        holding_registers = ModbusSequentialDataBlock(0, [17]*holding_size) # holding registers block data store
+        input_registers = ModbusSequentialDataBlock(0, [18]*input_size) # input registers block data store
+    else:
+        discrete_input_registers = ModbusBitArrayDataBlock(0, [True]*discrete_input_size) # input registers block data store
+        coil_output_registers = ModbusBitArrayDataBlock(0, [True]*coil_size) # coil/output block data store
+        holding_registers = ModbusArrayDataBlock(0, [17]*holding_size) # holding registers block data store
+        input_registers = ModbusArrayDataBlock(0, [18]*input_size) # input registers block data store
     
-    # construct modbus data model using block data stores
+    # construct modbus data model using block data stores, these are keyword only arguments and positional blocks are
+    # silently ignored in favour of default blocks shared by every context
     modbus_data_model = ModbusSlaveContext(
-        discrete_input_registers,
-        coil_output_registers,
-        holding_registers,
-        input_registers
+        di=discrete_input_registers,
+        co=coil_output_registers,
+        hr=holding_registers,
+        ir=input_registers
     )
 
     return modbus_data_model
 
 
 
+class LazyModbusServerContext(ModbusServerContext):
+    """
+    Server context for a gateway with distinct unit ids 1 to num_units, each with its own registers. A unit's slave context
+    is only created the first time the unit id is addressed, so idle unit ids cost no memory
+    """
+
+    def __init__(self, num_units:int = MAX_UNITS, data_model_factory = get_modbus_data_model):
+        super().__init__(slaves={}, single=False)
+        self.num_units = num_units
+        self.data_model_factory = data_model_factory
+
+    def __contains__(self, slave):
+        return 1 <= slave <= self.num_units
+
+    def __getitem__(self, slave):
+        slave_context = self._slaves.get(slave)
+        if slave_context:
+            return slave_context
+        if not 1 <= slave <= self.num_units:
+            raise NoSuchSlaveException(f'slave - {slave} does not exist, or is out of range 1 - {self.num_units}')
+
+        # materialise the unit on first use
+        slave_context = self._slaves[slave] = self.data_model_factory()
+        LOGGER.debug(f'LazyModbusServerContext: created context for unit id: {slave}')
+        return slave_context
+
+
+def get_modbus_server_context(num_units:int = NUM_UNITS, datastore:str = DATASTORE, num_registers:int = NUM_REGISTERS):
+    LOGGER.debug(f'get_modbus_server_context: units={num_units} datastore={datastore} registers={num_registers}')
+
+    # a single context answers every unit id, otherwise each unit id gets its own context on first use
+    if num_units <= 1:
+        return ModbusServerContext(get_modbus_data_model(datastore, num_registers), True)
+    return LazyModbusServerContext(min(num_units, MAX_UNITS), functools.partial(get_modbus_data_model, datastore, num_registers))
+
+
+def get_slave_contexts(modbus_server_context, slave_id:int = SLAVE_ID) -> list:
+    # (unit id, slave context) for slave_id of a single context server, otherwise every unit materialised so far
+    if modbus_server_context.single:
+        return [(slave_id, modbus_server_context[slave_id])]
+    return list(modbus_server_context)
+
+
 def get_server_identity():
     LOGGER.debug('get_server_identity')
 
@@ -105,94 +196,197 @@ def get_server_identity():
 
 
 
-async def modbus_server_input_register_updates(modbus_server_context, slave_id:int = SLAVE_ID):
-    LOGGER.debug('modbus_server_input_register_updates')
-    await modbus_server_register_updates(
-            modbus_server_context, 
-            modbus_function_code=0x04, 
-            address=0,
-            count=MAX_INPUT_REG_SIZE,
-            slave_id=slave_id
-        )
-    return
-
-
-async def modbus_server_discrete_input_register_updates(modbus_server_context, slave_id:int = SLAVE_ID):
-    LOGGER.debug('modbus_server_discrete_input_register_updates')
-    await modbus_server_register_updates(
-            modbus_server_context, 
-            modbus_function_code=0x02, 
-            address=0,
-            count=MAX_DISCRETE_IN_REG_SIZE,
-            slave_id=slave_id
-        )
-    return
-
-
-async def modbus_server_register_updates(modbus_server_context, modbus_function_code:int = 0x02, address:int = 0, count:int = 1, slave_id:int = SLAVE_ID):
+class ModbusPipelinedRequestHandler(ModbusServerRequestHandler):
+    """
+    Request handler which executes every complete frame received, pymodbus only executes the first frame from each read of the
+    socket and leaves the rest buffered, which stalls clients that keep several requests in-flight
+    """
+
+    def __init__(self, owner):
+        super().__init__(owner)
+        self.journal = owner.journal
+        self.journal_pending = {} # transaction id -> (request, start) of requests being executed
+        self.metrics = owner.metrics
+
+    def callback_connected(self):
+        if self.metrics is not None:
+            self.metrics.connection_made()
+        super().callback_connected()
+
+    def callback_disconnected(self, call_exc):
+        if self.metrics is not None:
+            self.metrics.connection_lost()
+        super().callback_disconnected(call_exc)
+
+    def callback_data(self, data:bytes, addr:tuple = ()) -> int:
+        if self.metrics is not None:
+            self.metrics.bytes_in += len(data)
+        return super().callback_data(data, addr)
+
+    def send(self, data:bytes, addr:tuple = None):
+        if self.metrics is not None:
+            self.metrics.bytes_out += len(data)
+        super().send(data, addr)
+
+    def execute(self, request, *addr):
+        if self.metrics is not None:
+            self.metrics.requests[request.function_code] += 1
+        if self.journal is not None:
+            self.journal_pending[request.transaction_id] = (request, time.perf_counter_ns())
+        super().execute(request, *addr)
+
+    def server_send(self, message, addr, **kwargs):
+        # journal the request with the outcome and time taken to execute it
+        if self.metrics is not None and message and getattr(message, 'exception_code', None):
+            self.metrics.exceptions[message.function_code & 0x7F] += 1
+        if self.journal is not None and message:
+            pending = self.journal_pending.pop(message.transaction_id, None)
+            if pending:
+                request, start = pending
+                address, count = get_request_fields(request)
+                status = getattr(message, 'exception_code', None) or STATUS_OK
+                ipaddr, port = self.server.comm_params.source_address
+                self.journal.record(ipaddr, int(port), request.slave_id, request.function_code, address, count, status, (time.perf_counter_ns() - start) // 1000)
+        super().server_send(message, addr, **kwargs)
+
+    async def inner_handle(self):
+        await super().inner_handle()
+
+        # execute any further complete frames already buffered
+        while self.databuffer:
+            try:
+                used_len, pdu = self.framer.processIncomingFrame(self.databuffer)
+            except ModbusException as me:
+                LOGGER.error(f'ModbusPipelinedRequestHandler: unable to decode frame, discarding {len(self.databuffer)} bytes')
+                self.databuffer = b''
+                break
+            if not used_len:
+                break
+            self.databuffer = self.databuffer[used_len:]
+            if pdu:
+                self.execute(pdu, None)
+
+
+class ModbusPipelinedTcpServer(ModbusTcpServer):
+    """
+    Modbus TCP server which handles pipelined requests on each connection
+    """
+
+    def __init__(self, *args, journal = None, metrics = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.journal = journal
+        self.metrics = metrics
+
+    def callback_new_connection(self):
+        return ModbusPipelinedRequestHandler(self)
+
+
+def get_modbus_tcp_server(server_context, server_id, server_addr:tuple, engine:str = ENGINE):
+    # both servers provide listen, serving, serve_forever and shutdown, journal every request if there is a journal, and
+    # count requests, connections and bytes if collecting metrics
+    metrics = get_endpoint_metrics(server_addr)
+    if engine == 'fast':
+        return ModbusFastTcpServer(context=server_context, identity=server_id, address=server_addr, journal=get_journal(), metrics=metrics)
+    return ModbusPipelinedTcpServer(context=server_context, identity=server_id, address=server_addr, journal=get_journal(), metrics=metrics)
+
+
+
+def update_server_registers(server_contexts:dict, slave_id:int, update_state:dict, process_models:ProcessModelBank = None, elapsed:float = UPDATE_INTERVAL) -> int:
+    """
+    One register update tick of the discrete input and input register blocks of every unit of every endpoint, either by the
+    process models stepped by elapsed seconds or by toggling every other value, returning the number of blocks updated
+    """
+    # declare local variables
+    initialised = update_state.setdefault('initialised', set()) # ids of the slave contexts whose updated blocks have been set to zero
+    model_blocks = update_state.setdefault('model_blocks', []) # (discrete input block, input register block) of each row of the process models
+    parity = update_state.setdefault('parity', 0) # every other register is toggled each tick, alternating between even and odd registers
+    num_blocks = 0
+    new_slaves = []
+
+    # units materialised since the last tick have their blocks set to zero before their first update
+    for ipaddr, server_context in server_contexts.items():
+        for unit_id, slave_context in get_slave_contexts(server_context, slave_id):
+            blocks = [slave_context.store[slave_context.decode(function_code)] for function_code in UPDATE_FUNCTION_CODES]
+            if id(slave_context) not in initialised:
+                initialised.add(id(slave_context))
+                for block in blocks:
+                    block.setValues(UPDATE_ADDRESS, [0]*(get_block_size(block) - UPDATE_ADDRESS))
+                new_slaves.append(((ipaddr, unit_id), blocks))
+            if process_models is not None:
+                continue
+            for block in blocks:
+                toggle_values(block, UPDATE_ADDRESS, get_block_size(block) - UPDATE_ADDRESS, parity)
+                num_blocks += 1
+    update_state['parity'] = parity ^ 1
+
+    # step the models of every slave at once, then copy each slave's row into its blocks
+    if process_models is not None:
+        process_models.add_slaves([slave for slave, blocks in new_slaves])
+        model_blocks.extend(blocks for slave, blocks in new_slaves)
+        registers, alarms = process_models.step(elapsed)
+        for (discrete_input_block, input_register_block), slave_registers, slave_alarms in zip(model_blocks, registers.tolist(), alarms.tolist()):
+            input_register_block.setValues(UPDATE_ADDRESS, slave_registers)
+            discrete_input_block.setValues(UPDATE_ADDRESS, slave_alarms)
+        num_blocks += 2*len(model_blocks)
+
+    return num_blocks
+
+
+async def modbus_server_register_updates(server_contexts:dict, slave_id:int = SLAVE_ID, interval:float = UPDATE_INTERVAL, process_models:ProcessModelBank = None):
     LOGGER.debug('modbus_server_register_updates')
 
     # check parameters
-    assert modbus_server_context
-    assert modbus_function_code
-    if modbus_function_code < 0x01 or modbus_function_code > 0x06:
-        msg = f'modbus_server_register_updates: invalid function code: {function_code}, must be in range 0x01 - 0x06'
+    if not server_contexts or interval <= 0:
+        msg = f'modbus_server_register_updates: no server contexts or invalid interval: {interval}'
         LOGGER.error(msg)
-        print(msg)
+        print(f'[!] {msg}')
         return
 
     # declare local variables
-    starting_address = address
-    num_registers = count
-    values = None
-    fifty_fifty = [0,1]
-
-    # set values to zero
-    values = modbus_server_context[slave_id].getValues(
-            modbus_function_code,
-            address=starting_address, 
-            count=num_registers
-        )
-    values = [0 for v in values]
-    modbus_server_context[slave_id].setValues(
-            modbus_function_code,
-            address=starting_address, 
-            values=values)
-    LOGGER.info(f'modbus_server_register_updates: initialised {num_registers} registers to 0')
-
-    # continuous loop to randomise values in discrete input registers every second
-    flip = True # DEBUG
+    loop = asyncio.get_running_loop()
+    metrics = get_metrics()
+    update_state = {} # slave contexts initialised, model blocks and toggle parity carried between ticks
+    num_ticks = 0
+    num_overruns = 0
+    tick_total = 0.0
+    tick_max = 0.0
+    last_tick = loop.time()
+    next_tick = last_tick + interval
+    next_report = last_tick + UPDATE_REPORT_INTERVAL
+
+    # single loop updating the discrete input and input register blocks of every unit of every endpoint each tick, either
+    # by the process models or by toggling every other value
     while True:
-        await asyncio.sleep(1)
-
-        # randomise the registers to process each time
-        #num_registers = random.randint(1,MAX_DISCRETE_IN_REG_SIZE) # FIXME: blocks here
-        values = modbus_server_context[slave_id].getValues(
-                modbus_function_code, 
-                address=starting_address, 
-                count=num_registers
-            )
-
-        # randomise bit-flip each time
-        for value_idx, value in enumerate(values):
-            #flip = random.choice(fifty_fifty) # FIXME: blocks here
-            #flip = await random.choice(fifty_fifty) # FIXME: blocks here
-            if flip:
-                values[value_idx] = not bool(values[value_idx])
-                flip = False # DEBUG
-            else:
-                flip = True # DEBUG
-
-        # set the register values
-        modbus_server_context[slave_id].setValues(
-                modbus_function_code, 
-                address=starting_address, 
-                values=values
-            )
-        #LOGGER.info(f"modbus_server_discrete_input_register_updates: set values: {values!s} at: {starting_address!s} for slave: {slave_id}")
-
-
-async def run_modbus_server(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:int = SLAVE_ID):
+        await asyncio.sleep(max(0, next_tick - loop.time()))
+        next_tick += interval
+        tick_start = time.perf_counter()
+        num_blocks = update_server_registers(server_contexts, slave_id, update_state, process_models, loop.time() - last_tick)
+        last_tick = loop.time()
+
+        # account for the time the tick held the event loop
+        tick_time = time.perf_counter() - tick_start
+        num_ticks += 1
+        tick_total += tick_time
+        tick_max = max(tick_max, tick_time)
+        if metrics is not None:
+            metrics.record_tick(tick_time, num_blocks, tick_time > interval)
+        if tick_time > interval:
+            num_overruns += 1
+            LOGGER.warning(f'modbus_server_register_updates: tick took {tick_time:.3f}s updating {num_blocks} blocks, longer than the {interval}s interval')
+            next_tick = loop.time() + interval # skip the missed ticks rather than running them back to back
+
+        if loop.time() >= next_report:
+            LOGGER.info(f'modbus_server_register_updates: {num_ticks} ticks updating {num_blocks} blocks, '
+                    f'tick time mean: {tick_total/num_ticks*1000:.3f}ms max: {tick_max*1000:.3f}ms, '
+                    f'{tick_total/(num_ticks*interval)*100:.2f}% of the event loop, {num_overruns} overruns')
+            num_ticks = 0
+            num_overruns = 0
+            tick_total = 0.0
+            tick_max = 0.0
+            next_report = loop.time() + UPDATE_REPORT_INTERVAL
+
+
+async def run_modbus_server(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:int = SLAVE_ID, num_units:int = NUM_UNITS, datastore:str = DATASTORE, num_registers:int = NUM_REGISTERS, process_models:ProcessModelBank = None, engine:str = ENGINE):
     LOGGER.debug('run_modbus_server')
 
     # check parameters
@@ -201,30 +395,106 @@ async def run_modbus_server(ipaddr:str = IP_ADDR, port:int = TCP_PORT, slave_id:
         return
 
     # declare local variables
-    data_model = get_modbus_data_model()
-    server_context = ModbusServerContext(data_model, True) # create a single context for the server/slave
+    server_context = get_modbus_server_context(num_units, datastore, num_registers) # create a single context for the server/slave, or one per unit id
     server_id = get_server_identity()
     server_addr = (ipaddr, port) # socket tuple of ipaddr and port
 
-    # create a task to update discret input registers
-    discrete_input_reg_updater_task = asyncio.create_task(modbus_server_discrete_input_register_updates(server_context, slave_id))
-    discrete_input_reg_updater_task.set_name("Distrete input register updater task")
-
-    # create a task to update input registers
-    input_reg_updater_task = asyncio.create_task(modbus_server_input_register_updates(server_context, slave_id))
-    input_reg_updater_task.set_name("Input register updater task")
+    # create a task to update discrete input and input registers
+    reg_updater_task = asyncio.create_task(modbus_server_register_updates({ipaddr: server_context}, slave_id, UPDATE_INTERVAL, process_models))
+    reg_updater_task.set_name('Register updater task')
 
     # start and run async TCP modbus server
     try:
         LOGGER.debug(f'run_modbus_server {ipaddr}:{port}')
         print(f'attempting to start modbus slave on socket {ipaddr}:{port}...')
-        modbus_server = await StartAsyncTcpServer(context=server_context, identity=server_id, address=server_addr) 
-        discrete_input_reg_updater_task.cancel() # kill the async thread too
-        input_reg_updater_task.cancel() # kill the async thread too
+        modbus_server = get_modbus_tcp_server(server_context, server_id, server_addr, engine)
+        await modbus_server.serve_forever()
+        reg_updater_task.cancel() # kill the async thread too
     except PermissionError as pe:
         LOGGER.error('run_modbus_server: no permission to bind socket')
     
 
+def get_bind_addresses(ipaddr:str = IP_ADDR, slaves_list:str = None) -> list:
+    LOGGER.debug(f'get_bind_addresses: ipaddr={ipaddr} slaves_list={slaves_list}')
+
+    # declare local variables
+    bind_addresses = {} # dict used as an ordered set to remove duplicates and keep order
+    specs = []
+
+    # comma separated list of IP addresses and CIDR networks
+    if ipaddr:
+        specs.extend(spec.strip() for spec in ipaddr.split(','))
+
+    # line separated list of IP addresses e.g., the slaves list written by the test harness
+    if slaves_list:
+        try:
+            with open(slaves_list, 'r') as file_handle:
+                specs.extend(line.strip() for line in file_handle)
+        except OSError as oe:
+            msg = f'get_bind_addresses: unable to read slaves list: {slaves_list}'
+            LOGGER.error(msg)
+            print(f'[!] {msg}')
+
+    for spec in specs:
+        if not spec:
+            continue
+        try:
+            if '/' in spec:
+                network = ipaddress.ip_network(spec, strict=False)
+                for host in network.hosts():
+                    bind_addresses[str(host)] = None
+            else:
+                bind_addresses[str(ipaddress.ip_address(spec))] = None
+        except ValueError as ve:
+            LOGGER.error(f'get_bind_addresses: skipping invalid IP address or network: {spec}')
+
+    return list(bind_addresses)
+
+
+async def run_modbus_multi_server(ipaddrs:list, port:int = TCP_PORT, slave_id:int = SLAVE_ID, num_units:int = NUM_UNITS, datastore:str = DATASTORE, num_registers:int = NUM_REGISTERS, process_models:ProcessModelBank = None, engine:str = ENGINE):
+    LOGGER.debug(f'run_modbus_multi_server: {len(ipaddrs)} endpoints')
+
+    # check parameters
+    if not ipaddrs or not port or int(port) < 0 or int(port) > 65535:
+        LOGGER.error('run_modbus_multi_server: ipaddrs or port not specified or invalid')
+        return
+
+    # declare local variables
+    server_id = get_server_identity()
+    modbus_servers = []
+    server_contexts = {} # ipaddr -> server context
+
+    # create an endpoint with its own register context for each address, all served from this event loop
+    for ipaddr in ipaddrs:
+        server_context = get_modbus_server_context(num_units, datastore, num_registers)
+        server_contexts[ipaddr] = server_context
+        modbus_servers.append(get_modbus_tcp_server(server_context, server_id, (ipaddr, int(port)), engine))
+
+    # create a single task to update the discrete input and input registers of every endpoint
+    reg_updater_task = asyncio.create_task(modbus_server_register_updates(server_contexts, slave_id, UPDATE_INTERVAL, process_models))
+    reg_updater_task.set_name('Register updater task')
+
+    # bind every endpoint concurrently
+    print(f'attempting to start {len(modbus_servers)} modbus slaves on port {port}...')
+    try:
+        listening = await asyncio.gather(*(modbus_server.listen() for modbus_server in modbus_servers))
+        for ipaddr, is_listening in zip(ipaddrs, listening):
+            if not is_listening:
+                msg = f'run_modbus_multi_server: unable to bind socket {ipaddr}:{port}'
+                LOGGER.error(msg)
+                print(f'[!] {msg}')
+        msg = f'run_modbus_multi_server: {sum(listening)} of {len(modbus_servers)} modbus slaves listening on port {port}'
+        LOGGER.info(msg)
+        print(f'[+] {msg}')
+
+        # serve until every listening endpoint is shut down
+        await asyncio.gather(*(modbus_server.serving for modbus_server, is_listening in zip(modbus_servers, listening) if is_listening))
+    finally:
+        reg_updater_task.cancel() # kill the async thread too
+        for modbus_server in modbus_servers:
+            await modbus_server.shutdown()
+
+
 async def run_main():
     LOGGER.debug('run_main')
     # parse command line arguments
@@ -234,15 +504,62 @@ async def run_main():
         epilog='This server is intended to be run a prototype modbus server')
     parser.add_argument(
         '-i', '--ipaddr', 
-        help='ip address to bind to, default = "127.0.0.1"') 
+        help='ip address, comma separated list of ip addresses or CIDR networks to bind to, default = "127.0.0.1"') 
     parser.add_argument(
         '-p', '--port', 
         help='port to bind to, default = 502')
+    parser.add_argument(
+        '-l', '--slaves_list', 
+        help='file containing line separated list of ip addresses to bind to, in addition to -i') 
+    parser.add_argument(
+        '-u', '--units', 
+        type=int,
+        default=NUM_UNITS,
+        help=f'number of distinct unit ids 1 - {MAX_UNITS} per endpoint each with its own registers created on first use, 1 for a single context answering every unit id, default = {NUM_UNITS}') 
+    parser.add_argument(
+        '-d', '--datastore', 
+        choices=DATASTORES,
+        default=DATASTORE,
+        help=f'register storage, array packs registers in array(\'H\') and bits 8 to a byte, sequential uses python lists, default = "{DATASTORE}"') 
+    parser.add_argument(
+        '-r', '--registers', 
+        type=int,
+        default=NUM_REGISTERS,
+        help='number of registers or bits in each block e.g., 10000, default = 0 i.e., just enough for the client requests') 
+    parser.add_argument(
+        '-e', '--engine', 
+        choices=ENGINES,
+        default=ENGINE,
+        help=f'server engine, fast parses frames in place and answers straight from the register blocks, default = "{ENGINE}"') 
+    parser.add_argument(
+        '-M', '--models', 
+        nargs='?',
+        const='',
+        default=None,
+        help='drive the input registers and discrete inputs from process models, with per slave parameters from an optional JSON config e.g., models.json, default = toggle every other value') 
+    parser.add_argument(
+        '-L', '--log_level', 
+        choices=LOG_LEVELS,
+        default=LOG_LEVEL,
+        help=f'log level, default = "{LOG_LEVEL}"') 
+    parser.add_argument(
+        '-J', '--journal', 
+        help='append a binary record of every request served to this rotating journal e.g., proto_server.journal, read with proto_journal.py, default = no journal') 
+    parser.add_argument(
+        '-m', '--metrics', 
+        help='serve Prometheus text metrics per endpoint over HTTP on host:port e.g., 127.0.0.1:9502, or on a Unix socket path e.g., /tmp/proto_server.sock, default = no metrics') 
     args = parser.parse_args()
 
+    # hand log records to a writer thread
+    setup_logging(LOG_FILE, args.log_level)
+    if args.journal:
+        set_journal(args.journal)
+
     # declare local variables
     ipaddr = None
     port = None
+    process_models = None
+    metrics_server = None
 
     # check parameters
     if not args.ipaddr:
@@ -255,7 +572,22 @@ async def run_main():
     else:
         port = args.port
 
-    await run_modbus_server(ipaddr, port)
+    if args.models is not None:
+        process_models = ProcessModelBank(load_model_config(args.models))
+
+    if args.metrics:
+        metrics_server = await serve_metrics(set_metrics(), args.metrics)
+
+    # serve every address from this process if a list, network or slaves list is given
+    try:
+        if not args.slaves_list and ',' not in ipaddr and '/' not in ipaddr:
+            await run_modbus_server(ipaddr, port, SLAVE_ID, args.units, args.datastore, args.registers, process_models, args.engine)
+        else:
+            ipaddrs = get_bind_addresses(args.ipaddr, args.slaves_list)
+            await run_modbus_multi_server(ipaddrs, port, SLAVE_ID, args.units, args.datastore, args.registers, process_models, args.engine)
+    finally:
+        if metrics_server:
+            metrics_server.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+
+# import library modules
+
+from pymodbus.client.mixin import ModbusClientMixin
+from pymodbus.exceptions import ConnectionException
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.framer.socket import FramerSocket
+from pymodbus.pdu import DecodePDU
+
+
+import logging
+import asyncio
+
+
+# declare contants
+
+PIPELINE_WINDOW = 8 # default number of requests kept in-flight per connection
+PIPELINE_TIMEOUT = 30 # 30s before timing out a request
+
+MAX_TRANSACTION_ID = 0xFFFF # modbus TCP transaction ids are 16-bit
+
+COMMS_NAME = 'vPLC pipelined simulation'
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+"""
+Pipelined modbus TCP transport
+
+The pymodbus async client holds a lock for the full round trip of each request, so a connection only ever has one request
+in-flight. The MBAP header carries a transaction id which is echoed in the response, so several requests can be
+outstanding on one socket and matched up as their responses arrive, in any order.
+
+| Field          | Size | Description                                  |
+| ---            | ---  | ---                                          |
+| Transaction ID | 2b   | echoed by the server, used to match requests |
+| Protocol ID    | 2b   | always 0 for modbus                          |
+| Length         | 2b   | number of following bytes                    |
+| Unit ID        | 1b   | slave id                                     |
+| PDU            | Nb   | function code and data                       |
+"""
+
+
+class ModbusPipelineProtocol(asyncio.Protocol):
+    """
+    asyncio protocol which reassembles MBAP frames from the socket and resolves the pending request with the same transaction id
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.framer = FramerSocket(DecodePDU(False))
+        self.databuffer = bytearray()
+        self.pending = {} # transaction id -> future for the response
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.databuffer += data
+
+        # process every complete frame in the buffer, leaving any partial frame for the next read
+        while self.databuffer:
+            try:
+                used_len, slave_id, transaction_id, pdu_data = self.framer.decode(self.databuffer)
+            except Exception as e:
+                # the frame boundaries are lost, so drop the connection and let connection_lost fail the pending requests
+                msg = f'ModbusPipelineProtocol: unable to decode frame, closing connection: {e}'
+                LOGGER.error(msg)
+                print(f'[!] {msg}')
+                self.databuffer.clear()
+                if self.transport:
+                    self.transport.close()
+                return
+            if not used_len:
+                break
+            del self.databuffer[:used_len]
+
+            response_future = self.pending.pop(transaction_id, None)
+            if not response_future or response_future.done():
+                LOGGER.error(f'ModbusPipelineProtocol: discarding response for unknown transaction id: {transaction_id}')
+                continue
+
+            try:
+                response = self.framer.decoder.decode(pdu_data)
+            except Exception as e:
+                LOGGER.error(f'ModbusPipelineProtocol: unable to decode response for transaction id: {transaction_id}: {e}')
+                response = None
+            if response is None:
+                response_future.set_exception(ModbusIOException(f'unable to decode response for transaction id: {transaction_id}'))
+                continue
+            response.slave_id = slave_id
+            response.transaction_id = transaction_id
+            response_future.set_result(response)
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+        # fail every outstanding request, the caller decides whether to reconnect
+        for response_future in self.pending.values():
+            if not response_future.done():
+                response_future.set_exception(ConnectionException(f'connection lost: {exc}'))
+        self.pending.clear()
+
+
+class ModbusPipelineClient(ModbusClientMixin):
+    """
+    Modbus TCP client which keeps up to window requests in-flight on a single connection. It provides the same read_*/write_* methods
+    as AsyncModbusTcpClient so the poll handlers can use either client
+    """
+
+    protocol_class = ModbusPipelineProtocol
+
+    def __init__(self, host:str, port:int, window:int = PIPELINE_WINDOW, timeout:float = PIPELINE_TIMEOUT, name:str = COMMS_NAME):
+        ModbusClientMixin.__init__(self)
+        self.host = host
+        self.port = int(port)
+        self.name = name
+        self.timeout = timeout
+        self.window = asyncio.Semaphore(window)
+        self.window_size = window
+        self.protocol = None
+        self.transaction_id = 0
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.protocol and self.protocol.transport)
+
+    async def connect(self) -> bool:
+        LOGGER.debug(f'ModbusPipelineClient.connect: {self.host}:{self.port}')
+        loop = asyncio.get_running_loop()
+        try:
+            transport, self.protocol = await asyncio.wait_for(
+                    loop.create_connection(self.protocol_class, self.host, self.port),
+                    timeout=self.timeout
+                )
+        except (OSError, asyncio.TimeoutError) as e:
+            LOGGER.error(f'ModbusPipelineClient.connect: unable to connect to {self.host}:{self.port}: {e}')
+            self.protocol = None
+        return self.connected
+
+    def close(self):
+        if self.connected:
+            self.protocol.transport.close()
+
+    def get_transaction_id(self) -> int:
+        # next free 16-bit transaction id, skipping any still in-flight after a wrap around
+        while True:
+            self.transaction_id = (self.transaction_id % MAX_TRANSACTION_ID) + 1
+            if self.transaction_id not in self.protocol.pending:
+                return self.transaction_id
+
+    async def execute(self, no_response_expected:bool, request):
+        async with self.window:
+            if not self.connected:
+                raise ConnectionException(f'not connected to {self.host}:{self.port}')
+
+            # send the request and wait for the response with the same transaction id
+            request.transaction_id = self.get_transaction_id()
+            frame = self.protocol.framer.buildFrame(request)
+            if no_response_expected:
+                self.protocol.transport.write(frame)
+                return None
+            response_future = asyncio.get_running_loop().create_future()
+            self.protocol.pending[request.transaction_id] = response_future
+            self.protocol.transport.write(frame)
+            try:
+                return await asyncio.wait_for(response_future, timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.protocol.pending.pop(request.transaction_id, None)
+                raise ModbusIOException(f'no response from {self.host}:{self.port} for transaction id: {request.transaction_id}')
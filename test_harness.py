@@ -11,7 +11,17 @@ import logging
 import time
 import ipaddress
 import random
+import json
+import heapq
 import math
+import signal
+import socket
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from proto_histogram import LatencyRecorder
+from proto_profile import load_traffic_profile
 
 
 ### README
@@ -30,8 +40,6 @@ import math
 
 # TODO
 # * Process slave IPs and chunks so that source IP address can be optimised for specific subnets
-# * Parametereris subnet so that master and slave subnets can be specified on the command line
-# * Parameterise hardware interface names instead of using globals
 # * Parameterise output filenames for master script, cleanup scripts and slave script names 
 # * Dynamically determine full path for commands based on Linux distribution e.g. ifconfig, route, etc.
 
@@ -43,11 +51,24 @@ import math
 PYTHON='./python_venv/bin/python'
 
 IFACE='enp0s3'
+SLAVE_SUBNETS='10.10.10.0/24' # slaves count up from the first address
+MASTER_SUBNETS='10.10.10.0/24' # masters count down from the last address
+IP='/usr/sbin/ip'
+SLAVE_LINK_PREFIX='mbs' # macvlan links of the slaves are named mbs1, mbs2, ...
+MASTER_LINK_PREFIX='mbm' # and of the masters mbm1, mbm2, ...
 DEFAULT_SLAVES_LIST_FILENAME='slaves.txt'
 LINE_SEPARATOR='\n' # TODO - use platform detection to determine separator
+TCP_PORT=502
+
+START_JOBS=8 # interfaces configured and workers started in parallel by the orchestrator
+MAX_RESTARTS=3 # times the orchestrator restarts a worker which failed before giving up on it
+READY_TIMEOUT=60.0 # seconds a worker has to start serving or reaching its slaves
+SUPERVISE_INTERVAL=1.0 # seconds between checks of the workers
+TEARDOWN_TIMEOUT=10.0 # seconds the workers have to exit after SIGTERM before they are killed
 
 LOGGER = None
 SLAVE_LIST_HANDLE = None
+FLEET_STOP = threading.Event() # set by SIGINT/SIGTERM to tear the orchestrated fleet down
 
 
 #
@@ -199,14 +220,34 @@ def is_valid_slaves_list(slaves_list: str ) -> []:
             print('')
             file_handle.close
 
-    # remove duplicates and return list
-    is_valid = list(set(is_valid))
+    # remove duplicates, keeping the order of the file, and return list
+    is_valid = list(dict.fromkeys(is_valid))
     if is_valid:
         log_info(f'# [!] is_valid_slaves_list: found {len(is_valid)} unique from {found_ip} IPs in {line_num} lines')
 
     return is_valid
 
 
+def write_slaves_chunk(slaves : [], chunk_filename : str):
+    """
+    Function to write a chunk of the slaves list to its own file, one IP address per line, so a single master can poll all of them. Returns True if the file was written
+    """
+    # check parameters
+    if not slaves or not chunk_filename:
+        return False
+
+    # attempt to overwrite the chunk file
+    try:
+        with open(chunk_filename, 'w') as file_handle:
+            for ip_addr in slaves:
+                file_handle.write(f'{ip_addr}{LINE_SEPARATOR}')
+    except OSError:
+        log_info(f'# [!] write_slaves_chunk: unable to open file: {chunk_filename} for writing')
+        return False
+
+    return True
+
+
 def chunkify(big_list : [], chunk_size : int = 1):
     """
     Function to return list of list of at most chunk_size of a big_list
@@ -235,6 +276,526 @@ def create_mac_addr() -> str:
     return str(':'.join(map(lambda x: "%02x" % x, mac)))
 
 
+def get_profile_rates(profile_file : str, slaves : []) -> {}:
+    """
+    Function to return the requests/s of each slave from the rate of its group in a proto_client traffic profile, slaves in groups without a rate are left out
+    """
+    # declare local variables
+    rates = {}
+
+    traffic_profile = load_traffic_profile(profile_file)
+    if not traffic_profile:
+        log_info(f'# [!] get_profile_rates: unable to load traffic profile {profile_file}')
+        return rates
+
+    for ip_addr in slaves:
+        rate = traffic_profile.get_group(ip_addr).rate
+        if rate:
+            rates[ip_addr] = rate
+
+    return rates
+
+
+def get_measured_rates(histogram_files : str) -> {}:
+    """
+    Function to return the requests/s of each slave measured by earlier proto_client runs, from the final histograms of each comma separated -H histogram file. The rate is the requests over the run time, or one over the mean latency if the run time is not known, summed over the unit ids and files of each slave
+    """
+    # declare local variables
+    rates = {}
+
+    for histogram_file in histogram_files.split(','):
+        final = None
+        try:
+            with open(histogram_file.strip(), 'r') as file_handle:
+                for line in file_handle:
+                    record = json.loads(line)
+                    if record.get('final'):
+                        final = record
+        except (OSError, ValueError) as e:
+            log_info(f'# [!] get_measured_rates: unable to read histograms {histogram_file}: {e}')
+            continue
+        if not final:
+            log_info(f'# [!] get_measured_rates: no final histograms in {histogram_file}')
+            continue
+
+        recorder = LatencyRecorder.from_dict(final)
+        elapsed = final.get('interval')
+        for (ip_addr, port, unit_id), histogram in recorder.slaves.items():
+            requests = histogram.total + recorder.slave_errors.get((ip_addr, port, unit_id), 0)
+            if elapsed:
+                rate = requests / elapsed
+            elif histogram.total and histogram.sum:
+                rate = 1e6 * histogram.total / histogram.sum # latencies are recorded in microseconds
+            else:
+                continue
+            rates[ip_addr] = rates.get(ip_addr, 0) + rate
+
+    return rates
+
+
+def get_slave_rates(slaves : [], profile_file : str = None, histogram_files : str = None) -> {}:
+    """
+    Function to return the expected requests/s of every slave: measured by an earlier run if it was, otherwise the rate of its traffic profile group, otherwise the mean rate of the slaves which have one, or 1 if none do
+    """
+    # declare local variables
+    rates = {}
+
+    if profile_file:
+        rates.update(get_profile_rates(profile_file, slaves))
+    if histogram_files:
+        rates.update(get_measured_rates(histogram_files))
+
+    known = [rates[ip_addr] for ip_addr in slaves if ip_addr in rates]
+    default_rate = sum(known) / len(known) if known else 1.0
+    if len(known) < len(slaves):
+        log_info(f'# [!] get_slave_rates: no expected rate for {len(slaves) - len(known)} of {len(slaves)} slaves, assuming {default_rate:.1f} requests/s each')
+
+    return {ip_addr: rates.get(ip_addr, default_rate) for ip_addr in slaves}
+
+
+def balance_slaves(slaves : [], rates : {}, num_masters : int = 1) -> []:
+    """
+    Function to bin-pack the slaves onto num_masters masters by their expected requests/s, longest processing time first: the busiest slave not yet placed goes to the master with the least load, the lowest numbered master on a tie. Each master's slaves stay in slaves list order, and the same slaves and rates always give the same assignment. Returns a list of slaves per master, leaving out masters without slaves
+    """
+    # check parameters
+    if not slaves or num_masters < 1:
+        return []
+
+    # declare local variables
+    loads = [(0.0, master_idx) for master_idx in range(num_masters)] # heap of (load, master index)
+    assignment = [[] for _ in range(num_masters)]
+    order = {ip_addr: index for index, ip_addr in enumerate(slaves)}
+
+    for ip_addr in sorted(slaves, key=lambda ip_addr: (-rates[ip_addr], order[ip_addr])):
+        load, master_idx = heapq.heappop(loads)
+        assignment[master_idx].append(ip_addr)
+        heapq.heappush(loads, (load + rates[ip_addr], master_idx))
+
+    return [sorted(chunk, key=order.get) for chunk in assignment if chunk]
+
+
+def order_for_cores(slaves : [], rates : {}, num_cores : int = 1) -> []:
+    """
+    Function to order a master's slaves so that proto_client, which deals the slaves in its list out to its -w workers round robin, gives each worker an even share of the load: the slaves are sorted busiest first and dealt in a snake, every other round in reverse, so each worker gets one slave per round
+    """
+    # check parameters
+    if num_cores <= 1:
+        return list(slaves)
+
+    # declare local variables
+    order = {ip_addr: index for index, ip_addr in enumerate(slaves)}
+    ranked = sorted(slaves, key=lambda ip_addr: (-rates[ip_addr], order[ip_addr]))
+    ordered = []
+
+    for round_idx, ip_addrs in enumerate(chunkify(ranked, num_cores)):
+        ordered.extend(reversed(ip_addrs) if round_idx % 2 else ip_addrs)
+
+    return ordered
+
+
+def get_core_rates(slaves : [], rates : {}, num_cores : int = 1) -> []:
+    """
+    Function to return the expected requests/s of each of a master's workers, dealing its slaves out round robin as proto_client does
+    """
+    # declare local variables
+    core_rates = [0.0] * max(1, min(num_cores, len(slaves)))
+
+    for index, ip_addr in enumerate(slaves):
+        core_rates[index % len(core_rates)] += rates[ip_addr]
+
+    return core_rates
+
+
+def get_python() -> str:
+    """
+    Function to return the python interpreter of the virtual environment, or the one running the harness if there is no virtual environment
+    """
+    if os.path.isfile(PYTHON):
+        return PYTHON
+    return sys.executable
+
+
+def get_networks(subnets : str) -> []:
+    """
+    Function to parse a comma separated list of IPv4 or IPv6 CIDR networks e.g. 10.10.0.0/16,fd00:10::/64. Returns an empty list if any of them is invalid
+    """
+    # declare local variables
+    networks = []
+
+    for subnet in subnets.split(','):
+        try:
+            networks.append(ipaddress.ip_network(subnet.strip(), strict=False))
+        except ValueError as ve:
+            log_info(f'# [!] get_networks: {subnet} is not a valid CIDR network: {ve}')
+            return []
+
+    return networks
+
+
+def get_num_hosts(networks : []) -> int:
+    """
+    Function to return the number of host addresses of the networks, without the network and broadcast addresses of IPv4 networks or the subnet-router anycast address of IPv6 networks
+    """
+    return sum(network.num_addresses - (2 if network.version == 4 else 1) if network.num_addresses > 2 else network.num_addresses for network in networks)
+
+
+def get_host_addresses(networks : [], descending : bool = False):
+    """
+    Generator of the host addresses of each network in turn as (IP address, prefix length), counting up from the first host of each network or down from its last host. Addresses are computed one at a time, so an IPv6 /64 costs no more than a /24
+    """
+    for network in networks:
+        # skip the network and broadcast addresses of IPv4, the subnet-router anycast address of IPv6
+        first = 1 if network.num_addresses > 2 else 0
+        last = network.num_addresses - (2 if network.version == 4 and network.num_addresses > 2 else 1)
+        offsets = range(last, first - 1, -1) if descending else range(first, last + 1)
+        for offset in offsets:
+            yield (str(network.network_address + offset), network.prefixlen)
+
+
+def is_overlapping(networks : [], other_networks : []) -> bool:
+    """
+    Function to check if any of the networks overlaps any of the other networks
+    """
+    return any(network.version == other.version and network.overlaps(other) for network in networks for other in other_networks)
+
+
+def get_num_endpoints(num : int, networks : [], other_networks : []) -> int:
+    """
+    Function to return the number of masters or slaves to instantiate, at least one and at most the number of host addresses in their networks. Warns if the networks overlap the other role's networks and there are enough endpoints for their addresses to collide
+    """
+    # declare local variables
+    num_hosts = get_num_hosts(networks)
+
+    if not num or num < 1:
+        num = 1
+    elif num > num_hosts:
+        log_info(f'# [!] get_num_endpoints: only {num_hosts} host addresses in {", ".join(map(str, networks))}, instantiating {num_hosts} instead of {num}')
+        num = num_hosts
+
+    # slaves count up and masters count down, so they meet in the middle of a shared subnet
+    if num > num_hosts // 2 and is_overlapping(networks, other_networks):
+        log_info(f'# [!] get_num_endpoints: {num} addresses from {", ".join(map(str, networks))} may collide with the other side\'s addresses in the same subnet, use separate --slave_subnets and --master_subnets')
+
+    return num
+
+
+def get_link_name(prefix : str, index : int) -> str:
+    """
+    Function to return the name of the index'th harness link with the prefix e.g. mbs1
+    """
+    return f'{prefix}{index}'
+
+
+def read_ip_json(ip_args : []) -> []:
+    """
+    Function to return the JSON output of the ip command with the arguments, which does not need root, or an empty list if it cannot be read
+    """
+    try:
+        result = subprocess.run([IP, '-json', *ip_args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        return json.loads(result.stdout or '[]')
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        log_info(f'# [!] read_ip_json: unable to read ip {" ".join(ip_args)}: {e}', False)
+        return []
+
+
+def get_link_state(prefix : str) -> {}:
+    """
+    Function to return the current state of the harness links, named the prefix followed by a number, as {name: {'parent', 'kind', 'up', 'addrs', 'routes'}} with the global addresses and the routes which are not added by the kernel
+    """
+    # declare local variables
+    state = {}
+
+    for link in read_ip_json(['-details', 'address', 'show']):
+        name = link.get('ifname', '')
+        if not name.startswith(prefix) or not name[len(prefix):].isdigit():
+            continue
+        state[name] = {
+            'parent': link.get('link'),
+            'kind': link.get('linkinfo', {}).get('info_kind'),
+            'up': 'UP' in link.get('flags', []),
+            'addrs': {f'{addr["local"]}/{addr["prefixlen"]}' for addr in link.get('addr_info', []) if addr.get('scope') == 'global'},
+            'routes': set(),
+        }
+
+    for family in ['-4', '-6']:
+        for route in read_ip_json([family, 'route', 'show']):
+            if route.get('dev') in state and route.get('protocol') != 'kernel':
+                state[route['dev']]['routes'].add(route.get('dst'))
+
+    return state
+
+
+def get_provision_batch(endpoints : [], state : {}) -> []:
+    """
+    Function to return the ip -batch commands which give each endpoint, a (link name, interface, address/prefix length, routes) tuple, a macvlan link on the interface with a spoofed MAC address, its address and a static route to each of the routes IP addresses. Only the differences from the current state of the harness links are returned, so re-runs leave the links which are already right alone, and harness links which are not endpoints are deleted
+    """
+    # declare local variables
+    batch = []
+    names = set()
+    wanted = {route for _, _, _, routes in endpoints for route in routes} # route replace moves these from one link to another
+
+    for name, iface, address, routes in endpoints:
+        names.add(name)
+        link = state.get(name)
+
+        # recreate the link if it is not a macvlan link of the interface
+        if link and (link['parent'] != iface or link['kind'] != 'macvlan'):
+            batch.append(f'link del dev {name}')
+            link = None
+        if not link:
+            batch.append(f'link add link {iface} name {name} address {create_mac_addr()} type macvlan mode bridge')
+            link = {'up': False, 'addrs': set(), 'routes': set()}
+        if not link['up']:
+            batch.append(f'link set dev {name} up')
+
+        # replace the address
+        for stale in sorted(link['addrs'] - {address}):
+            batch.append(f'address del {stale} dev {name}')
+        if address not in link['addrs']:
+            batch.append(f'address add {address} dev {name}' + (' nodad' if ':' in address else '')) # IPv6 addresses are usable straight away
+
+        # replace the routes
+        for stale in sorted(link['routes'] - wanted):
+            batch.append(f'route del {stale} dev {name}')
+        for route in routes:
+            if route not in link['routes']:
+                batch.append(f'route replace {route} dev {name}')
+
+    # delete the harness links left over from a bigger fleet
+    batch.extend(get_teardown_batch(sort_link_names(set(state) - names)))
+
+    return batch
+
+
+def sort_link_names(names : []) -> []:
+    """
+    Function to sort link names with the same prefix by their number
+    """
+    return sorted(names, key=lambda name: (len(name), name))
+
+
+def get_teardown_batch(names : []) -> []:
+    """
+    Function to return the ip -batch commands which delete the links, which also removes their addresses and routes
+    """
+    return [f'link del dev {name}' for name in names]
+
+
+def apply_batch(batch : [], dry_run : bool = False) -> bool:
+    """
+    Function to apply the ip -batch commands as one ip process, carrying on past commands which fail, or print them if dry_run. Returns True if every command succeeded
+    """
+    # check parameters
+    if not batch:
+        log_info('# [+] apply_batch: interfaces already up to date')
+        return True
+
+    if dry_run:
+        for command in batch:
+            print(command)
+        return True
+
+    try:
+        result = subprocess.run([IP, '-force', '-batch', '-'], input=LINE_SEPARATOR.join(batch) + LINE_SEPARATOR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    except OSError as e:
+        log_info(f'# [!] apply_batch: unable to run {IP}: {e}')
+        return False
+    if result.returncode:
+        log_info(f'# [!] apply_batch: {IP} -batch exited with {result.returncode}: {result.stderr.strip()}')
+        return False
+
+    log_info(f'# [+] apply_batch: applied {len(batch)} interface commands')
+    return True
+
+
+def print_batch(batch : []):
+    """
+    Function to print the ip -batch commands as one ip command of the script
+    """
+    if batch:
+        print(f"sudo {IP} -force -batch - <<'EOF'")
+        for command in batch:
+            print(command)
+        print('EOF')
+
+
+def wait_for_endpoints(ip_addrs : [], port : int, timeout : float = READY_TIMEOUT, process = None) -> bool:
+    """
+    Function to poll each IP address and port until it accepts a TCP connection. Returns False if the timeout expires, the fleet is stopped or the optional process exits first
+    """
+    # declare local variables
+    deadline = time.monotonic() + timeout
+
+    for ip_addr in ip_addrs:
+        while True:
+            if FLEET_STOP.is_set() or (process and process.poll() is not None):
+                return False
+            try:
+                with socket.create_connection((ip_addr, port), timeout=1):
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.1)
+
+    return True
+
+
+class FleetWorker:
+    """
+    A proto_server or proto_client process run by the orchestrator. The addresses in wait_for must accept connections before it is started, e.g. the slaves of a master, and the addresses in ready_addrs once it is started, e.g. the slaves a server binds to
+    """
+
+    def __init__(self, name : str, command : [], port : int = TCP_PORT, wait_for : [] = None, ready_addrs : [] = None, restart_on_exit : bool = False):
+        self.name = name
+        self.command = command
+        self.port = port
+        self.wait_for = wait_for or []
+        self.ready_addrs = ready_addrs or []
+        self.restart_on_exit = restart_on_exit # servers are restarted whenever they exit, clients only if they fail
+        self.process = None
+        self.restarts = 0
+        self.ready = None # monotonic time it was ready
+        self.done = False
+
+
+    def start(self) -> bool:
+        """
+        Function to start the worker process in its own session, so that a Ctrl-C only reaches the orchestrator
+        """
+        try:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            log_info(f'# [!] FleetWorker.start: unable to start {self.name}: {e}')
+            return False
+        return True
+
+
+    def launch(self, timeout : float = READY_TIMEOUT) -> bool:
+        """
+        Function to wait for the slaves of the worker, start it and wait until it is ready, stopping it straight away if it is not. Returns True if it is ready
+        """
+        if not wait_for_endpoints(self.wait_for, self.port, timeout):
+            log_info(f'# [!] FleetWorker.launch: {self.name} slaves not reachable on port {self.port} after {timeout}s')
+            return False
+        if not self.start():
+            return False
+        if not wait_for_endpoints(self.ready_addrs, self.port, timeout, self.process) or self.process.poll() is not None:
+            log_info(f'# [!] FleetWorker.launch: {self.name} not ready after {timeout}s, exit code {self.process.poll()}')
+            self.stop()
+            self.kill(TEARDOWN_TIMEOUT)
+            return False
+        self.ready = time.monotonic()
+        return True
+
+
+    def stop(self):
+        """
+        Function to ask the worker process to exit
+        """
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+
+    def kill(self, timeout : float = 0):
+        """
+        Function to wait up to timeout seconds for the worker process to exit, then kill it
+        """
+        if not self.process:
+            return
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            log_info(f'# [!] FleetWorker.kill: {self.name} did not exit, killing pid {self.process.pid}')
+            self.process.kill()
+            self.process.wait()
+
+
+def stop_fleet(signum, frame):
+    """
+    Signal handler to tear the orchestrated fleet down
+    """
+    FLEET_STOP.set()
+
+
+def orchestrate(workers : [], provision_batch : [], teardown_batch : [], jobs : int = START_JOBS, max_restarts : int = MAX_RESTARTS, ready_timeout : float = READY_TIMEOUT) -> bool:
+    """
+    Function to run the fleet in place of the generated script: apply the ip -batch commands configuring every interface, start every worker, jobs at a time, report the time until the whole fleet is ready, restart workers which fail to become ready or exit up to max_restarts times each, and on SIGINT/SIGTERM or once every worker is done stop the workers and run the teardown commands. Returns True if no worker failed
+    """
+    # declare local variables
+    jobs = max(1, jobs)
+    failed = []
+    started = time.monotonic()
+
+    def launch(worker : FleetWorker) -> bool:
+        # a worker which is not ready is launched again, sharing the restart budget with later failures
+        while not worker.launch(ready_timeout):
+            if FLEET_STOP.is_set():
+                return False
+            if worker.restarts >= max_restarts:
+                log_info(f'# [!] orchestrate: {worker.name} not ready, giving up after {worker.restarts} restarts')
+                return False
+            worker.restarts += 1
+            log_info(f'# [!] orchestrate: {worker.name} not ready, restart {worker.restarts} of {max_restarts}')
+        return True
+
+    # tear down on a signal rather than being interrupted part way through
+    signal.signal(signal.SIGINT, stop_fleet)
+    signal.signal(signal.SIGTERM, stop_fleet)
+
+    try:
+        # configure every interface from one ip process, the workers cannot run without them
+        if not apply_batch(provision_batch):
+            log_info(f'# [!] orchestrate: unable to configure the interfaces, not starting {len(workers)} workers')
+            return False
+        configured = time.monotonic()
+        log_info(f'# [+] orchestrate: applied {len(provision_batch)} interface commands in {configured - started:.3f}s')
+
+        # start the workers in parallel, each once its slaves are reachable
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            is_ready = list(executor.map(launch, workers))
+        if FLEET_STOP.is_set():
+            return False
+        num_ready = is_ready.count(True)
+        if num_ready:
+            log_info(f'# [+] orchestrate: {num_ready} of {len(workers)} workers ready in {max(worker.ready for worker in workers if worker.ready) - started:.3f}s from start, {configured - started:.3f}s configuring interfaces')
+        failed = [worker for worker, ready in zip(workers, is_ready) if not ready]
+
+        # supervise the workers until they are all done or the fleet is stopped
+        while not FLEET_STOP.is_set():
+            for worker in workers:
+                if worker.done or worker in failed or worker.process is None:
+                    continue
+                exit_code = worker.process.poll()
+                if exit_code is None:
+                    continue
+                if exit_code == 0 and not worker.restart_on_exit:
+                    log_info(f'# [+] orchestrate: {worker.name} done')
+                    worker.done = True
+                elif worker.restarts >= max_restarts:
+                    log_info(f'# [!] orchestrate: {worker.name} exited with {exit_code}, giving up after {worker.restarts} restarts')
+                    failed.append(worker)
+                else:
+                    worker.restarts += 1
+                    log_info(f'# [!] orchestrate: {worker.name} exited with {exit_code}, restart {worker.restarts} of {max_restarts}')
+                    if not worker.start():
+                        failed.append(worker)
+            if all(worker.done or worker in failed for worker in workers):
+                break
+            FLEET_STOP.wait(SUPERVISE_INTERVAL)
+    finally:
+        # stop every worker, give them time to exit, then remove the interfaces
+        for worker in workers:
+            worker.stop()
+        deadline = time.monotonic() + TEARDOWN_TIMEOUT
+        for worker in workers:
+            worker.kill(max(0, deadline - time.monotonic()))
+        apply_batch(teardown_batch)
+        log_info(f'# [+] orchestrate: tore down {len(workers)} workers and {len(teardown_batch)} interfaces after {time.monotonic() - started:.3f}s')
+
+    return not failed
+
+
 #
 # main entry point
 #
@@ -243,6 +804,8 @@ def main():
     # declare variables
     global SLAVE_LIST_HANDLE
     slaves_list = None
+    endpoints = [] # (link name, address/prefix length, routes) of each sub-interface
+    workers = [] # modbus prototype processes
 
     # parse command line arguments
     parser = argparse.ArgumentParser(
@@ -256,13 +819,85 @@ def main():
     parser.add_argument('-n', '--num',
                         type=int,
                         default=1,
-                        help='number of masters or slaves to instantiate, ignored for server/slave setup, max is 254, default="1"')
+                        help='number of masters or slaves to instantiate, max is the number of host addresses in their subnets, default="1"')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=1,
+                        help='number of worker processes, one per CPU core, each master client spreads its slaves across, or with --orchestrate the number of server processes the slaves are spread across, default="1"')
     parser.add_argument('-l', '--slaves_list',
                         type=str,
                         default=DEFAULT_SLAVES_LIST_FILENAME,
                         help=f'file containing line separated list of IP addresses for slaves for masters to poll, ignored for master/client setup, default="{DEFAULT_SLAVES_LIST_FILENAME}"')
+    parser.add_argument('-p', '--port',
+                        type=int,
+                        default=TCP_PORT,
+                        help=f'port the slaves serve on, default="{TCP_PORT}"')
+    parser.add_argument('-o', '--orchestrate',
+                        action='store_true',
+                        help='configure the interfaces and run and supervise the modbus prototypes from this process instead of printing a script, until they are done or on Ctrl-C, then tear them down')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=START_JOBS,
+                        help=f'number of processes started in parallel with --orchestrate, default="{START_JOBS}"')
+    parser.add_argument('-R', '--restarts',
+                        type=int,
+                        default=MAX_RESTARTS,
+                        help=f'number of times a failed process is restarted with --orchestrate, default="{MAX_RESTARTS}"')
+    parser.add_argument('-t', '--timeout',
+                        type=float,
+                        default=READY_TIMEOUT,
+                        help=f'seconds a process has to start serving its slaves, or for the slaves of a master to become reachable, with --orchestrate, default="{READY_TIMEOUT}"')
+    parser.add_argument('-S', '--slave_subnets',
+                        type=str,
+                        default=SLAVE_SUBNETS,
+                        help=f'comma separated IPv4 or IPv6 CIDR networks the slave addresses are allocated from, counting up from the first address of each, default="{SLAVE_SUBNETS}"')
+    parser.add_argument('-M', '--master_subnets',
+                        type=str,
+                        default=MASTER_SUBNETS,
+                        help=f'comma separated IPv4 or IPv6 CIDR networks the master addresses are allocated from, counting down from the last address of each, default="{MASTER_SUBNETS}"')
+    parser.add_argument('-i', '--ifaces',
+                        type=str,
+                        default=IFACE,
+                        help=f'comma separated network interfaces the masters or slaves are spread across, default="{IFACE}"')
+    parser.add_argument('-F', '--profile',
+                        type=str,
+                        help='proto_client traffic profile whose group rates are the expected requests/s of the slaves, to balance the slaves across the masters by load, ignored for server/slave setup, default=split the slaves list evenly')
+    parser.add_argument('-H', '--histograms',
+                        type=str,
+                        help='comma separated latency histogram files written by earlier proto_client -H runs, whose measured requests/s per slave override the profile rates to balance the slaves across the masters, ignored for server/slave setup, default=split the slaves list evenly')
+    parser.add_argument('-x', '--teardown',
+                        action='store_true',
+                        help='remove the interfaces of every master or slave, printed as a script, applied with --orchestrate or listed with --dry_run')
+    parser.add_argument('-d', '--dry_run',
+                        action='store_true',
+                        help='print the ip -batch commands which would bring the interfaces from their current state to the set-up, or tear them down, without changing them or writing the slaves lists, does not need root')
     args = parser.parse_args()
 
+    # check privileges
+    if not args.dry_run and os.geteuid() != 0:
+        print(f'# [!] must be run with root privileges')
+        sys.exit() 
+
+    # remove the interfaces of every master or slave
+    if args.teardown and args.setup:
+        state = get_link_state(MASTER_LINK_PREFIX if args.setup in ['client', 'master'] else SLAVE_LINK_PREFIX)
+        teardown_batch = get_teardown_batch(sort_link_names(state))
+        if args.orchestrate or args.dry_run:
+            apply_batch(teardown_batch, args.dry_run)
+        else:
+            script_preamble()
+            print_batch(teardown_batch)
+            script_post()
+        return
+
+
+    # get the subnets and interfaces
+    slave_networks = get_networks(args.slave_subnets)
+    master_networks = get_networks(args.master_subnets)
+    ifaces = [iface.strip() for iface in args.ifaces.split(',') if iface.strip()]
+    if not slave_networks or not master_networks or not ifaces:
+        log_info('# [!] main: must specify valid slave and master subnets and at least one interface')
+        sys.exit() 
 
     # check set-up type
     if not args.setup:
@@ -288,51 +923,38 @@ def main():
         # copy the modbus prototypes onto the VM - TODO: implement this
 
         # split list into number of hosts per master
-        if not args.num or args.num < 1:
-            num= 1
-        elif args.num > 254:
-            num = 254
+        num = get_num_endpoints(args.num, master_networks, slave_networks)
+        rates = None
+        if args.profile or args.histograms:
+            # bin-pack the slaves by expected load onto the masters, and order each master's slaves to balance its workers
+            rates = get_slave_rates(slaves, args.profile, args.histograms)
+            slave_chunks = [order_for_cores(chunk, rates, max(1, args.workers)) for chunk in balance_slaves(slaves, rates, num)]
         else:
-            num = args.num
-        num_per_chunk = math.ceil(len(slaves)/num)
-        slave_chunks = list(chunkify(slaves, num_per_chunk))
-
-        # set-up script
-        script_preamble()
-
-        # generate commands to create sub-interfaces on VM for each master, we iterate using the slave_chunks in case the number of chunks is less than the number of masters specified
-        for i in range(len(slave_chunks)):
-            mac_addr = create_mac_addr()
-            ip_addr = f'10.10.10.{255-(i+1)}'
-
-            # create sub-interface - TODO: accept network address as parameter
-            #command = f'ifconfig {IFACE}:{i+1} hw ether {mac_addr} {ip_addr} netmask 255.0.0.0 up'
-
-            # delete the interface in case it existed
-            command = f'sudo /usr/sbin/ifconfig {IFACE}:{i+1} down'
-            print(command)
+            num_per_chunk = math.ceil(len(slaves)/num)
+            slave_chunks = list(chunkify(slaves, num_per_chunk))
 
-            # create new interface
-            command = f'sudo /usr/sbin/ifconfig {IFACE}:{i+1} {ip_addr}/24 hw ether {mac_addr} up'
-            print(command)
-
-            # delete the route created 
-            #command = f'sudo /usr/sbin/route del -net 10.0.0.0 netmask 255.0.0.0 dev {IFACE}:{i+1}'
-            #print(command)
+        # generate the interface for each master, we iterate using the slave_chunks in case the number of chunks is less than the number of masters specified
+        prefix = MASTER_LINK_PREFIX
+        for i, (ip_addr, prefix_len) in zip(range(len(slave_chunks)), get_host_addresses(master_networks, descending=True)):
 
-            # process each slave in the current chunk
-            for slave_ip in slave_chunks[i]:
+            # create sub-interface with a static route for each slave in the current chunk
+            endpoints.append((get_link_name(prefix, i+1), ifaces[i % len(ifaces)], f'{ip_addr}/{prefix_len}', slave_chunks[i]))
 
-                # add static route for slave via the current sub-interface
-                command = f'sudo /usr/sbin/ip route add {slave_ip} dev {IFACE}:{i+1}'
-                print(command)
+            # predicted load of the master and each of its workers
+            if rates:
+                core_rates = get_core_rates(slave_chunks[i], rates, max(1, args.workers))
+                log_info(f'# [+] main: master {i+1} {ip_addr}: {len(slave_chunks[i])} slaves, {sum(core_rates):.1f} requests/s predicted, per worker {"/".join(f"{rate:.1f}" for rate in core_rates)}')
 
-                # execute the modbus prototype server on each sub-interface
-                command = f'sudo {PYTHON} proto_client.py -i {slave_ip} -p 502 &' 
-                print(command)
+            # write the chunk to its own slaves list so that one modbus prototype client process polls all slaves in the chunk
+            chunk_filename = f'master_{i+1}_{os.path.basename(args.slaves_list)}'
+            if not args.dry_run and not write_slaves_chunk(slave_chunks[i], chunk_filename):
+                continue
 
-        # set-up script
-        script_post()
+            # execute the modbus prototype client for the current sub-interface, once its slaves are reachable
+            command = [PYTHON, 'proto_client.py', '-l', chunk_filename, '-p', str(args.port), '-w', str(max(1, args.workers))]
+            if args.profile:
+                command.extend(['-F', args.profile]) # generate the load the slaves were balanced for
+            workers.append(FleetWorker(f'master {i+1}', command, args.port, wait_for=slave_chunks[i]))
 
         pass
     elif args.setup == 'server' or args.setup == 'slave':
@@ -344,12 +966,7 @@ def main():
         # copy the modbus prototypes onto the VM - TODO: implement this
 
         # get the number of slaves to instantiate
-        if not args.num or args.num < 1:
-            num= 1
-        elif args.num > 254:
-            num = 254
-        else:
-            num = args.num
+        num = get_num_endpoints(args.num, slave_networks, master_networks)
 
         # check if slaves list specified
         if not args.slaves_list:
@@ -357,39 +974,58 @@ def main():
         else:
             slaves_list = args.slaves_list
 
-        # set-up script
-        script_preamble()
-
-        # generate commands to create sub-interfaces on VM for each slave
-        for i in range(num):
-            mac_addr = create_mac_addr()
-            ip_addr = f'10.10.10.{i+1}'
-
-            #command = f'ifconfig {IFACE}:{i+1} hw ether {mac_addr} {ip_addr} netmask 255.0.0.0 up'
-            # delete the interface if it exists
-            command = f'sudo /usr/sbin/ifconfig {IFACE}:{i+1} down'
-            print(command)
-
-            # create new interface
-            command = f'sudo /usr/sbin/ifconfig {IFACE}:{i+1} {ip_addr}/24 hw ether {mac_addr} up'
-            print(command)
+        # generate the interface for each slave
+        prefix = SLAVE_LINK_PREFIX
+        slaves = []
+        for i, (ip_addr, prefix_len) in zip(range(num), get_host_addresses(slave_networks)):
 
-            # execute the modbus prototype client on each sub-interface - and send to background
-            command = f'sudo {PYTHON} proto_server.py -i {ip_addr} -p 502 &'
-            print(command)
+            # create sub-interface
+            endpoints.append((get_link_name(prefix, i+1), ifaces[i % len(ifaces)], f'{ip_addr}/{prefix_len}', []))
 
             # write the slave IP address to the slave list output file
-            append_to_slave_list(ip_addr, slaves_list)
+            if not args.dry_run:
+                append_to_slave_list(ip_addr, slaves_list)
+            slaves.append(ip_addr)
 
 
         # close the slaves list file
-        SLAVE_LIST_HANDLE.close
+        if SLAVE_LIST_HANDLE:
+            SLAVE_LIST_HANDLE.close()
 
-        # set-up script
-        script_post()
+        # execute a single modbus prototype server process serving every sub-interface, or with the orchestrator split the slaves across a bounded number of server processes
+        num_workers = min(max(1, args.workers), os.cpu_count() or 1, num) if args.orchestrate else 1
+        if num_workers == 1:
+            workers.append(FleetWorker('server 1', [PYTHON, 'proto_server.py', '-l', slaves_list, '-p', str(args.port)], args.port, ready_addrs=slaves, restart_on_exit=True))
+        else:
+            for i, slave_chunk in enumerate(chunkify(slaves, math.ceil(num/num_workers))):
+                chunk_filename = f'server_{i+1}_{os.path.basename(slaves_list)}'
+                if args.dry_run or write_slaves_chunk(slave_chunk, chunk_filename):
+                    workers.append(FleetWorker(f'server {i+1}', [PYTHON, 'proto_server.py', '-l', chunk_filename, '-p', str(args.port)], args.port, ready_addrs=slave_chunk, restart_on_exit=True))
     else:
         # technically should never ever get here since argparse should handle invalid options
         log_info(f'# [!] main: setup type {args.setup} not supported!')
+        sys.exit()
+
+    # only the differences from the interfaces already there are applied, so re-runs are cheap
+    provision_batch = get_provision_batch(endpoints, get_link_state(prefix))
+    if args.dry_run:
+        apply_batch(provision_batch, True)
+        return
+
+    # run the fleet from this process
+    if args.orchestrate:
+        for worker in workers:
+            worker.command[0] = get_python()
+        if not orchestrate(workers, provision_batch, get_teardown_batch([endpoint[0] for endpoint in endpoints]), args.jobs, args.restarts, args.timeout):
+            sys.exit(1)
+        return
+
+    # or print the script - send the modbus prototypes to background
+    script_preamble()
+    print_batch(provision_batch)
+    for worker in workers:
+        print(f'sudo {" ".join(worker.command)} &')
+    script_post()
 
 
 if __name__ == "__main__":
@@ -398,10 +1034,5 @@ if __name__ == "__main__":
         print(f'# [!] unsupported operating system, currently only runs on Linux')
         sys.exit() 
 
-    # check if user is root
-    if os.geteuid() != 0:
-        print(f'# [!] must be run with root privileges')
-        sys.exit() 
-
     # call the main function
     main()
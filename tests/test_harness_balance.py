@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+import test_harness
+
+
+def get_slaves(num_slaves:int, seed:int) -> tuple:
+    rng = random.Random(seed)
+    slaves = [f'10.10.{index // 250}.{index % 250 + 1}' for index in range(num_slaves)]
+    return (slaves, {ip_addr: rng.choice([1.0, 2.0, 5.0, 10.0, 50.0]) for ip_addr in slaves})
+
+
+@pytest.mark.parametrize('num_masters', [1, 3, 7])
+def test_balance_slaves_deterministic(num_masters):
+    slaves, rates = get_slaves(500, 1)
+    assignment = test_harness.balance_slaves(slaves, rates, num_masters)
+    assert assignment == test_harness.balance_slaves(list(slaves), dict(rates), num_masters)
+    assert sorted(ip_addr for chunk in assignment for ip_addr in chunk) == sorted(slaves)
+    order = {ip_addr: index for index, ip_addr in enumerate(slaves)}
+    for chunk in assignment:
+        assert chunk == sorted(chunk, key=order.get)
+
+
+def test_balance_slaves_longest_processing_time_bound():
+    # LPT is within 4/3 of the optimum, and the optimum is at least the mean load and the busiest slave
+    slaves, rates = get_slaves(200, 2)
+    num_masters = 6
+    loads = [sum(rates[ip_addr] for ip_addr in chunk) for chunk in test_harness.balance_slaves(slaves, rates, num_masters)]
+    lower_bound = max(sum(rates.values()) / num_masters, max(rates.values()))
+    assert max(loads) <= 4 / 3 * lower_bound
+
+
+def test_balance_slaves_fewer_slaves_than_masters():
+    slaves, rates = get_slaves(3, 3)
+    assignment = test_harness.balance_slaves(slaves, rates, 5)
+    assert sorted(len(chunk) for chunk in assignment) == [1, 1, 1]
+    assert test_harness.balance_slaves([], rates, 5) == []
+
+
+def test_order_for_cores_even_load():
+    slaves, rates = get_slaves(64, 4)
+    ordered = test_harness.order_for_cores(slaves, rates, 4)
+    assert sorted(ordered) == sorted(slaves)
+    core_rates = test_harness.get_core_rates(ordered, rates, 4)
+    assert len(core_rates) == 4
+    assert sum(core_rates) == pytest.approx(sum(rates.values()))
+    assert max(core_rates) - min(core_rates) <= max(rates.values())
@@ -0,0 +1,87 @@
+import test_harness
+
+
+ENDPOINTS = [
+    ('mbm1', 'eth0', '10.10.10.254/24', ['10.10.10.1', '10.10.10.2']),
+    ('mbm2', 'eth0', '10.10.10.253/24', ['10.10.10.3']),
+]
+
+
+def get_state(endpoints:list) -> dict:
+    # link state as get_link_state returns it once the endpoints are provisioned
+    return {name: {'parent': iface, 'kind': 'macvlan', 'up': True, 'addrs': {address}, 'routes': set(routes)}
+            for name, iface, address, routes in endpoints}
+
+
+def test_provision_from_scratch():
+    batch = test_harness.get_provision_batch(ENDPOINTS, {})
+    link_adds = [command for command in batch if command.startswith('link add')]
+    assert [command.split()[5] for command in link_adds] == ['mbm1', 'mbm2']
+    assert all(command.startswith('link add link eth0 ') and command.endswith(' type macvlan mode bridge') for command in link_adds)
+    assert 'address add 10.10.10.254/24 dev mbm1' in batch
+    assert 'route replace 10.10.10.3 dev mbm2' in batch
+    assert not [command for command in batch if command.startswith(('link del', 'route del', 'address del'))]
+
+
+def test_matching_state():
+    assert test_harness.get_provision_batch(ENDPOINTS, get_state(ENDPOINTS)) == []
+
+
+def test_moved_route():
+    # a slave moved from one master to another is a single route replace, with no route del of it from the old link
+    moved = [
+        ('mbm1', 'eth0', '10.10.10.254/24', ['10.10.10.1']),
+        ('mbm2', 'eth0', '10.10.10.253/24', ['10.10.10.3', '10.10.10.2']),
+    ]
+    assert test_harness.get_provision_batch(moved, get_state(ENDPOINTS)) == ['route replace 10.10.10.2 dev mbm2']
+
+
+def test_stale_address_and_route():
+    state = get_state(ENDPOINTS)
+    state['mbm1']['addrs'] = {'10.10.10.200/24'}
+    state['mbm2']['routes'].add('10.10.10.9')
+    assert test_harness.get_provision_batch(ENDPOINTS, state) == [
+        'address del 10.10.10.200/24 dev mbm1',
+        'address add 10.10.10.254/24 dev mbm1',
+        'route del 10.10.10.9 dev mbm2',
+    ]
+
+
+def test_recreate_wrong_link():
+    state = get_state(ENDPOINTS)
+    state['mbm2']['parent'] = 'eth1'
+    batch = test_harness.get_provision_batch(ENDPOINTS, state)
+    assert batch[0] == 'link del dev mbm2'
+    assert batch[1].startswith('link add link eth0 name mbm2 ')
+    assert batch[2:] == ['link set dev mbm2 up', 'address add 10.10.10.253/24 dev mbm2', 'route replace 10.10.10.3 dev mbm2']
+
+
+def test_leftover_links_deleted():
+    # links of a bigger fleet are deleted, in link number order
+    state = get_state(ENDPOINTS + [
+        ('mbm10', 'eth0', '10.10.10.245/24', ['10.10.10.20']),
+        ('mbm3', 'eth0', '10.10.10.252/24', ['10.10.10.4']),
+    ])
+    assert test_harness.get_provision_batch(ENDPOINTS, state) == ['link del dev mbm3', 'link del dev mbm10']
+
+
+def test_teardown_batch():
+    names = test_harness.sort_link_names({'mbs10', 'mbs2', 'mbs1', 'mbs100'})
+    assert names == ['mbs1', 'mbs2', 'mbs10', 'mbs100']
+    assert test_harness.get_teardown_batch(names) == ['link del dev mbs1', 'link del dev mbs2', 'link del dev mbs10', 'link del dev mbs100']
+    assert test_harness.get_teardown_batch([]) == []
+
+
+def test_link_state(monkeypatch):
+    # only numbered links of the prefix, their global addresses and the routes not added by the kernel
+    links = [
+        {'ifname': 'mbm1', 'link': 'eth0', 'flags': ['BROADCAST', 'UP'], 'linkinfo': {'info_kind': 'macvlan'},
+            'addr_info': [{'local': '10.10.10.254', 'prefixlen': 24, 'scope': 'global'}, {'local': 'fe80::1', 'prefixlen': 64, 'scope': 'link'}]},
+        {'ifname': 'mbmx', 'link': 'eth0', 'flags': ['UP'], 'addr_info': []},
+        {'ifname': 'eth0', 'flags': ['UP'], 'addr_info': []},
+    ]
+    routes = {'-4': [{'dst': '10.10.10.1', 'dev': 'mbm1', 'protocol': 'boot'}, {'dst': '10.10.10.0/24', 'dev': 'mbm1', 'protocol': 'kernel'}], '-6': []}
+    monkeypatch.setattr(test_harness, 'read_ip_json', lambda args: routes[args[0]] if args[0] in routes else links)
+    assert test_harness.get_link_state('mbm') == {
+        'mbm1': {'parent': 'eth0', 'kind': 'macvlan', 'up': True, 'addrs': {'10.10.10.254/24'}, 'routes': {'10.10.10.1'}},
+    }
@@ -0,0 +1,134 @@
+import asyncio
+import struct
+
+import pytest
+from pymodbus.exceptions import ConnectionException
+from pymodbus.exceptions import ParameterException
+
+import proto_codec
+from proto_datastore import pack_bits
+from proto_datastore import unpack_bits
+
+
+def test_encode_request():
+    frame = proto_codec.encode_request(0x1234, 7, 0x03, 100, 10)
+    assert frame == bytes.fromhex('1234 0000 0006 07 03 0064 000a')
+
+
+def test_encode_write_registers():
+    values = [0, 1, 0x7FFF, 0xFFFF]
+    frame = proto_codec.encode_write_registers(9, 1, 20, values)
+    transaction_id, protocol_id, length, slave_id, function_code, address, count, byte_count = proto_codec.WRITE_MULTIPLE_STRUCT.unpack_from(frame)
+    assert (transaction_id, protocol_id, slave_id, function_code, address, count, byte_count) == (9, 0, 1, 0x10, 20, 4, 8)
+    assert length == len(frame) - 6
+    assert list(struct.unpack_from('>4H', frame, proto_codec.WRITE_MULTIPLE_STRUCT.size)) == values
+
+
+@pytest.mark.parametrize('count', [1, 7, 8, 9, 64, proto_codec.MAX_WRITE_COILS])
+def test_encode_write_coils(count):
+    values = [bool(index % 3) for index in range(count)]
+    frame = proto_codec.encode_write_coils(1, 1, 0, values)
+    header = proto_codec.WRITE_MULTIPLE_STRUCT.unpack_from(frame)
+    byte_count = header[-1]
+    assert header[2] == len(frame) - 6
+    assert (header[6], byte_count) == (count, -(-count // 8))
+    bits = unpack_bits(frame[proto_codec.WRITE_MULTIPLE_STRUCT.size:])
+    assert len(bits) == 8 * byte_count
+    assert bits[:count] == values
+    assert not any(bits[count:])
+
+
+@pytest.mark.parametrize('encode, limit', [
+    (proto_codec.encode_write_registers, proto_codec.MAX_WRITE_REGISTERS),
+    (proto_codec.encode_write_coils, proto_codec.MAX_WRITE_COILS),
+])
+def test_encode_write_limits(encode, limit):
+    assert encode(1, 1, 0, [1] * limit)
+    for count in (0, limit + 1):
+        with pytest.raises(ParameterException):
+            encode(1, 1, 0, [1] * count)
+
+
+def test_decode_registers():
+    registers = [1, 2, 0xFFFF]
+    response = proto_codec.decode_response(memoryview(bytes([0x04, 6]) + struct.pack('>3H', *registers)), 3, 11)
+    assert not response.isError()
+    assert (response.function_code, response.slave_id, response.transaction_id) == (0x04, 3, 11)
+    assert response.registers == registers
+
+
+def test_decode_bits():
+    bits = [True, False, False, True, True, False, True, False, True]
+    data = pack_bits(bits).to_bytes(2, 'little')
+    response = proto_codec.decode_response(memoryview(bytes([0x01, 2]) + data))
+    assert response.bits[:len(bits)] == bits
+    assert not any(response.bits[len(bits):])
+
+
+def test_decode_write_echo():
+    response = proto_codec.decode_response(memoryview(bytes([0x10]) + struct.pack('>HH', 20, 4)))
+    assert (response.address, response.value) == (20, 4)
+
+
+def test_decode_exception():
+    response = proto_codec.decode_response(memoryview(bytes([0x83, 0x02])))
+    assert response.isError()
+    assert (response.function_code, response.exception_code) == (0x03, 0x02)
+
+
+def test_decode_truncated():
+    with pytest.raises((struct.error, IndexError)):
+        proto_codec.decode_response(memoryview(bytes([0x03, 6, 0])))
+
+
+def test_pack_bits_round_trip():
+    values = [bool(index % 5 == 0) for index in range(100)]
+    assert unpack_bits(pack_bits(values).to_bytes(13, 'little'))[:100] == values
+
+
+class FakeTransport:
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+
+    def close(self):
+        self.protocol.connection_lost(None)
+
+
+def get_protocol(transaction_ids:list) -> tuple:
+    protocol = proto_codec.ModbusRawProtocol()
+    protocol.connection_made(FakeTransport(protocol))
+    loop = asyncio.get_running_loop()
+    futures = {transaction_id: loop.create_future() for transaction_id in transaction_ids}
+    protocol.pending.update(futures)
+    return (protocol, futures)
+
+
+def test_protocol_pipelined_responses():
+    asyncio.run(check_pipelined_responses())
+
+
+async def check_pipelined_responses():
+    protocol, futures = get_protocol([1, 2])
+    data = bytes.fromhex('0002 0000 0005 01 04 02 0007') + bytes.fromhex('0001 0000 0006 01 10 0014 0004')
+    protocol.data_received(data[:5])
+    protocol.data_received(data[5:])
+    assert futures[2].result().registers == [7]
+    assert (futures[1].result().address, futures[1].result().value) == (20, 4)
+    assert not protocol.databuffer
+
+
+@pytest.mark.parametrize('header', ['0001 0001 0005', '0001 0000 0001', '0001 0000 0000'])
+def test_protocol_invalid_header(header):
+    asyncio.run(check_invalid_header(header))
+
+
+async def check_invalid_header(header:str):
+    # a corrupt header closes the connection, failing the pending requests rather than skipping bytes
+    protocol, futures = get_protocol([1, 2])
+    protocol.data_received(bytes.fromhex(header + ' 01 03 02 0007 0002'))
+    assert protocol.transport is None
+    assert not protocol.databuffer
+    for response_future in futures.values():
+        with pytest.raises(ConnectionException):
+            response_future.result()
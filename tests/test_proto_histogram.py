@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from proto_histogram import LatencyHistogram
+from proto_histogram import MAX_LATENCY_US
+from proto_histogram import FUNCTION_CODE_SUB_BITS
+from proto_histogram import SLAVE_SUB_BITS
+
+
+@pytest.mark.parametrize('sub_bits', [FUNCTION_CODE_SUB_BITS, SLAVE_SUB_BITS])
+def test_bucket_bounds(sub_bits):
+    # every value falls in a bucket whose highest value is at least the value and within the relative error
+    histogram = LatencyHistogram(sub_bits)
+    relative_error = 1 / (1 << (sub_bits - 1))
+    values = list(range(5000)) + [1 << shift for shift in range(32)] + [(1 << shift) - 1 for shift in range(1, 33)] + [MAX_LATENCY_US]
+    for value in values:
+        index = histogram.get_index(value)
+        assert index < len(histogram.counts)
+        highest = histogram.get_value(index)
+        assert value <= highest <= value + value * relative_error
+        assert histogram.get_index(highest) == index
+        if index:
+            assert histogram.get_value(index - 1) < value
+
+
+def test_small_values_exact():
+    histogram = LatencyHistogram()
+    for value in range(histogram.sub_count):
+        assert histogram.get_value(histogram.get_index(value)) == value
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 1001):
+        histogram.record(value)
+    assert histogram.total == 1000
+    assert histogram.max == 1000
+    assert histogram.mean() == pytest.approx(500.5)
+    for percent in (50, 90, 99):
+        assert percent * 10 <= histogram.percentile(percent) <= percent * 10 * (1 + 1 / 64)
+    assert histogram.percentile(100) == 1000
+
+
+def test_percentile_empty_and_capped():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(99) == 0
+    histogram.record(1000)
+    assert histogram.percentile(50) == 1000
+    histogram.record(MAX_LATENCY_US + 1)
+    assert histogram.max == MAX_LATENCY_US
+
+
+def test_merge_and_round_trip():
+    rng = random.Random(1)
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for value in (rng.randrange(1, 100000) for _ in range(2000)):
+        (first if value % 2 else second).record(value)
+    merged = first.copy()
+    merged.merge(second)
+    assert merged.total == 2000
+    assert merged.sum == first.sum + second.sum
+    assert merged.subtract(first).counts == second.counts
+    restored = LatencyHistogram.from_dict(merged.to_dict())
+    assert restored.counts == merged.counts
+    assert [restored.percentile(percent) for percent in (50, 90, 99)] == [merged.percentile(percent) for percent in (50, 90, 99)]
@@ -0,0 +1,26 @@
+import proto_journal
+
+
+def test_endpoint_round_trip():
+    for ipaddr in ('10.10.10.1', '127.0.0.1', 'fd00::1'):
+        assert proto_journal.unpack_endpoint(proto_journal.pack_endpoint(ipaddr)) == ipaddr
+
+
+def test_resolve_endpoint():
+    assert proto_journal.resolve_endpoint('10.10.10.1') == proto_journal.pack_endpoint('10.10.10.1')
+    assert proto_journal.unpack_endpoint(proto_journal.resolve_endpoint('localhost')) in ('127.0.0.1', '::1')
+    assert proto_journal.resolve_endpoint('no-such-host.invalid') == proto_journal.ZERO_ENDPOINT
+
+
+def test_journal_hostname_target(tmp_path):
+    # targets given by host name are journaled by the address they resolve to
+    path = str(tmp_path / 'client.journal')
+    journal = proto_journal.TransactionJournal(path, records_per_file=16)
+    journal.record('localhost', 5020, 1, 0x03, 1, 10, proto_journal.STATUS_OK, 250)
+    journal.record('no-such-host.invalid', 5020, 1, 0x03, 1, 10, proto_journal.STATUS_NO_RESPONSE, 0)
+    journal.close()
+    records = list(proto_journal.read_journal_file(f'{path}.000000'))
+    assert len(records) == 2
+    assert proto_journal.unpack_endpoint(records[0][1]) in ('127.0.0.1', '::1')
+    assert records[0][2:] == (5020, 1, 0x03, 1, 10, proto_journal.STATUS_OK, 250)
+    assert records[1][1] == proto_journal.ZERO_ENDPOINT
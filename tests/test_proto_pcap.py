@@ -0,0 +1,69 @@
+import random
+import struct
+
+import pytest
+
+import proto_pcap
+from proto_pcap import TcpConnection
+from proto_pcap import TcpHost
+
+
+def get_sum(data:bytes) -> int:
+    # ones' complement sum of big endian 16 bit words, 0xFFFF when a checksum over the data is correct
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'>{len(data) // 2}H', data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def test_checksum_reference():
+    # RFC 1071 example words, whose sum is 0xddf2
+    data = bytes.fromhex('0001f203f4f5f6f7')
+    assert struct.pack('=H', proto_pcap.get_checksum(data)) == struct.pack('>H', ~0xddf2 & 0xFFFF)
+
+
+@pytest.mark.parametrize('payload', [b'', b'\x00\x01\x00\x00\x00\x06\x01\x03\x00\x00\x00\x0a', b'\xff' * 253])
+def test_ipv4_frame_checksums(payload):
+    connection = TcpConnection(TcpHost('10.10.10.254', '02:00:00:00:00:fe'), 40000, TcpHost('10.10.10.1', '02:00:00:00:00:01'), 502, random.Random(1))
+    frame = connection.get_frame(True, proto_pcap.TCP_PSH | proto_pcap.TCP_ACK, payload)
+    assert struct.unpack_from('>H', frame, 12)[0] == proto_pcap.ETHERTYPE_IPV4
+    ip_header = frame[14:34]
+    assert get_sum(ip_header) == 0xFFFF
+    total_length = struct.unpack_from('>H', ip_header, 2)[0]
+    assert total_length == len(frame) - 14
+    tcp = frame[34:]
+    assert tcp[20:] == payload
+    pseudo_header = ip_header[12:20] + struct.pack('>BBH', 0, 6, len(tcp))
+    assert get_sum(pseudo_header + tcp) == 0xFFFF
+
+
+@pytest.mark.parametrize('payload', [b'', b'\x00\x01\x00\x00\x00\x05\x01\x01\x02\x03\x00'])
+def test_ipv6_frame_checksums(payload):
+    connection = TcpConnection(TcpHost('fd00::fe', '02:00:00:00:00:fe'), 40000, TcpHost('fd00::1', '02:00:00:00:00:01'), 502, random.Random(1))
+    frame = connection.get_frame(False, proto_pcap.TCP_PSH | proto_pcap.TCP_ACK, payload)
+    assert struct.unpack_from('>H', frame, 12)[0] == proto_pcap.ETHERTYPE_IPV6
+    assert frame[14] >> 4 == 6 and frame[20] == 6
+    payload_length = struct.unpack_from('>H', frame, 18)[0]
+    tcp = frame[54:]
+    assert payload_length == len(tcp)
+    assert tcp[20:] == payload
+    pseudo_header = frame[22:54] + struct.pack('>I3xB', len(tcp), 6)
+    assert get_sum(pseudo_header + tcp) == 0xFFFF
+
+
+def test_sequence_numbers():
+    connection = TcpConnection(TcpHost('10.10.10.254', '02:00:00:00:00:fe'), 40000, TcpHost('10.10.10.1', '02:00:00:00:00:01'), 502, random.Random(1))
+    syn = connection.get_frame(True, proto_pcap.TCP_SYN)
+    syn_ack = connection.get_frame(False, proto_pcap.TCP_SYN | proto_pcap.TCP_ACK)
+    request = connection.get_frame(True, proto_pcap.TCP_PSH | proto_pcap.TCP_ACK, b'x' * 12)
+    client_seq = struct.unpack_from('>I', syn, 38)[0]
+    server_seq, ack = struct.unpack_from('>II', syn_ack, 38)
+    assert ack == client_seq + 1
+    assert struct.unpack_from('>II', request, 38) == (client_seq + 1, server_seq + 1)
+
+
+def test_mixed_versions_rejected():
+    with pytest.raises(ValueError):
+        TcpConnection(TcpHost('10.10.10.254', '02:00:00:00:00:fe'), 40000, TcpHost('fd00::1', '02:00:00:00:00:01'), 502, random.Random(1))
@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pytest
+
+import proto_profile
+from proto_profile import AliasTable
+
+
+@pytest.mark.parametrize('weights', [[1], [1, 1, 1, 1], [1, 2, 3, 4], [10, 0, 1, 0.5], [0.001, 1000]])
+def test_alias_table_frequencies(weights):
+    table = AliasTable(weights)
+    samples = table.sample(np.random.default_rng(1), 200000)
+    frequencies = np.bincount(samples, minlength=len(weights)) / len(samples)
+    expected = np.array(weights) / sum(weights)
+    assert np.allclose(frequencies, expected, atol=0.005)
+    assert all(frequencies[index] == 0 for index, weight in enumerate(weights) if weight == 0)
+
+
+def test_alias_table_deterministic():
+    table = AliasTable([3, 1, 2])
+    first = table.sample(np.random.default_rng(7), 1000)
+    second = table.sample(np.random.default_rng(7), 1000)
+    assert (first == second).all()
+
+
+def test_alias_table_probabilities():
+    table = AliasTable([1, 2, 3, 4])
+    assert ((table.probabilities >= 0) & (table.probabilities <= 1)).all()
+    assert ((table.aliases >= 0) & (table.aliases < 4)).all()
+
+
+def write_profile(tmp_path, profile:dict) -> str:
+    profile_file = tmp_path / 'profile.json'
+    profile_file.write_text(json.dumps(profile))
+    return str(profile_file)
+
+
+def test_function_codes_decimal_and_hex(tmp_path):
+    profile_file = write_profile(tmp_path, {'groups': [{'slaves': ['10.0.0.0/8'], 'function_codes': {'03': 2, '0x10': 1, '4': 1}}]})
+    traffic_profile = proto_profile.load_traffic_profile(profile_file, seed=1)
+    assert traffic_profile.groups[0].function_codes == {3: 2.0, 16: 1.0, 4: 1.0}
+
+
+@pytest.mark.parametrize('addresses, valid', [([1, 65436], True), ([1, 65437], False)])
+def test_address_space_bound(tmp_path, addresses, valid):
+    profile_file = write_profile(tmp_path, {'default': {'addresses': {'3': addresses}, 'counts': {'3': [1, 100]}}})
+    assert (proto_profile.load_traffic_profile(profile_file, seed=1) is not None) == valid
+
+
+def test_hostname_target_default_group(tmp_path):
+    profile_file = write_profile(tmp_path, {'groups': [{'slaves': ['127.0.0.0/8'], 'rate': 10}]})
+    traffic_profile = proto_profile.load_traffic_profile(profile_file, seed=1)
+    assert traffic_profile.get_group('127.0.0.1') is traffic_profile.groups[0]
+    assert traffic_profile.get_group('localhost') is traffic_profile.default_group
+    assert traffic_profile.compile([('localhost', 502, 1), ('127.0.0.1', 502, 1)]) is not None
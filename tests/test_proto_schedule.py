@@ -0,0 +1,67 @@
+import pytest
+
+import proto_profile
+import proto_schedule
+
+
+TARGETS = [('10.10.10.1', 502, 1), ('10.10.10.2', 502, 1), ('fd00::1', 5020, 2)]
+
+
+@pytest.mark.parametrize('arrival', ['constant', 'poisson', 'bursty'])
+def test_schedule_round_trip(tmp_path, arrival):
+    schedule_file = str(tmp_path / 'schedule.bin')
+    traffic_profile = proto_profile.load_traffic_profile(seed=1)
+    num_records = proto_schedule.write_schedule(schedule_file, TARGETS, traffic_profile, 1000, arrival, 2.0, seed=5, num_payloads=16)
+    assert num_records > 0
+
+    schedule = proto_schedule.open_schedule(schedule_file)
+    try:
+        assert (schedule.seed, schedule.num_records, schedule.rate, schedule.duration) == (5, num_records, 1000, 2.0)
+        assert schedule.targets == TARGETS
+        requests = list(schedule.read_requests())
+    finally:
+        schedule.close()
+
+    assert len(requests) == num_records
+    offsets = [offset for offset, target_index, function_code, request in requests]
+    assert offsets == sorted(offsets)
+    assert 0 <= offsets[0] and offsets[-1] < 2.0
+    for offset, target_index, function_code, request in requests:
+        assert 0 <= target_index < len(TARGETS)
+        assert function_code in proto_profile.FUNCTION_CODE_WEIGHTS
+        address, count_or_values = request
+        group = traffic_profile.get_group(TARGETS[target_index][0])
+        low, high = group.addresses[function_code]
+        assert low <= address <= high
+        if function_code == 0x10:
+            assert len(count_or_values) % 2 == 0 and all(0 <= value <= 0xFFFF for value in count_or_values)
+        elif function_code == 0x0F:
+            assert all(value in (True, False) for value in count_or_values)
+        else:
+            assert group.counts[function_code][0] <= count_or_values <= group.counts[function_code][1]
+
+
+def test_schedule_seed_reproducible(tmp_path):
+    # the same seeds give the same schedule, the profile is loaded afresh as each run of the client does
+    contents = []
+    for name in ('first.bin', 'second.bin'):
+        schedule_file = tmp_path / name
+        traffic_profile = proto_profile.load_traffic_profile(seed=1)
+        proto_schedule.write_schedule(str(schedule_file), TARGETS, traffic_profile, 500, 'poisson', 1.0, seed=9, num_payloads=16)
+        contents.append(schedule_file.read_bytes())
+    assert contents[0] == contents[1]
+
+
+def test_schedule_truncated(tmp_path):
+    schedule_file = tmp_path / 'schedule.bin'
+    proto_schedule.write_schedule(str(schedule_file), TARGETS, proto_profile.load_traffic_profile(seed=1), 500, 'constant', 1.0, seed=3, num_payloads=16)
+    schedule_file.write_bytes(schedule_file.read_bytes()[:-1])
+    assert proto_schedule.open_schedule(str(schedule_file)) is None
+
+
+def test_schedule_hostname_target(tmp_path):
+    # schedules store IP endpoints, so a host name target is refused before anything is written
+    schedule_file = tmp_path / 'schedule.bin'
+    traffic_profile = proto_profile.load_traffic_profile(seed=1)
+    assert proto_schedule.write_schedule(str(schedule_file), [('localhost', 502, 1)], traffic_profile, 500, 'constant', 1.0, seed=3) == 0
+    assert not schedule_file.exists()